@@ -0,0 +1,355 @@
+"""
+Рассылки всем подписчикам бота.
+
+Подписчиком становится каждый, кто нажал /start в личном чате с ботом. Подписчики,
+рассылки и отметки о доставке хранятся в SQLite (``SubscriberStore``).
+
+``Broadcaster`` отправляет рассылку подписчикам по возрастанию ID:
+- сообщения идут через ``OutboundScheduler`` с приоритетом ``BULK``, поэтому ответы
+  обработчиков всегда выпускаются раньше, а рассылка получает оставшуюся часть лимита;
+- собственная скорость рассылки начинается с ``rate`` сообщений в секунду, при ответе
+  429 уменьшается вдвое и медленно растёт обратно после серии успешных отправок;
+- в окне ``window`` одновременно ожидают отправки не больше нескольких сообщений,
+  очередь планировщика не забивается;
+- каждая отправка сразу отмечается в базе, поэтому после падения или перезапуска
+  рассылка продолжается с неотправленных подписчиков (повторно может уйти не больше
+  сообщений, чем было в полёте в момент падения);
+- подписчики, заблокировавшие бота или удалившие аккаунт, помечаются и в следующие
+  рассылки не попадают, пока снова не нажмут /start;
+- сетевая ошибка (обрыв соединения, таймаут) повторяется несколько раз с паузой, после
+  чего отправка подписчику считается ошибкой; рассылка из-за неё не прерывается.
+
+Незавершённую рассылку продолжает тот процесс, который первым её захватил: захват
+продлевается на каждой странице подписчиков и истекает, если процесс остановился.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+
+from aiohttp import ClientError
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter,
+)
+
+from app.outbound import BULK, OutboundScheduler, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Статусы доставки
+SENT = 'sent'
+BLOCKED = 'blocked'
+FAILED = 'failed'
+
+# Ошибки соединения с Bot API: сессия aiogram оборачивает их в TelegramNetworkError,
+# но middleware сессии и другие сессии могут пропустить их как есть
+_NETWORK_ERRORS = (TelegramNetworkError, ClientError, asyncio.TimeoutError, OSError)
+
+
+class SubscriberStore:
+    """
+    Подписчики, рассылки и отметки о доставке в SQLite.
+
+    Args:
+        path (str): Путь к файлу базы.
+    """
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS subscribers '
+        '(chat_id INTEGER PRIMARY KEY, subscribed_at REAL NOT NULL, blocked INTEGER NOT NULL DEFAULT 0)',
+        'CREATE TABLE IF NOT EXISTS broadcasts '
+        '(id INTEGER PRIMARY KEY, text TEXT NOT NULL, created_at REAL NOT NULL, finished_at REAL, '
+        'owner TEXT, heartbeat REAL)',
+        'CREATE TABLE IF NOT EXISTS deliveries '
+        '(broadcast_id INTEGER, chat_id INTEGER, status TEXT NOT NULL, PRIMARY KEY (broadcast_id, chat_id))',
+    )
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in self._SCHEMA:
+            self._connection.execute(statement)
+        # Подписчики, уже записанные этим процессом: повторный /start не обращается к базе
+        self._known = set()
+
+    def add(self, chat_id: int):
+        """Записывает подписчика; заблокировавший бота подписчик снова получает рассылки."""
+        if chat_id in self._known:
+            return
+        self._connection.execute(
+            'INSERT INTO subscribers (chat_id, subscribed_at) VALUES (?, ?) '
+            'ON CONFLICT (chat_id) DO UPDATE SET blocked = 0 WHERE blocked = 1',
+            (chat_id, time.time())
+        )
+        self._known.add(chat_id)
+
+    def mark_blocked(self, chat_id: int):
+        """Исключает подписчика из рассылок до следующего /start."""
+        self._connection.execute('UPDATE subscribers SET blocked = 1 WHERE chat_id = ?', (chat_id,))
+        self._known.discard(chat_id)
+
+    def count(self) -> int:
+        """Возвращает число подписчиков, получающих рассылки."""
+        return self._connection.execute('SELECT COUNT(*) FROM subscribers WHERE blocked = 0').fetchone()[0]
+
+    def create(self, text: str) -> int:
+        """Создаёт рассылку и возвращает её ID."""
+        cursor = self._connection.execute(
+            'INSERT INTO broadcasts (text, created_at) VALUES (?, ?)', (text, time.time())
+        )
+        return cursor.lastrowid
+
+    def claim(self, broadcast_id: int, owner: str, lease: float) -> bool:
+        """
+        Захватывает или продлевает рассылку для процесса.
+
+        Args:
+            broadcast_id (int): ID рассылки.
+            owner (str): Идентификатор процесса.
+            lease (float): Через сколько секунд без продления захват истекает.
+
+        Returns:
+            bool: False, если рассылку ведёт другой процесс или она завершена.
+        """
+        now = time.time()
+        cursor = self._connection.execute(
+            'UPDATE broadcasts SET owner = ?, heartbeat = ? '
+            'WHERE id = ? AND finished_at IS NULL AND (owner IS NULL OR owner = ? OR heartbeat < ?)',
+            (owner, now, broadcast_id, owner, now - lease)
+        )
+        return cursor.rowcount == 1
+
+    def unfinished(self) -> list:
+        """Возвращает незавершённые рассылки: пары (ID, текст)."""
+        return self._connection.execute(
+            'SELECT id, text FROM broadcasts WHERE finished_at IS NULL ORDER BY id'
+        ).fetchall()
+
+    def pending(self, broadcast_id: int, after: int, limit: int) -> list:
+        """Возвращает ID чатов подписчиков после ``after``, которым рассылка ещё не отправлялась."""
+        rows = self._connection.execute(
+            'SELECT chat_id FROM subscribers s WHERE blocked = 0 AND chat_id > ? AND NOT EXISTS '
+            '(SELECT 1 FROM deliveries d WHERE d.broadcast_id = ? AND d.chat_id = s.chat_id) '
+            'ORDER BY chat_id LIMIT ?',
+            (after, broadcast_id, limit)
+        )
+        return [row[0] for row in rows]
+
+    def record(self, broadcast_id: int, chat_id: int, status: str):
+        """Отмечает результат отправки рассылки подписчику."""
+        self._connection.execute(
+            'INSERT OR REPLACE INTO deliveries (broadcast_id, chat_id, status) VALUES (?, ?, ?)',
+            (broadcast_id, chat_id, status)
+        )
+
+    def finish(self, broadcast_id: int) -> dict:
+        """
+        Отмечает рассылку завершённой.
+
+        Returns:
+            dict: Статус доставки -> число подписчиков.
+        """
+        self._connection.execute('UPDATE broadcasts SET finished_at = ? WHERE id = ?', (time.time(), broadcast_id))
+        return dict(self._connection.execute(
+            'SELECT status, COUNT(*) FROM deliveries WHERE broadcast_id = ? GROUP BY status', (broadcast_id,)
+        ).fetchall())
+
+    def close(self):
+        """Закрывает базу."""
+        self._connection.close()
+
+
+class Broadcaster:
+    """
+    Отправка рассылок с адаптивной скоростью и продолжением после перезапуска.
+
+    Args:
+        store (SubscriberStore): Подписчики и отметки о доставке.
+        rate (float): Начальная и наибольшая скорость рассылки, сообщений в секунду.
+        min_rate (float): Наименьшая скорость после ответов 429.
+        window (int): Сколько сообщений одновременно ожидают отправки.
+        throttled (Callable): Функция, возвращающая счётчик ответов 429 (``OutboundScheduler.retries``);
+            его рост во время отправки тоже замедляет рассылку.
+        page (int): Сколько подписчиков читать из базы за раз.
+        lease (float): Через сколько секунд без продления рассылку может продолжить другой процесс.
+        network_retries (int): Сколько раз повторять отправку подписчику после сетевой ошибки.
+        retry_delay (float): Пауза перед первым повтором после сетевой ошибки, в секундах; удваивается.
+    """
+
+    def __init__(self, store: SubscriberStore, rate: float = 25.0, min_rate: float = 1.0, window: int = 20,
+                 throttled=lambda: 0, page: int = 500, lease: float = 120.0, network_retries: int = 3,
+                 retry_delay: float = 1.0):
+        self.store = store
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.window = window
+        self.throttled = throttled
+        self.page = page
+        self.lease = lease
+        self.network_retries = network_retries
+        self.retry_delay = retry_delay
+        self.sent = 0
+        self.blocked = 0
+        self.failed = 0
+        self.slowdowns = 0
+        self._owner = f'{os.getpid()}-{id(self)}'
+        self._bucket = TokenBucket(rate, 1.0, time.monotonic())
+        self._streak = 0
+        self._throttled = throttled()
+        self._tasks = {}
+
+    @property
+    def rate(self) -> float:
+        """Текущая скорость рассылки, сообщений в секунду."""
+        return self._bucket.rate
+
+    def start(self, bot, broadcast_id: int, text: str, notify: int = None):
+        """
+        Запускает отправку рассылки в фоне.
+
+        Args:
+            bot (Bot): Бот.
+            broadcast_id (int): ID рассылки из ``SubscriberStore.create``.
+            text (str): Текст рассылки.
+            notify (int): Чат, в который отправить итог рассылки.
+        """
+        if broadcast_id not in self._tasks:
+            task = asyncio.create_task(self._run(bot, broadcast_id, text, notify))
+            self._tasks[broadcast_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    def resume(self, bot):
+        """Продолжает незавершённые рассылки, например после перезапуска."""
+        for broadcast_id, text in self.store.unfinished():
+            self.start(bot, broadcast_id, text)
+
+    async def stop(self):
+        """Прерывает рассылки; отправленное отмечено в базе, остальное будет отправлено после запуска."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, bot, broadcast_id: int, text: str, notify: int):
+        store = self.store
+        if not store.claim(broadcast_id, self._owner, self.lease):
+            return
+        logger.info('Рассылка %s: отправка', broadcast_id)
+        slots = asyncio.Semaphore(self.window)
+        sending = set()
+        after = 0
+        try:
+            while True:
+                chat_ids = store.pending(broadcast_id, after, self.page)
+                if not chat_ids:
+                    break
+                for chat_id in chat_ids:
+                    await slots.acquire()
+                    task = asyncio.create_task(self._send(bot, broadcast_id, chat_id, text))
+                    sending.add(task)
+                    task.add_done_callback(sending.discard)
+                    task.add_done_callback(lambda _: slots.release())
+                after = chat_ids[-1]
+                if not store.claim(broadcast_id, self._owner, self.lease):
+                    logger.warning('Рассылку %s продолжил другой процесс', broadcast_id)
+                    return
+            await asyncio.gather(*sending)
+        finally:
+            # При остановке сообщения в очереди не отправляются; их подписчики получат рассылку после запуска
+            for task in list(sending):
+                task.cancel()
+            await asyncio.gather(*sending, return_exceptions=True)
+        totals = store.finish(broadcast_id)
+        logger.info('Рассылка %s завершена: %s', broadcast_id, totals)
+        if notify is not None:
+            try:
+                await bot.send_message(
+                    notify,
+                    f'Рассылка {broadcast_id} завершена: отправлено {totals.get(SENT, 0)}, '
+                    f'заблокировали бота {totals.get(BLOCKED, 0)}, ошибок {totals.get(FAILED, 0)}.'
+                )
+            except (TelegramAPIError, *_NETWORK_ERRORS) as error:
+                logger.warning('Итог рассылки %s не отправлен: %s', broadcast_id, error)
+
+    async def _pace(self):
+        bucket = self._bucket
+        while True:
+            delay = bucket.delay(time.monotonic())
+            if not delay:
+                bucket.take()
+                return
+            await asyncio.sleep(delay)
+
+    def _slow_down(self, now: float, retry_after: float = 0.0):
+        self._streak = 0
+        self.slowdowns += 1
+        self._bucket.rate = max(self.min_rate, self._bucket.rate / 2)
+        if retry_after:
+            self._bucket.pause(now, retry_after)
+
+    def _speed_up(self):
+        self._streak += 1
+        if self._streak >= 50 and self._bucket.rate < self.max_rate:
+            self._streak = 0
+            self._bucket.rate = min(self.max_rate, self._bucket.rate + 1)
+
+    async def _send(self, bot, broadcast_id: int, chat_id: int, text: str):
+        attempt = 0
+        while True:
+            await self._pace()
+            try:
+                with OutboundScheduler.priority(BULK):
+                    await bot.send_message(chat_id, text)
+            except TelegramRetryAfter as error:
+                # Планировщик исчерпал повторы (или не запущен) — ждём и пробуем снова медленнее
+                self._slow_down(time.monotonic(), error.retry_after)
+                continue
+            except TelegramForbiddenError:
+                status = BLOCKED
+            except TelegramBadRequest as error:
+                status = BLOCKED if 'chat not found' in error.message else FAILED
+            except _NETWORK_ERRORS as error:
+                if attempt < self.network_retries:
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+                    attempt += 1
+                    continue
+                logger.warning('Рассылка %s: не отправлено в чат %s после %s повторов: %r',
+                               broadcast_id, chat_id, attempt, error)
+                status = FAILED
+            except TelegramAPIError as error:
+                logger.warning('Рассылка %s: не отправлено в чат %s: %s', broadcast_id, chat_id, error)
+                status = FAILED
+            except Exception:
+                # Ошибка одного подписчика не должна останавливать рассылку и оставлять её захваченной
+                logger.exception('Рассылка %s: ошибка при отправке в чат %s', broadcast_id, chat_id)
+                status = FAILED
+            else:
+                status = SENT
+            break
+        throttled = self.throttled()
+        if throttled > self._throttled:
+            # Ответ 429 на любой запрос бота (повторённый планировщиком) — замедляемся один раз на каждый
+            self._throttled = throttled
+            self._slow_down(time.monotonic())
+        elif status == SENT:
+            self._speed_up()
+        if status == BLOCKED:
+            self.store.mark_blocked(chat_id)
+            self.blocked += 1
+        elif status == FAILED:
+            self.failed += 1
+        else:
+            self.sent += 1
+        self.store.record(broadcast_id, chat_id, status)
+
+    def metrics(self):
+        """Показатели рассылок для ``HandlerMetrics.add_collector``."""
+        yield 'broadcast_active', len(self._tasks)
+        yield 'broadcast_rate', round(self.rate, 2)
+        yield 'broadcast_sent_total', self.sent
+        yield 'broadcast_blocked_total', self.blocked
+        yield 'broadcast_failed_total', self.failed
+        yield 'broadcast_slowdowns_total', self.slowdowns
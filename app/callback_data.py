@@ -0,0 +1,91 @@
+"""
+Компактная кодировка callback_data.
+
+Значение состоит из однобайтового кода действия и идентификатора товара или раздела
+в системе счисления по основанию 36, например ``*1f`` — добавить в корзину товар №51.
+Так callback_data не зависит от названий (подчёркивания, слэши, кириллица) и укладывается
+в ограничение Telegram в 64 байта при любом размере каталога.
+
+Коды действий — знаки пунктуации, поэтому они не пересекаются со старыми значениями
+вида ``selected_...``, ``edit_...``, ``pay_cart``, которые начинаются с букв.
+"""
+
+SELECT = '*'  # добавить товар в корзину
+EDIT = '='  # открыть изменение количества товара
+INCREASE = '+'  # увеличить количество
+DECREASE = '-'  # уменьшить количество
+SECTION = '>'  # открыть раздел меню
+
+ACTIONS = frozenset((SELECT, EDIT, INCREASE, DECREASE, SECTION))
+
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def encode_id(item_id: int) -> str:
+    """
+    Переводит идентификатор в строку по основанию 36.
+
+    Args:
+        item_id (int): Неотрицательный идентификатор.
+
+    Returns:
+        str: Идентификатор в base36.
+    """
+    if item_id < 0:
+        raise ValueError('Идентификатор не может быть отрицательным')
+    if item_id < 36:
+        return _DIGITS[item_id]
+    digits = []
+    while item_id:
+        item_id, rest = divmod(item_id, 36)
+        digits.append(_DIGITS[rest])
+    return ''.join(reversed(digits))
+
+
+def decode_id(value: str):
+    """
+    Переводит строку base36 обратно в идентификатор.
+
+    Args:
+        value (str): Идентификатор в base36.
+
+    Returns:
+        int | None: Идентификатор или None, если строка некорректна.
+    """
+    if not value or not value.isalnum() or not value.isascii():
+        return None
+    return int(value, 36)
+
+
+def pack(action: str, item_id: int) -> str:
+    """
+    Собирает callback_data из кода действия и идентификатора.
+
+    Args:
+        action (str): Код действия (SELECT, EDIT, INCREASE, DECREASE, SECTION).
+        item_id (int): Идентификатор товара или раздела.
+
+    Returns:
+        str: Значение callback_data.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f'Неизвестный код действия {action!r}')
+    return action + encode_id(item_id)
+
+
+def unpack(data: str):
+    """
+    Разбирает callback_data в компактном формате.
+
+    Args:
+        data (str): Значение callback_data.
+
+    Returns:
+        tuple | None: Пара (код действия, идентификатор) или None для других форматов.
+    """
+    if not data or data[0] not in ACTIONS:
+        return None
+    item_id = decode_id(data[1:])
+    if item_id is None:
+        return None
+    return data[0], item_id
@@ -0,0 +1,168 @@
+"""
+Очистка брошенных корзин.
+
+``CartExpiry`` держит для каждой непустой корзины один таймер в ``TimerWheel``.
+``Cart`` переставляет таймер при каждом изменении или показе корзины (O(1)), а фоновая
+задача раз в тик снимает с колеса только сработавшие таймеры, без просмотра всех корзин.
+
+Если задано ``remind_before``, за столько секунд до очистки пользователю отправляется
+напоминание о корзине; если он после этого ничего не делает, корзина очищается.
+Напоминания и очистка выполняются в отдельных задачах (одновременно отправляется
+не больше ``concurrency`` напоминаний), поэтому медленная отправка или ожидание
+блокировки пользователя не задерживают остальные таймеры.
+Таймеры живут в памяти процесса: корзины из SQLite, сохранившиеся с прошлого запуска,
+получают таймер при первом обращении к ним.
+"""
+
+import asyncio
+import logging
+import time
+
+from app.timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+# Фазы таймера корзины
+REMIND = 0
+EXPIRE = 1
+
+
+class CartExpiry:
+    """
+    Таймеры простоя корзин.
+
+    Args:
+        cart (Cart): Сервис корзины.
+        ttl (float): Через сколько секунд без действий корзина очищается.
+        remind_before (float): За сколько секунд до очистки напомнить о корзине; 0 — не напоминать.
+        remind (Callable): Корутина ``remind(bot, user_id)``, отправляющая напоминание.
+        locks (UserLocks): Блокировки пользователей; очистка не пересекается с обработкой их обновлений.
+        tick (float): Точность таймеров, в секундах.
+        concurrency (int): Сколько напоминаний отправлять одновременно.
+    """
+
+    def __init__(self, cart, ttl: float, remind_before: float = 0, remind=None, locks=None, tick: float = 1.0,
+                 concurrency: int = 32):
+        if remind is None or not 0 < remind_before < ttl:
+            remind_before = 0
+        self.cart = cart
+        self.ttl = ttl
+        self.remind_before = remind_before
+        self.remind = remind
+        self.locks = locks
+        self.evicted = 0
+        self.reminded = 0
+        self.remind_errors = 0
+        self._wheel = TimerWheel(time.monotonic(), tick)
+        if ttl / tick > self._wheel.horizon:
+            raise ValueError(f'TTL корзины больше {self._wheel.horizon * tick} с не поддерживается')
+        self._phase = {}
+        # Пользователи, которым сейчас отправляется напоминание
+        self._reminding = set()
+        self._sending = asyncio.Semaphore(concurrency)
+        self._jobs = set()
+        self._task = None
+        self._bot = None
+
+    def __len__(self):
+        return len(self._phase)
+
+    def touch(self, user_id: int):
+        """Откладывает очистку корзины пользователя на ``ttl`` секунд от текущего момента."""
+        if user_id in self._reminding:
+            # Показ корзины в самом напоминании не считается действием пользователя
+            return
+        now = time.monotonic()
+        if self.remind_before:
+            self._phase[user_id] = REMIND
+            self._wheel.schedule(user_id, now + self.ttl - self.remind_before)
+        else:
+            self._phase[user_id] = EXPIRE
+            self._wheel.schedule(user_id, now + self.ttl)
+
+    def forget(self, user_id: int):
+        """Снимает таймер корзины, например после оплаты или очистки."""
+        if self._phase.pop(user_id, None) is not None:
+            self._wheel.cancel(user_id)
+
+    def start(self, bot=None):
+        """
+        Запускает фоновую очистку.
+
+        Args:
+            bot (Bot): Бот для отправки напоминаний.
+        """
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую очистку и прерывает неотправленные напоминания."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+
+    def _spawn(self, job):
+        task = asyncio.create_task(job)
+        self._jobs.add(task)
+        task.add_done_callback(self._jobs.discard)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._wheel.tick)
+            for user_id in self._wheel.advance(time.monotonic()):
+                phase = self._phase.pop(user_id, None)
+                if phase == REMIND:
+                    # Таймер очистки ставится сразу: через remind_before секунд, если пользователь не вернётся
+                    self._phase[user_id] = EXPIRE
+                    self._wheel.schedule(user_id, time.monotonic() + self.remind_before)
+                    self._spawn(self._remind(user_id))
+                elif phase == EXPIRE:
+                    self._spawn(self._expire(user_id))
+
+    async def _remind(self, user_id: int):
+        async with self._sending:
+            # Пока напоминание ждало очереди, пользователь мог вернуться к корзине или очистить её
+            if self._phase.get(user_id) != EXPIRE:
+                return
+            self._reminding.add(user_id)
+            try:
+                await self.remind(self._bot, user_id)
+            except Exception as error:
+                # Например, пользователь заблокировал бота — корзина всё равно будет очищена
+                self.remind_errors += 1
+                logger.info('Напоминание о корзине пользователю %s не отправлено: %s', user_id, error)
+            else:
+                self.reminded += 1
+            finally:
+                self._reminding.discard(user_id)
+
+    async def _expire(self, user_id: int):
+        try:
+            if self.locks is None:
+                self.cart.clear(user_id)
+            else:
+                async with self.locks.hold(user_id):
+                    # Пока ждали блокировку, пользователь мог снова изменить корзину
+                    if user_id in self._phase:
+                        return
+                    self.cart.clear(user_id)
+        except Exception:
+            logger.exception('Ошибка при очистке корзины пользователя %s', user_id)
+            return
+        self.evicted += 1
+
+    def metrics(self):
+        """Показатели очистки для ``HandlerMetrics.add_collector``."""
+        yield 'cart_expiry_tracked', len(self._phase)
+        yield 'cart_expiry_evicted_total', self.evicted
+        yield 'cart_expiry_reminded_total', self.reminded
+        yield 'cart_expiry_remind_errors_total', self.remind_errors
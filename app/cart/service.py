@@ -0,0 +1,213 @@
+"""
+Сервис корзины покупок.
+
+Объект ``Cart`` предоставляет обработчикам прежний набор операций (``add``, ``edit_quantity``,
+``clear``, ``show``, ``get_total_price``, ``user_carts``) и строки заказа для оплаты
+(``order_lines``), а сами корзины хранит в подключаемом хранилище из ``app.cart.storage``.
+
+Для показа и оплаты корзины ``Cart`` держит представление каждой недавно использованной
+корзины: готовые строку текста и строку заказа (``OrderLine``) на каждый товар, общую
+стоимость и весь текст корзины. ``add``/``edit_quantity`` обновляют только изменённую
+строку и сумму, поэтому показ и оплата корзины не пересчитывают все её строки.
+
+Если подключён ``expiry`` (``app.cart.expiry.CartExpiry``), изменение и показ непустой
+корзины откладывают её очистку, а очистка корзины снимает таймер.
+"""
+
+from collections import OrderedDict
+
+from app.cart.storage import CartStorage
+from app.orders import OrderLine
+
+
+def _render_line(product: str, quantity: int, price: int) -> str:
+    return f'- {product}: {quantity} шт. x {price} руб = {quantity * price} руб'
+
+
+class _CartView:
+    """Строки текста и строки заказа корзины, её общая стоимость и готовый текст (None — собрать заново)."""
+
+    __slots__ = ('lines', 'order_lines', 'total', 'text')
+
+    def __init__(self, lines: dict, order_lines: dict, total: int):
+        self.lines = lines
+        self.order_lines = order_lines
+        self.total = total
+        self.text = None
+
+
+class _CartsView:
+    """Доступ к корзинам в стиле словаря ``user_carts`` только для чтения."""
+
+    def __init__(self, storage: CartStorage):
+        self._storage = storage
+
+    def get(self, user_id: int, default=None):
+        lines = self._storage.get(user_id)
+        return default if lines is None else lines
+
+    def __getitem__(self, user_id: int):
+        lines = self._storage.get(user_id)
+        if lines is None:
+            raise KeyError(user_id)
+        return lines
+
+    def __contains__(self, user_id: int):
+        return self._storage.get(user_id) is not None
+
+
+class Cart:
+    """
+    Корзины пользователей поверх хранилища.
+
+    Args:
+        storage (CartStorage): Хранилище корзин.
+        cache_size (int): Для скольких корзин держать готовые строки текста и сумму.
+    """
+
+    def __init__(self, storage: CartStorage, cache_size: int = 10000):
+        self.storage = storage
+        self.user_carts = _CartsView(storage)
+        self.cache_size = cache_size
+        self._views = OrderedDict()
+        # Таймеры простоя корзин (CartExpiry); None — корзины не очищаются
+        self.expiry = None
+
+    def _touch(self, user_id: int, view: _CartView):
+        if self.expiry is not None:
+            if view.lines:
+                self.expiry.touch(user_id)
+            else:
+                self.expiry.forget(user_id)
+
+    def _view(self, user_id: int) -> _CartView:
+        view = self._views.get(user_id)
+        if view is not None:
+            self._views.move_to_end(user_id)
+            return view
+        # Корзина давно не показывалась — собираем представление один раз
+        lines = self.get(user_id)
+        view = _CartView(
+            {product: _render_line(product, info['quantity'], info['price']) for product, info in lines.items()},
+            {product: OrderLine(product, info['quantity'], info['price']) for product, info in lines.items()},
+            sum(info['quantity'] * info['price'] for info in lines.values())
+        )
+        self._views[user_id] = view
+        if len(self._views) > self.cache_size:
+            self._views.popitem(last=False)
+        return view
+
+    @staticmethod
+    def _update_view(view: _CartView, product: str, line, quantity: int, price: int):
+        # Сумма меняется на разницу стоимости строки, остальные строки не трогаем
+        if line is not None:
+            view.total -= line['quantity'] * line['price']
+        if quantity > 0:
+            view.total += quantity * price
+            view.lines[product] = _render_line(product, quantity, price)
+            view.order_lines[product] = OrderLine(product, quantity, price)
+        else:
+            view.lines.pop(product, None)
+            view.order_lines.pop(product, None)
+        view.text = None
+
+    def get(self, user_id: int) -> dict:
+        """
+        Возвращает содержимое корзины пользователя.
+
+        Args:
+            user_id (int): ID пользователя.
+
+        Returns:
+            dict: Название товара -> {'quantity': ..., 'price': ...}. Пустой словарь, если корзина пуста.
+        """
+        return self.storage.get(user_id) or {}
+
+    def add(self, user_id: int, product: str, price: int):
+        """
+        Добавляет одну единицу товара в корзину.
+
+        Args:
+            user_id (int): ID пользователя.
+            product (str): Название товара.
+            price (int): Цена товара.
+        """
+        line = self.get(user_id).get(product)
+        quantity = line['quantity'] + 1 if line else 1
+        # Представление собирается до изменения хранилища, иначе строка учлась бы дважды
+        view = self._view(user_id)
+        self.storage.set_line(user_id, product, quantity, price)
+        self._update_view(view, product, line, quantity, price)
+        self._touch(user_id, view)
+
+    def edit_quantity(self, user_id: int, product: str, change: int):
+        """
+        Изменяет количество товара в корзине. Товар с нулевым количеством удаляется.
+
+        Args:
+            user_id (int): ID пользователя.
+            product (str): Название товара.
+            change (int): На сколько изменить количество.
+        """
+        line = self.get(user_id).get(product)
+        if line is None:
+            return
+        quantity = line['quantity'] + change
+        view = self._view(user_id)
+        if quantity > 0:
+            self.storage.set_line(user_id, product, quantity, line['price'])
+        else:
+            self.storage.delete_line(user_id, product)
+        self._update_view(view, product, line, quantity, line['price'])
+        self._touch(user_id, view)
+
+    def invalidate(self, *_):
+        """Сбрасывает готовые строки и суммы, например после перезагрузки каталога с новыми ценами."""
+        self._views = OrderedDict()
+
+    def clear(self, user_id: int):
+        """Очищает корзину пользователя."""
+        self.storage.delete(user_id)
+        self._views.pop(user_id, None)
+        if self.expiry is not None:
+            self.expiry.forget(user_id)
+
+    def get_total_price(self, user_id: int) -> int:
+        """Возвращает общую стоимость корзины."""
+        return self._view(user_id).total
+
+    def order_lines(self, user_id: int) -> tuple:
+        """
+        Возвращает готовые строки заказа для оплаты корзины.
+
+        Args:
+            user_id (int): ID пользователя.
+
+        Returns:
+            tuple: Строки заказа (``OrderLine``) в порядке добавления товаров.
+        """
+        return tuple(self._view(user_id).order_lines.values())
+
+    def show(self, user_id: int) -> str:
+        """
+        Формирует текст с содержимым корзины.
+
+        Args:
+            user_id (int): ID пользователя.
+
+        Returns:
+            str: Список товаров с количеством и суммой или сообщение о пустой корзине.
+        """
+        view = self._view(user_id)
+        self._touch(user_id, view)
+        if view.text is None:
+            if view.lines:
+                items = '\n'.join(view.lines.values())
+                view.text = f'Ваша корзина:\n{items}\nОбщая стоимость: {view.total} руб'
+            else:
+                view.text = 'Ваша корзина пуста.'
+        return view.text
+
+    def close(self):
+        """Сохраняет несохранённые изменения хранилища."""
+        self.storage.close()
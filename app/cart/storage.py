@@ -0,0 +1,389 @@
+"""
+Хранилища корзин.
+
+Корзина пользователя — словарь ``{название товара: {'quantity': ..., 'price': ...}}``.
+Сервис корзины (``app.cart.service.Cart``) работает с ним только через интерфейс
+``CartStorage``, поэтому хранилище можно заменить без изменений в обработчиках:
+- ``MemoryCartStorage`` держит корзины в словаре процесса;
+- ``CompactCartStorage`` держит корзины в памяти процесса компактно: по два массива
+  (ID товаров и количества) на корзину, цены и названия берутся из каталога;
+- ``SQLiteCartStorage`` сохраняет корзины в SQLite в режиме WAL, чтобы они переживали
+  перезапуск. Чтение идёт из кэша горячих корзин, запись — в фоновом потоке пачками.
+"""
+
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+
+class CartStorage(ABC):
+    """
+    Интерфейс хранилища корзин.
+
+    Методы вызываются из цикла событий и не должны ждать диска дольше, чем чтение
+    небольшого файла. Возвращаемые ``get`` словари нельзя изменять напрямую —
+    только через ``set_line``, ``delete_line`` и ``delete``.
+    """
+
+    @abstractmethod
+    def get(self, user_id: int):
+        """
+        Возвращает корзину пользователя.
+
+        Args:
+            user_id (int): ID пользователя.
+
+        Returns:
+            dict | None: Корзина или None, если корзины нет: пользователь ещё ничего
+                не добавлял или корзина удалена через ``delete``.
+        """
+
+    @abstractmethod
+    def set_line(self, user_id: int, product: str, quantity: int, price: int):
+        """Создаёт или обновляет строку корзины."""
+
+    @abstractmethod
+    def delete_line(self, user_id: int, product: str):
+        """Удаляет строку корзины. Пустая корзина остаётся у пользователя."""
+
+    @abstractmethod
+    def delete(self, user_id: int):
+        """Удаляет корзину пользователя целиком."""
+
+    def close(self):
+        """Сохраняет несохранённые изменения и освобождает ресурсы."""
+
+
+class MemoryCartStorage(CartStorage):
+    """Хранилище корзин в памяти процесса. Корзины теряются при перезапуске."""
+
+    def __init__(self):
+        self.carts = {}
+
+    def get(self, user_id: int):
+        return self.carts.get(user_id)
+
+    def set_line(self, user_id: int, product: str, quantity: int, price: int):
+        self.carts.setdefault(user_id, {})[product] = {'quantity': quantity, 'price': price}
+
+    def delete_line(self, user_id: int, product: str):
+        lines = self.carts.get(user_id)
+        if lines is not None:
+            lines.pop(product, None)
+
+    def delete(self, user_id: int):
+        self.carts.pop(user_id, None)
+
+
+class CompactCart:
+    """
+    Корзина в виде параллельных массивов ID товаров и количеств.
+
+    Строка корзины занимает 8 байт вместо двух словарей и строки с названием.
+    Корзины короткие, поэтому поиск строки — линейный проход по массиву.
+    """
+
+    __slots__ = ('ids', 'quantities')
+
+    def __init__(self):
+        self.ids = array('I')
+        self.quantities = array('I')
+
+    def set(self, product_id: int, quantity: int):
+        try:
+            self.quantities[self.ids.index(product_id)] = quantity
+        except ValueError:
+            self.ids.append(product_id)
+            self.quantities.append(quantity)
+
+    def remove(self, product_id: int) -> bool:
+        try:
+            index = self.ids.index(product_id)
+        except ValueError:
+            return False
+        del self.ids[index]
+        del self.quantities[index]
+        return True
+
+
+class CompactCartLines(Mapping):
+    """
+    Корзина ``CompactCart`` в виде словаря ``{название: {'quantity': ..., 'price': ...}}``.
+
+    Строки собираются при обращении по текущему снимку каталога. Товары, которых
+    больше нет в каталоге, в корзине не видны.
+    """
+
+    __slots__ = ('_cart', '_catalog')
+
+    def __init__(self, cart: CompactCart, catalog):
+        self._cart = cart
+        self._catalog = catalog
+
+    def _records(self):
+        products = self._catalog.snapshot.products
+        for product_id, quantity in zip(self._cart.ids, self._cart.quantities):
+            record = products.get(product_id)
+            if record is not None:
+                yield record, quantity
+
+    def __getitem__(self, product: str):
+        record = self._catalog.snapshot.products_by_name.get(product)
+        if record is not None:
+            try:
+                index = self._cart.ids.index(record.id)
+            except ValueError:
+                pass
+            else:
+                return {'quantity': self._cart.quantities[index], 'price': record.price}
+        raise KeyError(product)
+
+    def __iter__(self):
+        return (record.name for record, _ in self._records())
+
+    def __len__(self):
+        return sum(1 for _ in self._records())
+
+    def items(self):
+        return [(record.name, {'quantity': quantity, 'price': record.price}) for record, quantity in self._records()]
+
+    def values(self):
+        return [{'quantity': quantity, 'price': record.price} for record, quantity in self._records()]
+
+
+class CompactCartStorage(CartStorage):
+    """
+    Компактное хранилище корзин в памяти процесса. Корзины теряются при перезапуске.
+
+    Хранит только ID товаров и количества; цена и название строки берутся из каталога,
+    поэтому после перезагрузки меню корзины показывают новые цены. Переданная в
+    ``set_line`` цена не сохраняется.
+
+    Args:
+        catalog (Catalog): Каталог, по которому ищутся товары.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.carts = {}
+
+    def get(self, user_id: int):
+        cart = self.carts.get(user_id)
+        return None if cart is None else CompactCartLines(cart, self.catalog)
+
+    def _product_id(self, product: str) -> int:
+        record = self.catalog.snapshot.products_by_name.get(product)
+        if record is None:
+            raise ValueError(f'Товара {product!r} нет в каталоге')
+        return record.id
+
+    def set_line(self, user_id: int, product: str, quantity: int, price: int):
+        cart = self.carts.get(user_id)
+        if cart is None:
+            cart = self.carts[user_id] = CompactCart()
+        cart.set(self._product_id(product), quantity)
+
+    def delete_line(self, user_id: int, product: str):
+        cart = self.carts.get(user_id)
+        record = self.catalog.snapshot.products_by_name.get(product)
+        if cart is not None and record is not None:
+            cart.remove(record.id)
+
+    def delete(self, user_id: int):
+        self.carts.pop(user_id, None)
+
+
+class SQLiteCartStorage(CartStorage):
+    """
+    Хранилище корзин в SQLite (WAL) с отложенной пакетной записью.
+
+    - Запись: изменение сразу применяется к корзине в кэше и ставится в очередь.
+      Фоновый поток раз в ``flush_interval`` секунд (или при накоплении ``batch_size``
+      изменений) записывает очередь одной транзакцией.
+    - Чтение: корзина берётся из кэша, при промахе читается из базы и кэшируется
+      (отсутствие корзины тоже). Корзины с незаписанными изменениями из кэша не
+      вытесняются, поэтому чтение из базы всегда видит актуальное состояние.
+      Чтение при промахе синхронное и выполняется в цикле событий: это поиск
+      по первичному ключу, а в режиме WAL чтение не ждёт фоновую запись. Зато
+      ``get`` и изменения корзины обходятся без ``await`` и остаются атомарными
+      для обработчиков.
+    - Строки в базе есть только у непустых корзин, поэтому корзина, опустевшая
+      через ``delete_line``, после вытеснения из кэша читается как отсутствующая.
+    - Запросы — постоянные строки с параметрами, sqlite3 держит их подготовленными
+      в кэше выражений соединения.
+
+    Кэш принадлежит процессу, поэтому один пользователь должен обслуживаться одним
+    процессом (см. распределение обновлений по ``user_id``).
+    """
+
+    _SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS cart_lines (
+            user_id INTEGER NOT NULL,
+            product TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            price INTEGER NOT NULL,
+            PRIMARY KEY (user_id, product)
+        ) WITHOUT ROWID
+    '''
+    _SELECT = 'SELECT product, quantity, price FROM cart_lines WHERE user_id = ?'
+    _UPSERT = '''
+        INSERT INTO cart_lines (user_id, product, quantity, price) VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, product) DO UPDATE SET quantity = excluded.quantity, price = excluded.price
+    '''
+    _DELETE_LINE = 'DELETE FROM cart_lines WHERE user_id = ? AND product = ?'
+    _DELETE_CART = 'DELETE FROM cart_lines WHERE user_id = ?'
+
+    def __init__(self, path: str, cache_size: int = 10000, flush_interval: float = 0.05,
+                 batch_size: int = 500):
+        """
+        Args:
+            path (str): Путь к файлу базы.
+            cache_size (int): Сколько корзин держать в кэше.
+            flush_interval (float): Максимальная задержка записи изменений, в секундах.
+            batch_size (int): Размер очереди, при котором запись начинается сразу.
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._reader = self._connect()
+        self._reader.execute(self._SCHEMA)
+        self._reader.commit()
+
+        self._cache = OrderedDict()
+        self._pending = []
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._writer_thread = threading.Thread(target=self._write_loop, name='cart-writer', daemon=True)
+        self._writer_thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def get(self, user_id: int):
+        try:
+            lines = self._cache[user_id]
+        except KeyError:
+            rows = self._reader.execute(self._SELECT, (user_id,)).fetchall()
+            # None в кэше — корзины нет
+            lines = {product: {'quantity': quantity, 'price': price} for product, quantity, price in rows} or None
+            self._remember(user_id, lines)
+        else:
+            self._cache.move_to_end(user_id)
+        return lines
+
+    def set_line(self, user_id: int, product: str, quantity: int, price: int):
+        lines = self.get(user_id)
+        # Сначала помечаем корзину изменённой, чтобы её нельзя было вытеснить из кэша
+        self._enqueue(user_id, self._UPSERT, (user_id, product, quantity, price))
+        if lines is None:
+            lines = {}
+            self._remember(user_id, lines)
+        lines[product] = {'quantity': quantity, 'price': price}
+
+    def delete_line(self, user_id: int, product: str):
+        lines = self.get(user_id)
+        if lines is not None and lines.pop(product, None) is not None:
+            self._enqueue(user_id, self._DELETE_LINE, (user_id, product))
+
+    def delete(self, user_id: int):
+        self._enqueue(user_id, self._DELETE_CART, (user_id,))
+        # Отсутствие корзины остаётся в кэше, пока удаление не записано в базу
+        self._remember(user_id, None)
+
+    def _remember(self, user_id: int, lines: dict):
+        self._cache[user_id] = lines
+        if len(self._cache) <= self.cache_size:
+            return
+        # Вытесняем самые давние корзины без незаписанных изменений
+        excess = len(self._cache) - self.cache_size
+        victims = []
+        with self._lock:
+            for candidate in self._cache:
+                if candidate not in self._dirty:
+                    victims.append(candidate)
+                    if len(victims) == excess:
+                        break
+        for candidate in victims:
+            del self._cache[candidate]
+
+    def _enqueue(self, user_id: int, statement: str, params: tuple):
+        with self._lock:
+            self._pending.append((user_id, statement, params))
+            self._dirty[user_id] = self._dirty.get(user_id, 0) + 1
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _write_loop(self):
+        writer = self._connect()
+        try:
+            while not self._stopped:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                self._flush(writer)
+            self._flush(writer)
+        finally:
+            writer.close()
+
+    def _flush(self, writer):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            with writer:
+                for _, statement, params in batch:
+                    writer.execute(statement, params)
+        except sqlite3.Error:
+            logger.exception('Не удалось записать %s изменений корзин, повтор при следующей записи', len(batch))
+            with self._lock:
+                self._pending[:0] = batch
+            return
+        with self._lock:
+            for user_id, _, _ in batch:
+                left = self._dirty[user_id] - 1
+                if left:
+                    self._dirty[user_id] = left
+                else:
+                    del self._dirty[user_id]
+
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        self._writer_thread.join()
+        self._reader.close()
+
+
+def create_storage(url: str, catalog=None) -> CartStorage:
+    """
+    Создаёт хранилище корзин по строке настройки.
+
+    Args:
+        url (str): ``memory``, ``compact`` или ``sqlite:///путь/к/файлу``.
+        catalog (Catalog): Каталог; нужен для ``compact``.
+
+    Returns:
+        CartStorage: Хранилище корзин.
+    """
+    if url == 'memory':
+        return MemoryCartStorage()
+    if url == 'compact':
+        if catalog is None:
+            raise ValueError('Для компактного хранилища корзин нужен каталог')
+        return CompactCartStorage(catalog)
+    if url.startswith('sqlite:///'):
+        return SQLiteCartStorage(url[len('sqlite:///'):])
+    raise ValueError(f'Неизвестное хранилище корзин: {url!r}')
@@ -0,0 +1,354 @@
+"""
+Каталог меню: загрузка из файла, неизменяемый снимок и горячая перезагрузка.
+
+Меню (разделы, товары, цены, описания) хранится в одном файле ``menu.json``. При загрузке
+из него собирается снимок ``CatalogSnapshot``: записи о товарах и разделах, готовые тексты
+и клавиатуры разделов, а также таблица старых значений callback_data. Снимок после сборки
+не изменяется.
+
+При изменении файла собирается новый снимок и одной операцией присваивания заменяет
+старый, поэтому обработчики читают каталог без блокировок и без перезапуска бота.
+Если новый файл содержит ошибку, в работе остаётся предыдущий снимок.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+import app.menu_keyboard as menu_kb
+from app.callback_data import pack, SELECT, EDIT, INCREASE, DECREASE, SECTION
+
+DEFAULT_PATH = Path(__file__).with_name('menu.json')
+# Корневой экран "Выбор раздела" показывает обработчик меню, а не каталог
+ROOT_SECTION_ID = 0
+
+logger = logging.getLogger(__name__)
+
+
+class ProductRecord(NamedTuple):
+    """
+    Запись о товаре в каталоге.
+
+    Attributes:
+        id (int): Компактный идентификатор товара для callback_data.
+        name (str): Название товара.
+        price (int): Цена в рублях.
+        section (str): Раздел меню, в котором находится товар.
+        description (str): Описание товара.
+        portion (str): Объём порции.
+        components (tuple): Состав комплексного обеда: пары (название блюда, порция).
+        prep_time (float): Время приготовления порции в секундах; 0 — по умолчанию для станции кухни.
+        photo (str): Путь к фото товара относительно файла меню; пустая строка — без фото.
+    """
+    id: int
+    name: str
+    price: int
+    section: str
+    description: str = ''
+    portion: str = ''
+    components: tuple = ()
+    prep_time: float = 0
+    photo: str = ''
+
+
+class SectionRecord(NamedTuple):
+    """
+    Раздел меню с заранее подготовленными текстом и клавиатурой.
+
+    Attributes:
+        id (int): Компактный идентификатор раздела для callback_data.
+        name (str): Название раздела.
+        parent (str | None): Раздел, в который ведёт кнопка "🔙".
+        notice (str): Всплывающее уведомление при выборе раздела.
+        text (str | None): Текст сообщения раздела.
+        keyboard (InlineKeyboardMarkup | None): Клавиатура раздела.
+        products (tuple): Товары раздела.
+        photo (str): Путь к фото раздела относительно файла меню; пустая строка — без фото.
+    """
+    id: int
+    name: str
+    parent: str
+    notice: str
+    text: str
+    keyboard: InlineKeyboardMarkup
+    products: tuple
+    photo: str = ''
+
+
+class CatalogSnapshot(NamedTuple):
+    """
+    Неизменяемый снимок каталога.
+
+    Attributes:
+        version (int): Номер версии, увеличивается при каждой перезагрузке.
+        products (dict): Идентификатор -> ProductRecord.
+        products_by_name (dict): Название -> ProductRecord.
+        sections (dict): Идентификатор -> SectionRecord.
+        sections_by_name (dict): Название -> SectionRecord.
+        aliases (dict): Старая callback_data (``selected_...``, ``edit_...``) -> компактная.
+    """
+    version: int
+    products: dict
+    products_by_name: dict
+    sections: dict
+    sections_by_name: dict
+    aliases: dict
+
+
+def _render_products(section: dict, products: list) -> str:
+    label = section.get('portion_label', 'Объем порции')
+    return '\n\n'.join(
+        f"{product.name}\n{product.description}\n{label}: {product.portion}\nЦена: {product.price} руб."
+        for product in products
+    )
+
+
+def _render_set_meals(products: list) -> str:
+    blocks = []
+    for number, product in enumerate(products, start=1):
+        components = '\n'.join(
+            f'{position}. {name} ({portion})'
+            for position, (name, portion) in enumerate(product.components, start=1)
+        )
+        blocks.append(
+            f'Комплексный обед №{number} -\n{product.name}\nСостав:\n{components}\n\nЦена: {product.price} руб.'
+        )
+    return '\n\n'.join(blocks)
+
+
+def build_snapshot(data: dict, version: int) -> CatalogSnapshot:
+    """
+    Собирает снимок каталога из разобранного файла меню.
+
+    Args:
+        data (dict): Содержимое файла меню.
+        version (int): Номер версии снимка.
+
+    Returns:
+        CatalogSnapshot: Готовый снимок.
+
+    Raises:
+        ValueError: Если в файле повторяются идентификаторы или названия,
+            либо есть ссылки на несуществующие разделы и блюда.
+    """
+    sections_data = data['sections']
+    section_ids = {}
+    for section in sections_data:
+        if section['name'] in section_ids or section['id'] in section_ids.values():
+            raise ValueError(f"Раздел {section['name']!r} или его id повторяется")
+        section_ids[section['name']] = section['id']
+
+    products = {}
+    products_by_name = {}
+    section_products = {}
+    for section in sections_data:
+        records = []
+        for item in section.get('products', ()):
+            if item['id'] in products or item['name'] in products_by_name:
+                raise ValueError(f"Товар {item['name']!r} или его id повторяется")
+            record = ProductRecord(
+                id=item['id'],
+                name=item['name'],
+                price=int(item['price']),
+                section=section['name'],
+                description=item.get('description', ''),
+                portion=item.get('portion', ''),
+                components=tuple(tuple(component) for component in item.get('components', ())),
+                prep_time=float(item.get('prep_time', 0)),
+                photo=item.get('photo', ''),
+            )
+            products[record.id] = record
+            products_by_name[record.name] = record
+            records.append(record)
+        section_products[section['name']] = tuple(records)
+
+    for record in products.values():
+        for name, _ in record.components:
+            if name not in products_by_name:
+                raise ValueError(f'В составе {record.name!r} неизвестное блюдо {name!r}')
+
+    sections = {}
+    sections_by_name = {}
+    for section in sections_data:
+        name = section['name']
+        records = section_products[name]
+        subsections = section.get('sections', ())
+        parent = section.get('parent')
+        for target in (*subsections, *([parent] if parent else [])):
+            if target not in section_ids:
+                raise ValueError(f'Раздел {name!r} ссылается на неизвестный раздел {target!r}')
+
+        text = keyboard = None
+        if records or subsections:
+            if 'title' in section:
+                text = section['title']
+            elif section.get('layout') == 'set_meals':
+                text = _render_set_meals(records)
+            else:
+                text = _render_products(section, records)
+            buttons = [(subsection, pack(SECTION, section_ids[subsection])) for subsection in subsections]
+            buttons += [(record.name, pack(SELECT, record.id)) for record in records]
+            if parent:
+                buttons.append((f'🔙{parent}', pack(SECTION, section_ids[parent])))
+            keyboard = menu_kb.section_keyboard(buttons)
+
+        record = SectionRecord(
+            id=section['id'],
+            name=name,
+            parent=parent,
+            notice=section.get('notice', ''),
+            text=text,
+            keyboard=keyboard,
+            products=records,
+            photo=section.get('photo', ''),
+        )
+        sections[record.id] = record
+        sections_by_name[name] = record
+
+    return CatalogSnapshot(
+        version=version,
+        products=products,
+        products_by_name=products_by_name,
+        sections=sections,
+        sections_by_name=sections_by_name,
+        aliases=_build_aliases(products, sections),
+    )
+
+
+def _build_aliases(products: dict, sections: dict) -> dict:
+    """Старые значения callback_data, которые остались в уже отправленных сообщениях."""
+    aliases = {}
+    for record in products.values():
+        underscored = record.name.replace(' ', '_')
+        aliases[f'selected_{underscored}'] = pack(SELECT, record.id)
+        aliases[f'edit_{underscored}'] = pack(EDIT, record.id)
+        aliases[f'increase_{record.name}'] = pack(INCREASE, record.id)
+        aliases[f'decrease_{record.name}'] = pack(DECREASE, record.id)
+    for record in sections.values():
+        underscored = record.name.replace(' ', '_')
+        aliases[f'selected_{underscored}'] = pack(SECTION, record.id)
+        aliases[f'selected_🔙{underscored}'] = pack(SECTION, record.id)
+    return aliases
+
+
+def load_snapshot(path: Path, version: int) -> CatalogSnapshot:
+    """
+    Читает файл меню и собирает из него снимок.
+
+    Args:
+        path (Path): Путь к файлу меню.
+        version (int): Номер версии снимка.
+
+    Returns:
+        CatalogSnapshot: Готовый снимок.
+    """
+    with open(path, encoding='utf-8') as file:
+        return build_snapshot(json.load(file), version)
+
+
+class Catalog:
+    """
+    Каталог меню с горячей перезагрузкой.
+
+    Текущий снимок доступен в атрибуте ``snapshot``. Чтение не требует блокировок:
+    перезагрузка собирает новый снимок целиком и только затем подменяет ссылку.
+    Если обработчику нужно несколько значений из каталога, стоит один раз сохранить
+    ``catalog.snapshot`` в переменную, чтобы все они относились к одной версии.
+    """
+
+    def __init__(self, path: Path = DEFAULT_PATH):
+        self.path = Path(path)
+        self._stamp = self._file_stamp()
+        self.snapshot = load_snapshot(self.path, version=1)
+        self._listeners = []
+        self._watcher = None
+
+    def product(self, item_id: int):
+        """Возвращает товар по идентификатору или None."""
+        return self.snapshot.products.get(item_id)
+
+    def section(self, item_id: int):
+        """Возвращает раздел по идентификатору или None."""
+        return self.snapshot.sections.get(item_id)
+
+    def translate(self, data: str):
+        """Переводит старую callback_data в компактную или возвращает None."""
+        return self.snapshot.aliases.get(data)
+
+    def subscribe(self, listener):
+        """
+        Регистрирует функцию, которая вызывается с новым снимком после перезагрузки.
+
+        Исключение подписчика записывается в лог, остальные подписчики всё равно вызываются.
+
+        Args:
+            listener (Callable): Функция ``listener(snapshot)``.
+        """
+        self._listeners.append(listener)
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self) -> bool:
+        """
+        Перечитывает файл меню, если он изменился.
+
+        Returns:
+            bool: True, если снимок был заменён.
+        """
+        try:
+            stamp = self._file_stamp()
+        except OSError:
+            logger.exception('Файл каталога %s недоступен', self.path)
+            return False
+        if stamp == self._stamp:
+            return False
+        # Файл с ошибкой повторно читаем только после следующего изменения
+        self._stamp = stamp
+        try:
+            snapshot = load_snapshot(self.path, version=self.snapshot.version + 1)
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.exception('Не удалось перечитать каталог %s, остаётся версия %s',
+                             self.path, self.snapshot.version)
+            return False
+        self.snapshot = snapshot
+        logger.info('Каталог %s перезагружен, версия %s', self.path, snapshot.version)
+        for listener in self._listeners:
+            # Ошибка одного подписчика не должна останавливать проверку файла и оставлять остальных со старой версией
+            try:
+                listener(snapshot)
+            except Exception:
+                logger.exception('Ошибка подписчика каталога %r при переходе на версию %s', listener, snapshot.version)
+        return True
+
+    async def watch(self, interval: float = 5.0):
+        """
+        Периодически проверяет файл меню и перезагружает каталог при изменении.
+
+        Args:
+            interval (float): Пауза между проверками в секундах.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.reload()
+
+    def start_watching(self, interval: float = 5.0):
+        """Запускает фоновую проверку файла меню."""
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self.watch(interval))
+
+    async def stop_watching(self):
+        """Останавливает фоновую проверку файла меню."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
@@ -0,0 +1,129 @@
+"""
+Скомпилированная таблица маршрутизации callback-запросов.
+
+Вместо цепочки фильтров ``@router.callback_query(F.data == ...)``, которую aiogram проверяет
+по очереди для каждого нажатия, обработчики регистрируются в ``CallbackDispatcher``:
+- точные значения callback_data попадают в словарь;
+- компактные значения ``<код действия><id>`` (см. ``app.callback_data``) разбираются
+  по коду действия и идентификатору без поиска по строкам;
+- старые значения callback_data из уже отправленных сообщений (``selected_...``,
+  ``edit_...``, ``increase_...``, ``decrease_...``) переводятся в компактные через
+  таблицу псевдонимов, другого пути для них нет.
+
+Диспетчер подключается к обычному ``Router`` одним обработчиком, поэтому остальной код
+(``dp.include_router(router)``) не меняется.
+"""
+
+from app.callback_data import unpack
+
+
+class CallbackDispatcher:
+    """
+    Таблица маршрутизации callback_data с поиском за O(1) по точному совпадению.
+
+    Порядок поиска: перевод псевдонима, точное значение, компактный код действия.
+    Если ничего не найдено, update считается необработанным.
+    """
+
+    def __init__(self):
+        self._translate = None
+        self._actions = {}
+        self._exact = {}
+
+    def exact(self, *values: str):
+        """
+        Регистрирует обработчик для точных значений callback_data.
+
+        Args:
+            *values (str): Значения callback_data.
+        """
+        def decorator(handler):
+            for value in values:
+                if value in self._exact:
+                    raise ValueError(f'callback_data {value!r} уже зарегистрирован')
+                self._exact[value] = (handler, None)
+            return handler
+        return decorator
+
+    def action(self, code: str, lookup, name: str):
+        """
+        Регистрирует обработчик для компактных callback_data с кодом действия ``code``.
+
+        Идентификатор из callback_data передаётся в ``lookup`` при каждом нажатии, поэтому
+        таблица может меняться (например, при перезагрузке каталога). Найденное значение
+        передаётся обработчику именованным аргументом ``name``.
+
+        Args:
+            code (str): Код действия из ``app.callback_data``.
+            lookup (Callable): Функция id -> значение или None.
+            name (str): Имя аргумента обработчика, в который попадёт значение.
+        """
+        def decorator(handler):
+            if code in self._actions:
+                raise ValueError(f'Код действия {code!r} уже зарегистрирован')
+            self._actions[code] = (handler, lookup, name)
+            return handler
+        return decorator
+
+    def aliases(self, translate):
+        """
+        Задаёт перевод старых значений callback_data в новые перед поиском маршрута.
+
+        Args:
+            translate (Callable): Функция callback_data -> новое значение или None.
+        """
+        self._translate = translate
+
+    def resolve(self, data: str):
+        """
+        Находит обработчик для callback_data.
+
+        Args:
+            data (str): Значение callback_data.
+
+        Returns:
+            tuple | None: Пара (обработчик, дополнительные аргументы) или None.
+        """
+        if self._translate is not None:
+            data = self._translate(data) or data
+        route = self._exact.get(data)
+        if route is not None:
+            return route
+        packed = unpack(data)
+        if packed is not None and packed[0] in self._actions:
+            handler, lookup, name = self._actions[packed[0]]
+            payload = lookup(packed[1])
+            if payload is None:
+                return None
+            return handler, {name: payload}
+        return None
+
+    async def match(self, callback):
+        """
+        Фильтр aiogram: пропускает callback, если для него есть маршрут.
+
+        Найденный маршрут передаётся в ``_handle`` через аргумент ``route``.
+        """
+        if callback.data is None:
+            return False
+        route = self.resolve(callback.data)
+        if route is None:
+            return False
+        return {'route': route}
+
+    @staticmethod
+    async def _handle(callback, route):
+        handler, kwargs = route
+        if kwargs:
+            return await handler(callback, **kwargs)
+        return await handler(callback)
+
+    def attach(self, router):
+        """
+        Подключает диспетчер к роутеру aiogram одним обработчиком callback_query.
+
+        Args:
+            router (Router): Роутер, в который нужно встроить таблицу.
+        """
+        router.callback_query.register(self._handle, self.match)
+        return router
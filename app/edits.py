@@ -0,0 +1,231 @@
+"""
+Сокращение запросов на изменение сообщений.
+
+Объединение частых изменений клавиатуры одного сообщения.
+
+Когда пользователь быстро нажимает "➕"/"➖", каждое нажатие меняет клавиатуру того же
+сообщения. ``EditCoalescer`` откладывает ``edit_reply_markup`` на короткое окно и за окно
+отправляет в Bot API только последнюю клавиатуру. На сами нажатия обработчики отвечают
+сразу, отложенной остаётся только перерисовка.
+
+Если сообщение за это время изменили напрямую (``edit_text``, ``delete`` и т.п.),
+отложенная клавиатура устарела и отбрасывается, чтобы не перерисовать новый экран
+старыми кнопками. Если клавиатура уже отправлена и ответа ещё нет, прямое изменение
+ждёт этого ответа: иначе запросы могли бы дойти до Telegram в обратном порядке.
+Для этого ``EditCoalescer`` подключается к сессии бота как middleware запросов.
+
+Пропуск изменений без изменений.
+
+Обработчики часто перерисовывают экран тем же текстом и той же клавиатурой (повторное
+нажатие "Назад в корзину", того же раздела меню и т.п.). Telegram на такой запрос
+отвечает ошибкой "message is not modified", а запрос всё равно занимает время и лимиты.
+``EditFingerprints`` помнит отпечатки текста и клавиатуры, последними отправленных
+в каждое сообщение, и не отправляет изменение, если оно ничего не меняет.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import logging
+from collections import OrderedDict
+
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.methods import (
+    DeleteMessage, EditMessageCaption, EditMessageMedia, EditMessageReplyMarkup, EditMessageText, SendMessage,
+    SendPhoto,
+)
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Запросы, которые меняют сообщение целиком и делают отложенную клавиатуру устаревшей
+_DIRECT_EDITS = (EditMessageText, EditMessageReplyMarkup, EditMessageCaption, EditMessageMedia, DeleteMessage)
+# Запросы, после которых отпечатки сообщения неизвестны: подпись и клавиатуру фото не отслеживаем
+_FORGET_SCREEN = (DeleteMessage, EditMessageCaption, EditMessageMedia)
+# Отмечает запросы, которые отправляет сам EditCoalescer
+_sending = contextvars.ContextVar('edit_coalescer_sending', default=False)
+
+
+class EditCoalescer:
+    """
+    Отложенная отправка последней клавиатуры для каждого сообщения.
+
+    Окно отсчитывается от первого отложенного изменения и не продлевается новыми
+    нажатиями, поэтому при непрерывных нажатиях клавиатура обновляется раз в окно.
+
+    Attributes:
+        requested (int): Сколько изменений клавиатуры запросили обработчики.
+        sent (int): Сколько запросов ``editMessageReplyMarkup`` отправлено.
+    """
+
+    def __init__(self, delay: float = 0.3):
+        """
+        Args:
+            delay (float): Окно объединения изменений, в секундах.
+        """
+        self.delay = delay
+        self.requested = 0
+        self.sent = 0
+        self._pending = {}
+        # Сообщение -> задача, которая уже отправляет клавиатуру
+        self._in_flight = {}
+
+    def edit_reply_markup(self, message, reply_markup):
+        """
+        Планирует изменение клавиатуры сообщения. Не ждёт ответа Bot API.
+
+        Args:
+            message (Message): Сообщение с клавиатурой.
+            reply_markup (InlineKeyboardMarkup): Новая клавиатура.
+        """
+        self.requested += 1
+        key = (message.chat.id, message.message_id)
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Окно уже идёт: заменяем клавиатуру, запрос будет один
+            pending[1] = reply_markup
+            return
+        pending = [message, reply_markup, None]
+        pending[2] = asyncio.create_task(self._send_later(key, pending))
+        self._pending[key] = pending
+
+    async def _send_later(self, key: tuple, pending: list):
+        await asyncio.sleep(self.delay)
+        if self._pending.get(key) is pending:
+            del self._pending[key]
+            self._in_flight[key] = pending[2]
+            try:
+                await self._send(pending[0], pending[1])
+            finally:
+                if self._in_flight.get(key) is pending[2]:
+                    del self._in_flight[key]
+
+    async def _send(self, message, reply_markup):
+        token = _sending.set(True)
+        self.sent += 1
+        try:
+            await message.edit_reply_markup(reply_markup=reply_markup)
+        except TelegramAPIError as error:
+            logger.warning('Не удалось обновить клавиатуру сообщения %s: %s', message.message_id, error)
+        finally:
+            _sending.reset(token)
+
+    def discard(self, chat_id: int, message_id: int):
+        """
+        Отменяет отложенное изменение клавиатуры сообщения.
+
+        Args:
+            chat_id (int): ID чата.
+            message_id (int): ID сообщения.
+        """
+        pending = self._pending.pop((chat_id, message_id), None)
+        if pending is not None:
+            pending[2].cancel()
+
+    async def __call__(self, make_request, bot, method):
+        """
+        Middleware запросов бота: прямое изменение сообщения отменяет отложенную клавиатуру
+        и дожидается ответа на уже отправленную.
+        """
+        if (self._pending or self._in_flight) and not _sending.get() and isinstance(method, _DIRECT_EDITS):
+            self.discard(method.chat_id, method.message_id)
+            in_flight = self._in_flight.get((method.chat_id, method.message_id))
+            if in_flight is not None:
+                # wait не отменяет отправку клавиатуры, если отменят сам запрос
+                await asyncio.wait([in_flight])
+        return await make_request(bot, method)
+
+    async def flush(self):
+        """Сразу отправляет все отложенные изменения, например перед остановкой бота."""
+        pending, self._pending = self._pending, {}
+        for message, reply_markup, task in pending.values():
+            task.cancel()
+            await self._send(message, reply_markup)
+
+
+def _fingerprint(*parts) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if part is not None and hasattr(part, 'model_dump_json'):
+            part = part.model_dump_json(exclude_none=True)
+        digest.update(repr(part).encode())
+        digest.update(b'\0')
+    return digest.digest()
+
+
+class EditFingerprints:
+    """
+    Middleware запросов бота, которое не отправляет изменения, не меняющие сообщение.
+
+    Для каждого сообщения хранится пара отпечатков: текст (вместе с разметкой текста)
+    и клавиатура. Отпечатки запоминаются после успешной отправки или изменения сообщения
+    и забываются после ошибки, удаления или изменения фото и подписи (``editMessageMedia``,
+    ``editMessageCaption``, ``sendPhoto``). Пропущенный запрос возвращает ``True``,
+    как Bot API для изменённого сообщения.
+
+    Attributes:
+        suppressed (int): Сколько изменений не отправлено, потому что они ничего не меняли.
+    """
+
+    def __init__(self, size: int = 10000):
+        """
+        Args:
+            size (int): Сколько сообщений помнить.
+        """
+        self.size = size
+        self.suppressed = 0
+        self._screens = OrderedDict()
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, (EditMessageText, EditMessageReplyMarkup)) and method.chat_id is not None:
+            return await self._edit(make_request, bot, method)
+        if isinstance(method, _FORGET_SCREEN):
+            # После запроса на экране то, что отпечатки не описывают
+            self._screens.pop((method.chat_id, method.message_id), None)
+            return await make_request(bot, method)
+        result = await make_request(bot, method)
+        if isinstance(method, SendMessage) and isinstance(result, Message):
+            self._remember(
+                (result.chat.id, result.message_id),
+                _fingerprint(method.text, method.parse_mode, method.entities),
+                _fingerprint(method.reply_markup),
+            )
+        elif isinstance(method, SendPhoto) and isinstance(result, Message):
+            self._screens.pop((result.chat.id, result.message_id), None)
+        return result
+
+    async def _edit(self, make_request, bot, method):
+        key = (method.chat_id, method.message_id)
+        screen = self._screens.get(key)
+        markup = _fingerprint(method.reply_markup)
+        if isinstance(method, EditMessageText):
+            text = _fingerprint(method.text, method.parse_mode, method.entities)
+            unchanged = screen == (text, markup)
+        else:
+            # Изменение клавиатуры оставляет текст прежним
+            text = screen[0] if screen is not None else None
+            unchanged = screen is not None and screen[1] == markup
+        if unchanged:
+            self._screens.move_to_end(key)
+            self.suppressed += 1
+            return True
+        try:
+            result = await make_request(bot, method)
+        except TelegramBadRequest as error:
+            if 'message is not modified' not in error.message:
+                self._screens.pop(key, None)
+                raise
+            # На экране уже то же самое — запоминаем, чтобы не повторять запрос
+            self._remember(key, text, markup)
+            raise
+        except TelegramAPIError:
+            self._screens.pop(key, None)
+            raise
+        self._remember(key, text, markup)
+        return result
+
+    def _remember(self, key: tuple, text, markup):
+        self._screens[key] = (text, markup)
+        self._screens.move_to_end(key)
+        if len(self._screens) > self.size:
+            self._screens.popitem(last=False)
@@ -0,0 +1,115 @@
+"""
+Поиск товаров в inline-режиме (``@бот борщ`` в любом чате).
+
+Telegram присылает inline-запрос на каждое нажатие клавиши, поэтому готовые ответы
+хранятся в ``InlineResultCache``: LRU по нормализованному тексту запроса (каждый
+набранный префикс — отдельная запись). Повторный префикс не обращается ни к индексу
+поиска, ни к каталогу. Карточки товаров (``InlineQueryResultArticle``) тоже собираются
+один раз и переиспользуются во всех ответах. При смене версии каталога кэш сбрасывается.
+
+Inline-режим нужно включить у бота через @BotFather (/setinline).
+"""
+
+from collections import OrderedDict
+
+from aiogram.types import (
+    InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent,
+)
+
+from app.callback_data import pack, SELECT
+
+
+def normalize_query(query: str) -> str:
+    """Приводит текст запроса к ключу кэша: без учёта регистра, "ё" как "е", одиночные пробелы."""
+    return ' '.join(query.casefold().replace('ё', 'е').split())
+
+
+def product_article(product) -> InlineQueryResultArticle:
+    """
+    Создаёт карточку товара для ответа на inline-запрос.
+
+    Args:
+        product (ProductRecord): Товар из каталога.
+
+    Returns:
+        InlineQueryResultArticle: Карточка с описанием и кнопкой добавления в корзину.
+    """
+    details = f'{product.description}\n' if product.description else ''
+    return InlineQueryResultArticle(
+        id=str(product.id),
+        title=product.name,
+        description=f'{product.price} руб. {product.description}'.strip(),
+        input_message_content=InputTextMessageContent(
+            message_text=f'{product.name}\n{details}Цена: {product.price} руб.'
+        ),
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text='🛒 Добавить в корзину', callback_data=pack(SELECT, product.id))
+        ]]),
+    )
+
+
+class InlineResultCache:
+    """
+    LRU готовых ответов на inline-запросы.
+
+    Готовые списки карточек отдаются всем пользователям одними и теми же объектами,
+    поэтому их нельзя изменять после получения из кэша.
+
+    Args:
+        find (Callable): Функция ``find(query)``, возвращающая товары по нормализованному запросу.
+        version (Callable): Функция, возвращающая текущую версию каталога.
+        size (int): Сколько запросов держать в кэше.
+    """
+
+    def __init__(self, find, version=lambda: 0, size: int = 2000):
+        self._find = find
+        self._version = version
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._cached_version = None
+        self._results = OrderedDict()
+        self._articles = {}
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, query: str) -> list:
+        """
+        Возвращает карточки товаров для inline-запроса.
+
+        Args:
+            query (str): Текст запроса, как его прислал Telegram.
+
+        Returns:
+            list: InlineQueryResultArticle в порядке релевантности.
+        """
+        version = self._version()
+        if version != self._cached_version:
+            # Каталог перезагружен — цены и названия в готовых карточках могли измениться
+            self._cached_version = version
+            self._results = OrderedDict()
+            self._articles = {}
+        key = normalize_query(query)
+        results = self._results.get(key)
+        if results is not None:
+            self._results.move_to_end(key)
+            self.hits += 1
+            return results
+        self.misses += 1
+        results = []
+        for product in self._find(key):
+            article = self._articles.get(product.id)
+            if article is None:
+                article = self._articles[product.id] = product_article(product)
+            results.append(article)
+        self._results[key] = results
+        if len(self._results) > self.size:
+            self._results.popitem(last=False)
+        return results
+
+    def metrics(self):
+        """Показатели кэша для ``HandlerMetrics.add_collector``."""
+        yield 'inline_cache_entries', len(self._results)
+        yield 'inline_cache_hits_total', self.hits
+        yield 'inline_cache_misses_total', self.misses
@@ -0,0 +1,52 @@
+"""
+Кэш готовых клавиатур.
+
+Клавиатуры экранов, которые не зависят от корзины (``kb.options()``, ``kb.cart_buttons()``,
+``kb.added()`` и т.п.), собираются один раз и дальше отдаются готовым объектом разметки.
+Ключ кэша — функция-построитель, её аргументы и версия каталога, поэтому после
+перезагрузки каталога клавиатуры собираются заново.
+
+Клавиатуры, которые зависят от содержимого корзины (``create_edit_quantity_buttons``,
+``quantity_buttons``), через кэш не проходят и строятся на каждый запрос.
+"""
+
+
+class KeyboardCache:
+    """
+    Кэш объектов InlineKeyboardMarkup/ReplyKeyboardMarkup.
+
+    Готовая разметка отдаётся всем пользователям одним и тем же объектом, поэтому
+    её нельзя изменять после получения из кэша.
+    """
+
+    def __init__(self, version=lambda: 0):
+        """
+        Args:
+            version (Callable): Функция, возвращающая текущую версию каталога.
+        """
+        self._version = version
+        self._markups = {}
+
+    async def get(self, factory, *args):
+        """
+        Возвращает готовую клавиатуру, при необходимости собирая её.
+
+        Args:
+            factory (Callable): Корутина-построитель из ``app.keyboard`` или ``app.menu_keyboard``.
+            *args: Аргументы построителя, они входят в ключ кэша.
+
+        Returns:
+            InlineKeyboardMarkup | ReplyKeyboardMarkup: Готовая клавиатура.
+        """
+        key = (factory, args)
+        version = self._version()
+        cached = self._markups.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        markup = await factory(*args)
+        self._markups[key] = (version, markup)
+        return markup
+
+    def invalidate(self, *_):
+        """Сбрасывает кэш, например после перезагрузки каталога."""
+        self._markups = {}
@@ -0,0 +1,199 @@
+"""
+Очереди кухонных станций и оценка времени готовности заказа.
+
+Оплаченный заказ разбивается на талоны по станциям (супы, гриль, холодный цех, напитки,
+десерты) по разделу меню, из которого взят товар; комплексный обед раскладывается на блюда
+из состава. У каждой станции ``capacity`` поваров, работающих параллельно: каждая порция
+ставится к повару, который освободится раньше всех, и готовится ``prep_time`` секунд
+(или ``ProductRecord.prep_time``, если он задан у товара). Время готовности заказа —
+момент, когда будет готова последняя порция последнего талона.
+
+Это модель очереди, а не учёт фактического приготовления: порция считается готовой,
+когда прошло её расчётное время. Очереди хранятся в памяти процесса, при запуске
+в несколько процессов (``app.workers``) каждый процесс видит только свои заказы.
+"""
+
+import heapq
+import time
+from collections import Counter
+from typing import NamedTuple
+
+# Станции кухни: название -> (поваров, секунд на порцию по умолчанию)
+STATIONS = {
+    'soups': (2, 180),
+    'grill': (3, 720),
+    'cold': (2, 300),
+    'drinks': (2, 120),
+    'desserts': (1, 150),
+}
+# Раздел меню -> станция; товары других разделов готовит станция DEFAULT_STATION
+SECTION_STATIONS = {
+    'Суп': 'soups',
+    'Мясное блюдо': 'grill',
+    'Гарнир': 'grill',
+    'Салат': 'cold',
+    'Горячие напитки': 'drinks',
+    'Холодные напитки': 'drinks',
+    'Десерты': 'desserts',
+}
+DEFAULT_STATION = 'grill'
+
+
+class Ticket(NamedTuple):
+    """
+    Талон заказа для одной станции.
+
+    Attributes:
+        station (str): Станция.
+        items (tuple): Пары (название блюда, количество).
+        ready_in (float): Через сколько секунд талон будет готов.
+    """
+    station: str
+    items: tuple
+    ready_in: float
+
+
+class Station:
+    """
+    Очередь одной станции: ``capacity`` поваров, для каждого — время, когда он освободится.
+
+    Args:
+        name (str): Название станции.
+        capacity (int): Сколько порций готовится одновременно.
+        prep_time (float): Время приготовления порции по умолчанию, в секундах.
+    """
+
+    def __init__(self, name: str, capacity: int, prep_time: float):
+        self.name = name
+        self.capacity = capacity
+        self.prep_time = prep_time
+        self.tickets = 0
+        self.items = 0
+        self.completed = 0
+        self._cooks = [0.0] * capacity
+        # Время готовности порций, которые ещё не готовы
+        self._pending = []
+
+    def _advance(self, now: float):
+        pending = self._pending
+        while pending and pending[0] <= now:
+            heapq.heappop(pending)
+            self.completed += 1
+
+    def schedule(self, prep_times: list, now: float) -> float:
+        """
+        Ставит порции талона в очередь станции.
+
+        Args:
+            prep_times (list): Время приготовления каждой порции, в секундах.
+            now (float): Текущее время.
+
+        Returns:
+            float: Момент готовности последней порции талона.
+        """
+        self._advance(now)
+        ready = now
+        cooks = self._cooks
+        # Длинные порции первыми — так талон готов раньше
+        for prep_time in sorted(prep_times, reverse=True):
+            finish = max(cooks[0], now) + prep_time
+            heapq.heapreplace(cooks, finish)
+            heapq.heappush(self._pending, finish)
+            ready = max(ready, finish)
+        self.tickets += 1
+        self.items += len(prep_times)
+        return ready
+
+    def backlog(self, now: float) -> float:
+        """Возвращает, сколько секунд работы в очереди приходится на одного повара."""
+        return sum(max(free - now, 0.0) for free in self._cooks) / self.capacity
+
+    def busy(self, now: float) -> int:
+        """Возвращает число поваров, занятых прямо сейчас."""
+        return sum(free > now for free in self._cooks)
+
+
+class Kitchen:
+    """
+    Станции кухни и распределение заказов по ним.
+
+    Args:
+        catalog (Catalog): Каталог; из него берутся разделы товаров и состав комплексных обедов.
+        stations (dict): Станция -> (поваров, секунд на порцию).
+        section_stations (dict): Раздел меню -> станция.
+    """
+
+    def __init__(self, catalog, stations: dict = None, section_stations: dict = None):
+        self.catalog = catalog
+        self.stations = {
+            name: Station(name, capacity, prep_time) for name, (capacity, prep_time) in (stations or STATIONS).items()
+        }
+        self.section_stations = section_stations if section_stations is not None else SECTION_STATIONS
+        self.orders = 0
+
+    def split(self, lines) -> dict:
+        """
+        Раскладывает строки заказа по станциям.
+
+        Args:
+            lines (Iterable): Строки заказа (``OrderLine``).
+
+        Returns:
+            dict: Станция -> Counter(название блюда -> порций).
+        """
+        products = self.catalog.snapshot.products_by_name
+        tickets = {}
+        for line in lines:
+            record = products.get(line.product)
+            if record is not None and record.components:
+                dishes = [(name, line.quantity) for name, _ in record.components]
+            else:
+                dishes = [(line.product, line.quantity)]
+            for name, quantity in dishes:
+                dish = products.get(name)
+                station = self.section_stations.get(dish.section) if dish is not None else None
+                if station not in self.stations:
+                    station = DEFAULT_STATION
+                tickets.setdefault(station, Counter())[name] += quantity
+        return tickets
+
+    def submit(self, order, now: float = None) -> tuple:
+        """
+        Ставит талоны оплаченного заказа в очереди станций.
+
+        Args:
+            order (OrderRecord): Оплаченный заказ.
+            now (float): Текущее время (``time.monotonic()``), для проверок.
+
+        Returns:
+            tuple: (через сколько секунд будет готов весь заказ, кортеж Ticket).
+        """
+        if now is None:
+            now = time.monotonic()
+        products = self.catalog.snapshot.products_by_name
+        tickets = []
+        for name, dishes in self.split(order.lines).items():
+            station = self.stations[name]
+            prep_times = []
+            for dish, quantity in dishes.items():
+                record = products.get(dish)
+                prep_time = record.prep_time if record is not None and record.prep_time else station.prep_time
+                prep_times += [prep_time] * quantity
+            ready = station.schedule(prep_times, now)
+            tickets.append(Ticket(name, tuple(dishes.items()), round(ready - now, 1)))
+        self.orders += 1
+        return max((ticket.ready_in for ticket in tickets), default=0.0), tuple(tickets)
+
+    def metrics(self):
+        """Показатели станций для ``HandlerMetrics.add_collector``."""
+        now = time.monotonic()
+        for station in self.stations.values():
+            station._advance(now)
+            label = f'station="{station.name}"'
+            yield 'kitchen_tickets_total', label, station.tickets
+            yield 'kitchen_items_total', label, station.items
+            yield 'kitchen_items_completed_total', label, station.completed
+            yield 'kitchen_backlog_seconds', label, round(station.backlog(now), 1)
+            yield 'kitchen_busy_cooks', label, station.busy(now)
+            yield 'kitchen_cooks', label, station.capacity
+        yield 'kitchen_orders_total', self.orders
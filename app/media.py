@@ -0,0 +1,283 @@
+"""
+Фотографии разделов и товаров меню.
+
+Локальный файл загружается в Telegram один раз: ``file_id`` из ответа сохраняется
+в базе SQLite по SHA-256 содержимого файла (и ID бота — ``file_id`` действителен только
+для своего бота), дальше фото отправляется по ``file_id`` без загрузки. Переименованный
+файл с тем же содержимым повторно не загружается, изменённый — загружается заново.
+Хеш файла пересчитывается только при изменении его размера или времени изменения.
+
+``MediaCache.show`` показывает экран (текст, клавиатура, необязательное фото) на месте
+сообщения с нажатой кнопкой: фото меняется на фото через ``edit_media``, текст на фото
+и фото на текст — новым сообщением вместо старого (Telegram не умеет превращать
+текстовое сообщение в фото и обратно).
+
+``MediaCache`` подключается и как middleware запросов бота:
+- запоминает ``file_id`` из ответа на любую отправку фото из файла;
+- запоминает, какие сообщения — фото, и изменение текста такого сообщения
+  (``edit_text`` в обработчиках) заменяет отправкой текстового сообщения и удалением фото.
+
+Прогрев (``prewarm``) загружает все фото каталога заранее в служебный чат
+``MEDIA_CHAT_ID``, чтобы первый пользователь не ждал загрузки. Запуск отдельно:
+    BOT_TOKEN=... python -m app.media --chat-id <ID служебного чата>
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import DeleteMessage, EditMessageMedia, EditMessageText, SendPhoto
+from aiogram.types import FSInputFile, InputMediaPhoto, Message
+
+from app.catalog import Catalog
+from app.workers import create_bot
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина подписи к фото
+CAPTION_LIMIT = 1024
+
+
+def catalog_photos(snapshot) -> list:
+    """Возвращает пути фото всех разделов и товаров снимка каталога без повторов."""
+    photos = [section.photo for section in snapshot.sections.values()]
+    photos += [product.photo for product in snapshot.products.values()]
+    return list(dict.fromkeys(photo for photo in photos if photo))
+
+
+class MediaCache:
+    """
+    Постоянный кэш ``file_id`` фотографий и middleware запросов бота для экранов с фото.
+
+    Args:
+        path (str): Путь к базе SQLite с ``file_id``.
+        root (Path): Каталог, от которого отсчитываются относительные пути фото.
+        size (int): Сколько сообщений-фото помнить.
+    """
+
+    _SCHEMA = ('CREATE TABLE IF NOT EXISTS photos '
+               '(bot_id INTEGER, digest TEXT, file_id TEXT NOT NULL, PRIMARY KEY (bot_id, digest))')
+
+    def __init__(self, path: str, root: Path = Path('.'), size: int = 10000):
+        self.root = Path(root)
+        self.size = size
+        self.uploads = 0
+        self.reused = 0
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute(self._SCHEMA)
+        self._file_ids = {}
+        self._digests = {}
+        self._photo_messages = OrderedDict()
+
+    def _path(self, photo: str) -> Path:
+        return self.root / photo
+
+    def digest(self, photo: str) -> str:
+        """
+        Возвращает SHA-256 содержимого файла фото.
+
+        Raises:
+            OSError: Если файл недоступен.
+        """
+        path = self._path(photo)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self._digests.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        self._digests[path] = (stamp, digest)
+        return digest
+
+    def _bot_file_ids(self, bot_id: int) -> dict:
+        file_ids = self._file_ids.get(bot_id)
+        if file_ids is None:
+            rows = self._connection.execute('SELECT digest, file_id FROM photos WHERE bot_id = ?', (bot_id,))
+            file_ids = self._file_ids[bot_id] = dict(rows)
+        return file_ids
+
+    def file_id(self, bot, photo: str):
+        """Возвращает сохранённый ``file_id`` фото или None, если фото ещё не загружалось."""
+        return self._bot_file_ids(bot.id).get(self.digest(photo))
+
+    def input(self, bot, photo: str):
+        """
+        Возвращает, что передать Bot API: ``file_id`` или файл для загрузки.
+
+        Args:
+            bot (Bot): Бот, которым будет отправлено фото.
+            photo (str): Путь к фото из каталога.
+
+        Returns:
+            str | FSInputFile: ``file_id`` или файл.
+
+        Raises:
+            OSError: Если файл недоступен.
+        """
+        file_id = self.file_id(bot, photo)
+        if file_id is not None:
+            self.reused += 1
+            return file_id
+        return FSInputFile(self._path(photo))
+
+    def remember(self, bot, path, file_id: str):
+        """
+        Сохраняет ``file_id`` загруженного файла.
+
+        Args:
+            bot (Bot): Бот, которым загружен файл.
+            path (str | Path): Путь к загруженному файлу.
+            file_id (str): ``file_id`` из ответа Telegram.
+        """
+        digest = self.digest(path)
+        file_ids = self._bot_file_ids(bot.id)
+        if file_ids.get(digest) == file_id:
+            return
+        file_ids[digest] = file_id
+        self.uploads += 1
+        self._connection.execute(
+            'INSERT OR REPLACE INTO photos (bot_id, digest, file_id) VALUES (?, ?, ?)', (bot.id, digest, file_id)
+        )
+
+    async def show(self, message: Message, text: str, reply_markup=None, photo: str = ''):
+        """
+        Показывает экран на месте сообщения: фото с подписью или текст.
+
+        Если фото не задано, файл недоступен или текст длиннее подписи к фото, показывается текст.
+
+        Args:
+            message (Message): Сообщение с нажатой кнопкой.
+            text (str): Текст экрана.
+            reply_markup (InlineKeyboardMarkup): Клавиатура экрана.
+            photo (str): Путь к фото из каталога.
+        """
+        media = None
+        if photo and len(text) <= CAPTION_LIMIT:
+            try:
+                media = self.input(message.bot, photo)
+            except OSError:
+                logger.warning('Фото %s недоступно, показываем текст', photo)
+        if media is None:
+            # Если сообщение — фото, middleware заменит его текстовым
+            return await message.edit_text(text=text, reply_markup=reply_markup)
+        if message.photo:
+            return await message.edit_media(InputMediaPhoto(media=media, caption=text), reply_markup=reply_markup)
+        result = await message.answer_photo(media, caption=text, reply_markup=reply_markup)
+        await self._delete(message.bot, message.chat.id, message.message_id)
+        return result
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, EditMessageText) and method.chat_id is not None:
+            key = (method.chat_id, method.message_id)
+            if key in self._photo_messages:
+                return await self._replace_with_text(bot, method)
+            try:
+                return await make_request(bot, method)
+            except TelegramBadRequest as error:
+                # Сообщение-фото, отправленное до перезапуска
+                if 'no text in the message' not in error.message:
+                    raise
+                return await self._replace_with_text(bot, method)
+        if isinstance(method, DeleteMessage):
+            self._photo_messages.pop((method.chat_id, method.message_id), None)
+            return await make_request(bot, method)
+        result = await make_request(bot, method)
+        if isinstance(method, (SendPhoto, EditMessageMedia)) and isinstance(result, Message) and result.photo:
+            self._photo_messages[(result.chat.id, result.message_id)] = True
+            self._photo_messages.move_to_end((result.chat.id, result.message_id))
+            if len(self._photo_messages) > self.size:
+                self._photo_messages.popitem(last=False)
+            sent = method.photo if isinstance(method, SendPhoto) else method.media.media
+            if isinstance(sent, FSInputFile):
+                try:
+                    self.remember(bot, sent.path, result.photo[-1].file_id)
+                except OSError:
+                    logger.warning('Не удалось сохранить file_id для %s', sent.path)
+        return result
+
+    async def _replace_with_text(self, bot, method: EditMessageText):
+        message = await bot.send_message(
+            method.chat_id, method.text, parse_mode=method.parse_mode, entities=method.entities,
+            reply_markup=method.reply_markup,
+        )
+        await self._delete(bot, method.chat_id, method.message_id)
+        return message
+
+    async def _delete(self, bot, chat_id: int, message_id: int):
+        try:
+            await bot.delete_message(chat_id, message_id)
+        except TelegramBadRequest:
+            # Сообщения старше 48 часов удалить нельзя — останутся в истории чата
+            self._photo_messages.pop((chat_id, message_id), None)
+
+    async def prewarm(self, bot, chat_id: int, photos) -> int:
+        """
+        Загружает фото, для которых ещё нет ``file_id``.
+
+        Каждое фото отправляется в служебный чат и сразу удаляется из него.
+
+        Args:
+            bot (Bot): Бот.
+            chat_id (int): ID служебного чата (бот должен иметь право писать и удалять сообщения).
+            photos (Iterable): Пути к фото из каталога.
+
+        Returns:
+            int: Сколько фото загружено.
+        """
+        uploaded = 0
+        for photo in photos:
+            try:
+                if self.file_id(bot, photo) is not None:
+                    continue
+            except OSError:
+                logger.warning('Фото %s недоступно', photo)
+                continue
+            message = await bot.send_photo(chat_id, FSInputFile(self._path(photo)), disable_notification=True)
+            # file_id сохраняет middleware; без него (отдельный запуск) — сохраняем здесь
+            self.remember(bot, self._path(photo), message.photo[-1].file_id)
+            await self._delete(bot, chat_id, message.message_id)
+            uploaded += 1
+        return uploaded
+
+    def metrics(self):
+        """Показатели кэша для ``HandlerMetrics.add_collector``."""
+        yield 'media_uploads_total', self.uploads
+        yield 'media_reused_total', self.reused
+        yield 'media_cached_file_ids', sum(len(file_ids) for file_ids in self._file_ids.values())
+
+    def close(self):
+        """Закрывает базу."""
+        self._connection.close()
+
+
+async def _run(args):
+    catalog = Catalog()
+    media = MediaCache(args.db, root=catalog.path.parent)
+    bot = create_bot(os.environ['BOT_TOKEN'], args.api_url)
+    try:
+        photos = catalog_photos(catalog.snapshot)
+        uploaded = await media.prewarm(bot, args.chat_id, photos)
+        logger.info('Фото в каталоге: %s, загружено: %s', len(photos), uploaded)
+    finally:
+        await bot.session.close()
+        media.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Загрузка фото каталога в Telegram заранее')
+    parser.add_argument('--chat-id', type=int, required=True, help='служебный чат для загрузки')
+    parser.add_argument('--db', default='media.sqlite3', help='база file_id')
+    parser.add_argument('--api-url', default=None, help='адрес сервера Bot API')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Клавиатуры разделов меню и корзины с компактной callback_data.
+
+Кнопки товаров и разделов кодируются через ``app.callback_data``, поэтому обработчики
+получают идентификатор, а не название товара. Статические клавиатуры (``main``, ``options``,
+``cart_buttons`` и т.п.) по-прежнему строятся в ``app.keyboard``.
+"""
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from app.callback_data import pack, EDIT, INCREASE, DECREASE
+
+
+def section_keyboard(buttons: list) -> InlineKeyboardMarkup:
+    """
+    Создаёт клавиатуру раздела меню.
+
+    Вызывается один раз при сборке снимка каталога, готовая клавиатура
+    отправляется без повторной сборки.
+
+    Args:
+        buttons (list): Пары (подпись кнопки, callback_data).
+
+    Returns:
+        InlineKeyboardMarkup: Клавиатура раздела.
+    """
+    keyboard = InlineKeyboardBuilder()
+    for text, data in buttons:
+        keyboard.row(InlineKeyboardButton(text=text, callback_data=data))
+    return keyboard.as_markup()
+
+
+async def quantity_buttons(product, quantity: int) -> InlineKeyboardMarkup:
+    """
+    Создаёт кнопки изменения количества товара с текущим количеством между ними.
+
+    Зависит от корзины, поэтому строится на каждый запрос без ``KeyboardCache``.
+
+    Args:
+        product (ProductRecord): Товар из каталога.
+        quantity (int): Количество товара в корзине.
+
+    Returns:
+        InlineKeyboardMarkup: Кнопки "➖", количество, "➕" и возврат к списку товаров корзины.
+    """
+    keyboard = InlineKeyboardBuilder()
+    keyboard.row(
+        InlineKeyboardButton(text='➖', callback_data=pack(DECREASE, product.id)),
+        # Нажатие на количество показывает тот же экран заново
+        InlineKeyboardButton(text=f'{quantity} шт.', callback_data=pack(EDIT, product.id)),
+        InlineKeyboardButton(text='➕', callback_data=pack(INCREASE, product.id)),
+    )
+    keyboard.row(InlineKeyboardButton(text='🔙Назад', callback_data='redact_quantity'))
+    return keyboard.as_markup()
+
+
+async def create_edit_quantity_buttons(user_cart: dict, records: dict) -> InlineKeyboardMarkup:
+    """
+    Создаёт список товаров корзины для редактирования количества.
+
+    Товары, которых уже нет в каталоге, остаются в корзине, но изменить их количество нельзя.
+
+    Args:
+        user_cart (dict): Содержимое корзины пользователя.
+        records (dict): Название товара -> ProductRecord.
+
+    Returns:
+        InlineKeyboardMarkup: По кнопке на каждый товар корзины и возврат в корзину.
+    """
+    keyboard = InlineKeyboardBuilder()
+    for name, info in user_cart.items():
+        record = records.get(name)
+        if record is None:
+            continue
+        keyboard.row(InlineKeyboardButton(
+            text=f"{name} ({info['quantity']} шт.)",
+            callback_data=pack(EDIT, record.id)
+        ))
+    keyboard.row(InlineKeyboardButton(text='🔙Назад в корзину', callback_data='back_to_cart'))
+    return keyboard.as_markup()
@@ -0,0 +1,207 @@
+"""
+Метрики обработчиков в формате Prometheus.
+
+``HandlerMetrics`` подключается к роутеру как inner middleware (``router.message``,
+``router.callback_query``) и к сессии бота как middleware запросов. Для каждого
+обработчика собираются:
+- гистограмма времени обработки обновления;
+- число ошибок;
+- время ожидания запросов к Bot API и время собственной работы обработчика.
+Дополнительно считается число обновлений, обрабатываемых прямо сейчас.
+
+Метрики отдаются в текстовом формате Prometheus локальным HTTP-сервером
+(``GET /metrics``). Запись метрики — несколько сложений и один двоичный поиск
+по границам гистограммы, поэтому middleware можно не отключать.
+"""
+
+import contextvars
+import logging
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограммы времени обработки, в секундах
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Счётчик времени запросов к Bot API текущего обновления: [секунды, обработка не завершена]
+_api_time = contextvars.ContextVar('metrics_api_time', default=None)
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами.
+
+    Args:
+        buckets (tuple): Верхние границы корзин по возрастанию.
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list:
+        """Возвращает строки гистограммы в формате Prometheus (накопленные по корзинам)."""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class _HandlerStats:
+    __slots__ = ('latency', 'errors', 'api_seconds', 'local_seconds')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.api_seconds = 0.0
+        self.local_seconds = 0.0
+
+
+class HandlerMetrics:
+    """
+    Метрики обработчиков: middleware обновлений, middleware запросов бота и HTTP-сервер.
+
+    Args:
+        prefix (str): Префикс имён метрик.
+    """
+
+    def __init__(self, prefix: str = 'cafebot'):
+        self.prefix = prefix
+        self.in_flight = 0
+        self._handlers = {}
+        self._collectors = []
+        self._runner = None
+
+    @staticmethod
+    def handler_name(data: dict) -> str:
+        """Возвращает имя обработчика; для таблицы callback_data — имя обработчика маршрута."""
+        route = data.get('route')
+        if route is not None:
+            return route[0].__name__
+        handler = data.get('handler')
+        return handler.callback.__name__ if handler is not None else 'unknown'
+
+    async def __call__(self, handler, event, data):
+        """Middleware обновлений: время обработки, ошибки и доля ожидания Bot API."""
+        name = self.handler_name(data)
+        stats = self._handlers.get(name)
+        if stats is None:
+            stats = self._handlers[name] = _HandlerStats()
+        api_time = [0.0, True]
+        token = _api_time.set(api_time)
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.in_flight -= 1
+            # Отложенные задачи, созданные обработчиком, больше не учитываются в его времени
+            api_time[1] = False
+            _api_time.reset(token)
+            stats.latency.observe(elapsed)
+            stats.api_seconds += api_time[0]
+            stats.local_seconds += max(elapsed - api_time[0], 0.0)
+
+    async def request_middleware(self, make_request, bot, method):
+        """Middleware запросов бота: время ожидания Bot API текущего обновления."""
+        api_time = _api_time.get()
+        if api_time is None or not api_time[1]:
+            return await make_request(bot, method)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            api_time[0] += time.perf_counter() - started
+
+    def add_collector(self, collector):
+        """
+        Добавляет источник дополнительных метрик.
+
+        Args:
+            collector (Callable): Функция без аргументов, возвращающая пары (имя метрики без префикса, значение)
+                или тройки (имя, метки вида 'key="value"', значение). Метрики с именем на ``_total`` —
+                монотонные счётчики и экспортируются как counter, остальные — как gauge.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Возвращает все метрики в текстовом формате Prometheus.
+
+        Returns:
+            str: Текст для ответа на ``GET /metrics``.
+        """
+        prefix = self.prefix
+        lines = [
+            f'# HELP {prefix}_handler_duration_seconds Время обработки обновления обработчиком.',
+            f'# TYPE {prefix}_handler_duration_seconds histogram',
+        ]
+        handlers = sorted(self._handlers.items())
+        for name, stats in handlers:
+            lines += stats.latency.render(f'{prefix}_handler_duration_seconds', f'handler="{name}"')
+        for metric, attribute, description in (
+            ('handler_errors_total', 'errors', 'Число обновлений, завершившихся ошибкой.'),
+            ('handler_api_seconds_total', 'api_seconds', 'Время ожидания запросов к Bot API.'),
+            ('handler_local_seconds_total', 'local_seconds', 'Время работы обработчика без ожидания Bot API.'),
+        ):
+            lines.append(f'# HELP {prefix}_{metric} {description}')
+            lines.append(f'# TYPE {prefix}_{metric} counter')
+            for name, stats in handlers:
+                lines.append(f'{prefix}_{metric}{{handler="{name}"}} {getattr(stats, attribute)}')
+        lines.append(f'# HELP {prefix}_updates_in_flight Обновления, обрабатываемые сейчас.')
+        lines.append(f'# TYPE {prefix}_updates_in_flight gauge')
+        lines.append(f'{prefix}_updates_in_flight {self.in_flight}')
+        declared = set()
+        for collector in self._collectors:
+            for item in collector():
+                metric, value = f'{prefix}_{item[0]}', item[-1]
+                if metric not in declared:
+                    declared.add(metric)
+                    lines.append(f"# TYPE {metric} {'counter' if metric.endswith('_total') else 'gauge'}")
+                lines.append(f'{metric}{{{item[1]}}} {value}' if len(item) == 3 else f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+    async def _serve(self, request):
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+    async def start_server(self, host: str = '127.0.0.1', port: int = 9108):
+        """
+        Запускает HTTP-сервер метрик.
+
+        Args:
+            host (str): Адрес; по умолчанию только локальный.
+            port (int): Порт.
+        """
+        app = web.Application()
+        app.router.add_get('/metrics', self._serve)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info('Метрики доступны на http://%s:%s/metrics', host, port)
+
+    async def stop_server(self):
+        """Останавливает HTTP-сервер метрик."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,66 @@
+"""
+Middleware для роутера бота.
+
+``UserSerialMiddleware`` выполняет обновления одного пользователя строго по очереди,
+в порядке поступления: быстрые повторные нажатия "+"/"-" и оплата не перемешивают
+изменения корзины между ``await``. Обновления разных пользователей не ждут друг друга.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+from aiogram import BaseMiddleware
+
+
+class UserLocks:
+    """
+    Блокировки по ключу (ID пользователя).
+
+    Блокировка создаётся при первом обращении и удаляется, когда её никто не ждёт,
+    поэтому память занимают только пользователи, у которых сейчас обрабатываются обновления.
+    ``asyncio.Lock`` пропускает ожидающих в порядке очереди.
+    """
+
+    def __init__(self):
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, key):
+        """
+        Захватывает блокировку ключа на время блока ``async with``.
+
+        Args:
+            key: Ключ блокировки, например ID пользователя.
+        """
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class UserSerialMiddleware(BaseMiddleware):
+    """
+    Middleware, которое выполняет обработчики одного пользователя последовательно.
+
+    Подключается как outer middleware к ``router.message`` и ``router.callback_query``.
+    """
+
+    def __init__(self, locks: UserLocks = None):
+        self.locks = locks if locks is not None else UserLocks()
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+        async with self.locks.hold(user.id):
+            return await handler(event, data)
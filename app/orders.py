@@ -0,0 +1,327 @@
+"""
+Заказы: выдача номеров заказов и журнал оплаченных заказов.
+
+Номера берутся из счётчика в локальной базе SQLite. Каждый процесс арендует у счётчика
+блок номеров (по умолчанию 100) одной транзакцией и дальше выдаёт их из памяти,
+поэтому на каждый заказ обращений к базе нет. Аренда идёт в отдельном потоке, а
+следующий блок арендуется заранее, когда в текущем остаётся мало номеров: ожидание
+блокировки базы другими процессами не останавливает цикл событий. Номера уникальны
+между процессами и перезапусками и растут внутри процесса; после падения неиспользованный
+остаток блока (и заранее арендованный блок) пропускается.
+
+Оплаченные заказы записываются в журнал ``OrderSink``: обработчик кладёт запись в
+ограниченную очередь и сразу продолжает работу, а фоновая задача пачками дописывает
+записи в JSONL-файл и вызывает fsync после каждой пачки.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class OrderNumberAllocator:
+    """
+    Выдача уникальных номеров заказов блоками.
+
+    ``next()`` ждёт только аренды блока, а сам номер выдаёт без ``await``, поэтому два
+    одновременных платежа в одном цикле событий не могут получить одинаковый номер.
+    """
+
+    _SCHEMA = 'CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, next_value INTEGER NOT NULL)'
+
+    def __init__(self, path: str, name: str = 'orders', block_size: int = 100, low_water: int = None):
+        """
+        Args:
+            path (str): Путь к файлу базы со счётчиками.
+            name (str): Название счётчика.
+            block_size (int): Сколько номеров арендовать за одно обращение к базе.
+            low_water (int): При скольких оставшихся номерах арендовать следующий блок заранее
+                (по умолчанию пятая часть блока).
+        """
+        self.name = name
+        self.block_size = block_size
+        self.low_water = block_size // 5 if low_water is None else low_water
+        # Аренда выполняется в потоке, но не больше одной одновременно
+        self._connection = sqlite3.connect(path, isolation_level=None, timeout=30, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(self._SCHEMA)
+        self._next = 0
+        self._limit = 0
+        # Заранее арендованный блок (начало, конец) и задача аренды
+        self._spare = None
+        self._leasing = None
+
+    def _lease(self) -> tuple:
+        connection = self._connection
+        # BEGIN IMMEDIATE блокирует запись для других процессов до конца аренды
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT next_value FROM sequences WHERE name = ?', (self.name,)).fetchone()
+            start = row[0] if row else 1
+            connection.execute(
+                'INSERT INTO sequences (name, next_value) VALUES (?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET next_value = excluded.next_value',
+                (self.name, start + self.block_size)
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return start, start + self.block_size
+
+    def _start_lease(self) -> asyncio.Task:
+        # Завершённая аренда, чей колбэк ещё не выполнился, тоже требует новой:
+        # её блок уже забран, а ожидание готовой задачи не уступает цикл событий
+        if self._leasing is None or self._leasing.done():
+            self._leasing = asyncio.create_task(self._lease_spare())
+            self._leasing.add_done_callback(self._lease_done)
+        return self._leasing
+
+    async def _lease_spare(self):
+        self._spare = await asyncio.to_thread(self._lease)
+
+    def _lease_done(self, task: asyncio.Task):
+        if self._leasing is task:
+            self._leasing = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Не удалось арендовать номера заказов', exc_info=task.exception())
+
+    async def next(self) -> int:
+        """
+        Возвращает следующий номер заказа.
+
+        Returns:
+            int: Номер заказа.
+
+        Raises:
+            sqlite3.Error: Если блок номеров не удалось арендовать.
+        """
+        while self._next >= self._limit:
+            if self._spare is None:
+                # Заранее арендовать не успели — ждём аренды, одной на все ожидающие платежи
+                await asyncio.shield(self._start_lease())
+                continue
+            self._next, self._limit = self._spare
+            self._spare = None
+        number = self._next
+        self._next += 1
+        if self._spare is None and self._limit - self._next <= self.low_water:
+            self._start_lease()
+        return number
+
+    async def close(self):
+        """Дожидается начатой аренды и закрывает соединение с базой. Остаток блока не возвращается."""
+        if self._leasing is not None:
+            await asyncio.gather(self._leasing, return_exceptions=True)
+        self._connection.close()
+
+
+class OrderLine(NamedTuple):
+    """
+    Строка заказа.
+
+    Attributes:
+        product (str): Название товара.
+        quantity (int): Количество.
+        price (int): Цена за единицу в рублях.
+    """
+    product: str
+    quantity: int
+    price: int
+
+
+class OrderRecord(NamedTuple):
+    """
+    Оплаченный заказ.
+
+    Attributes:
+        number (int): Номер заказа.
+        user_id (int): ID покупателя.
+        customer_name (str): Имя покупателя.
+        lines (tuple): Строки заказа (OrderLine).
+        total (int): Общая стоимость в рублях.
+        created_at (float): Время оплаты, Unix time.
+        ready_in (float | None): Через сколько секунд после оплаты заказ будет готов (оценка кухни).
+        tickets (tuple): Талоны станций кухни (``app.kitchen.Ticket``).
+    """
+    number: int
+    user_id: int
+    customer_name: str
+    lines: tuple
+    total: int
+    created_at: float
+    ready_in: float = None
+    tickets: tuple = ()
+
+    @classmethod
+    def from_cart(cls, number: int, user_id: int, customer_name: str, lines: tuple, total: int = None):
+        """
+        Собирает заказ из строк корзины.
+
+        Args:
+            number (int): Номер заказа.
+            user_id (int): ID покупателя.
+            customer_name (str): Имя покупателя.
+            lines (tuple): Готовые строки заказа (``Cart.order_lines``).
+            total (int): Общая стоимость, если уже известна (``Cart.get_total_price``).
+
+        Returns:
+            OrderRecord: Заказ.
+        """
+        if total is None:
+            total = sum(line.quantity * line.price for line in lines)
+        return cls(number, user_id, customer_name, lines, total, time.time())
+
+    def to_json(self) -> str:
+        """Возвращает заказ одной строкой JSON."""
+        return json.dumps({
+            'number': self.number,
+            'user_id': self.user_id,
+            'customer_name': self.customer_name,
+            'lines': [line._asdict() for line in self.lines],
+            'total': self.total,
+            'created_at': self.created_at,
+            'ready_in': self.ready_in,
+            'tickets': [
+                {'station': ticket.station, 'items': [list(item) for item in ticket.items], 'ready_in': ticket.ready_in}
+                for ticket in self.tickets
+            ],
+        }, ensure_ascii=False)
+
+
+class OrderSink:
+    """
+    Асинхронный журнал заказов в JSONL-файле.
+
+    Запись на диск идёт в отдельном потоке, поэтому медленный диск не задерживает
+    другие обновления. Если очередь заполнена, ``submit`` ждёт освобождения места.
+
+    Заказ, который не удалось сериализовать, пропускается с записью в лог. Если фоновая
+    запись упала, она перезапускается. Заказы, которые не удалось записать до остановки
+    (``close`` с истёкшим ``timeout``), выводятся в лог целиком, чтобы их можно было восстановить.
+
+    Attributes:
+        written (int): Сколько заказов записано.
+        dropped (int): Сколько заказов не записано (ошибка сериализации или остановка).
+    """
+
+    def __init__(self, path: str, max_queue: int = 1000, batch_size: int = 100, retry_delay: float = 1.0):
+        """
+        Args:
+            path (str): Путь к файлу журнала.
+            max_queue (int): Размер очереди заказов, ожидающих записи.
+            batch_size (int): Сколько заказов записывать за один fsync.
+            retry_delay (float): Пауза перед повторной записью после ошибки, в секундах.
+        """
+        self.path = path
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.written = 0
+        self.dropped = 0
+        self._queue = None
+        self._file = None
+        self._writer = None
+        # Заказы, которые фоновая запись сейчас пишет
+        self._batch = []
+
+    def start(self):
+        """Открывает файл журнала и запускает фоновую запись."""
+        if self._writer is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._start_writer()
+
+    def _start_writer(self):
+        self._writer = asyncio.create_task(self._run())
+        self._writer.add_done_callback(self._writer_done)
+
+    def _writer_done(self, task: asyncio.Task):
+        if task.cancelled() or task is not self._writer:
+            return
+        logger.error('Запись журнала заказов %s остановилась, перезапуск', self.path, exc_info=task.exception())
+        self._log_unwritten()
+        self._start_writer()
+
+    def _log_unwritten(self):
+        for order in self._batch:
+            logger.error('Заказ %s не записан в журнал: %s', getattr(order, 'number', '?'), order)
+            self.dropped += 1
+        self._batch = []
+
+    async def submit(self, order: OrderRecord):
+        """
+        Ставит заказ в очередь на запись.
+
+        Args:
+            order (OrderRecord): Оплаченный заказ.
+        """
+        await self._queue.put(order)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                lines = []
+                self._batch = []
+                for order in batch:
+                    try:
+                        lines.append(order.to_json() + '\n')
+                    except Exception:
+                        logger.exception('Заказ %s пропущен: не удалось записать в JSON', getattr(order, 'number', '?'))
+                        self.dropped += 1
+                    else:
+                        self._batch.append(order)
+                while lines:
+                    try:
+                        await asyncio.to_thread(self._write, ''.join(lines))
+                        self.written += len(lines)
+                        break
+                    except OSError:
+                        logger.exception('Не удалось записать %s заказов в %s, повтор', len(lines), self.path)
+                        await asyncio.sleep(self.retry_delay)
+                self._batch = []
+            finally:
+                # Иначе close() ждал бы эти заказы вечно
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, data: str):
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def close(self, timeout: float = 30.0):
+        """
+        Дожидается записи всех заказов из очереди и закрывает файл.
+
+        Args:
+            timeout (float): Сколько секунд ждать записи, например при постоянной ошибке диска.
+                Не записанные за это время заказы выводятся в лог.
+        """
+        if self._writer is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error('Журнал заказов %s не записан за %s с', self.path, timeout)
+        writer, self._writer = self._writer, None
+        writer.cancel()
+        try:
+            await writer
+        except asyncio.CancelledError:
+            pass
+        # Запись, прерванная во время повтора, могла успеть дойти до файла — такой заказ окажется и в журнале
+        while not self._queue.empty():
+            self._batch.append(self._queue.get_nowait())
+            self._queue.task_done()
+        self._log_unwritten()
+        self._file.close()
@@ -0,0 +1,299 @@
+"""
+Планировщик исходящих запросов к Bot API.
+
+Все запросы бота проходят через ``OutboundScheduler`` — middleware сессии бота.
+Отправка новых сообщений (``send*``, ``copyMessage``, ``forwardMessage``) выпускается
+в сеть с учётом ограничений Telegram:
+- общий лимит бота (по умолчанию 30 сообщений в секунду);
+- лимит личного чата (1 сообщение в секунду с небольшим запасом на короткие серии);
+- лимит группы (20 сообщений в минуту).
+
+Ответы на нажатия и inline-запросы, изменение и удаление сообщений под эти лимиты
+не попадают и отправляются сразу: пользователь, нажавший кнопку, не ждёт очереди
+рассылок и чужих сообщений.
+
+Сообщения ждут своей очереди по приоритету: обычные сообщения (``REPLY``) раньше
+массовых рассылок (``BULK``), которые получают только оставшуюся пропускную способность.
+Если лимит чата исчерпан, сообщения в другие чаты не ждут. Ответ 429 на запрос в чат
+приостанавливает лимит этого чата на ``retry_after`` секунд — на это время задерживаются
+все запросы в этот чат, — и запрос повторяется. Общий лимит приостанавливается только
+ответом 429 на отправку без числового ``chat_id`` (например, в канал по имени); ответ
+на нажатие или inline-запрос после 429 просто повторяется через ``retry_after`` секунд.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, AnswerInlineQuery
+
+# Приоритеты: меньше — раньше
+REPLY = 0
+BULK = 1
+PRIORITY_NAMES = {REPLY: 'reply', BULK: 'bulk'}
+# Методы, отправляющие новые сообщения: только они расходуют лимиты
+_SENDING_PREFIXES = ('Send', 'Copy', 'Forward')
+
+# Приоритет, заданный обработчиком через OutboundScheduler.priority()
+_priority = contextvars.ContextVar('outbound_priority', default=None)
+
+
+class TokenBucket:
+    """
+    Ведро токенов: ``rate`` запросов в секунду, серия до ``capacity`` запросов.
+
+    Args:
+        rate (float): Скорость пополнения, токенов в секунду.
+        capacity (float): Размер ведра.
+    """
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Возвращает, сколько секунд ждать до следующего токена (0 — токен есть)."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float):
+        """Приостанавливает выдачу токенов после ответа 429."""
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+
+    def idle(self, now: float) -> bool:
+        """Ведро полное и не приостановлено — его можно удалить."""
+        return now >= self.paused_until and self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+class OutboundScheduler:
+    """
+    Приоритетная очередь исходящих сообщений с лимитами Telegram.
+
+    Сообщение ждёт в очереди только разрешения на отправку, а отправляется в задаче
+    обработчика, поэтому медленный ответ одного запроса не задерживает остальные.
+
+    Attributes:
+        sent (int): Сколько сообщений выпущено из очереди.
+        retries (int): Сколько раз запрос повторялся после ответа 429.
+        waited (dict): Приоритет -> суммарное ожидание в очереди, в секундах.
+        max_wait (dict): Приоритет -> наибольшее ожидание в очереди, в секундах.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 5.0,
+                 group_rate: float = 20 / 60, group_burst: float = 20.0, max_retries: int = 3):
+        """
+        Args:
+            global_rate (float): Общий лимит бота, сообщений в секунду.
+            chat_rate (float): Лимит личного чата, сообщений в секунду.
+            chat_burst (float): Сколько сообщений подряд можно отправить в личный чат.
+            group_rate (float): Лимит группы, сообщений в секунду.
+            group_burst (float): Сколько сообщений подряд можно отправить в группу.
+            max_retries (int): Сколько раз повторять запрос после ответа 429.
+        """
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.sent = 0
+        self.retries = 0
+        self.waited = dict.fromkeys(PRIORITY_NAMES, 0.0)
+        self.max_wait = dict.fromkeys(PRIORITY_NAMES, 0.0)
+        self._global = TokenBucket(global_rate, global_rate, time.monotonic())
+        self._chats = {}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._runner = None
+
+    @staticmethod
+    @contextmanager
+    def priority(value: int):
+        """
+        Задаёт приоритет запросов, отправленных внутри блока ``with``.
+
+        Args:
+            value (int): ``REPLY`` или ``BULK``.
+        """
+        token = _priority.set(value)
+        try:
+            yield
+        finally:
+            _priority.reset(token)
+
+    def start(self):
+        """Запускает выдачу разрешений. До запуска запросы отправляются без ограничений."""
+        if self._runner is None:
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Дожидается отправки запросов из очереди и останавливает планировщик."""
+        if self._runner is None:
+            return
+        while self._queue:
+            await asyncio.sleep(0.05)
+        self._runner.cancel()
+        try:
+            await self._runner
+        except asyncio.CancelledError:
+            pass
+        self._runner = None
+
+    def depth(self) -> dict:
+        """
+        Возвращает глубину очереди по приоритетам.
+
+        Returns:
+            dict: Название приоритета -> количество ожидающих запросов.
+        """
+        counts = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        for entry in self._queue:
+            if not entry[4].done():
+                counts[PRIORITY_NAMES[entry[0]]] += 1
+        return counts
+
+    async def __call__(self, make_request, bot, method):
+        if self._runner is None:
+            return await make_request(bot, method)
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None and not isinstance(method, (AnswerCallbackQuery, AnswerInlineQuery)):
+            # getUpdates, getMe и т.п. не относятся к чатам
+            return await make_request(bot, method)
+        if not isinstance(chat_id, int):
+            chat_id = None
+        # Ответы на нажатия, изменение и удаление сообщений лимиты не расходуют
+        sending = type(method).__name__.startswith(_SENDING_PREFIXES)
+        priority = _priority.get()
+        if priority is None:
+            priority = REPLY
+        attempt = 0
+        while True:
+            if sending:
+                await self._acquire(priority, chat_id)
+            else:
+                await self._wait_pause(chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as error:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                now = time.monotonic()
+                if chat_id is not None:
+                    # Ведро чата создаётся и для запросов, не расходующих лимиты, — чтобы не останавливать весь бот
+                    self._bucket(chat_id, now).pause(now, error.retry_after)
+                elif isinstance(method, (AnswerCallbackQuery, AnswerInlineQuery)):
+                    # Ответ не привязан к чату: ждёт только сам запрос
+                    await asyncio.sleep(error.retry_after)
+                else:
+                    self._global.pause(now, error.retry_after)
+
+    async def _wait_pause(self, chat_id):
+        # После ответа 429 ждут и запросы, не расходующие лимиты
+        now = time.monotonic()
+        bucket = self._chats.get(chat_id) if chat_id is not None else None
+        paused_until = max(self._global.paused_until, bucket.paused_until if bucket is not None else 0.0)
+        if paused_until > now:
+            await asyncio.sleep(paused_until - now)
+
+    async def _acquire(self, priority: int, chat_id):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), chat_id, time.monotonic(), future))
+        self._wakeup.set()
+        await future
+
+    def _bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= 10000:
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle(now)}
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst, now)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            wait = self._global.delay(now)
+            if not wait:
+                wait = self._release(now)
+            if wait:
+                await self._sleep(wait)
+
+    def _release(self, now: float) -> float:
+        # Выпускаем самый приоритетный запрос, чат которого не исчерпал лимит
+        blocked = []
+        wait = 0.0
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            priority, _, chat_id, queued_at, future = entry
+            if future.done():
+                continue
+            bucket = self._bucket(chat_id, now) if chat_id is not None else None
+            delay = bucket.delay(now) if bucket is not None else 0.0
+            if delay:
+                blocked.append(entry)
+                continue
+            if bucket is not None:
+                bucket.take()
+            self._global.take()
+            waited = now - queued_at
+            self.waited[priority] += waited
+            self.max_wait[priority] = max(self.max_wait[priority], waited)
+            self.sent += 1
+            future.set_result(None)
+            break
+        else:
+            wait = min((self._chats[entry[2]].delay(now) for entry in blocked), default=0.0)
+        for entry in blocked:
+            heapq.heappush(self._queue, entry)
+        return wait
+
+    async def _sleep(self, seconds: float):
+        # Новый запрос может быть приоритетнее или в другой чат — просыпаемся раньше
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=max(seconds, 0.001))
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> dict:
+        """
+        Возвращает показатели очереди.
+
+        Returns:
+            dict: Глубина очереди, число выпущенных запросов и повторов, ожидание по приоритетам.
+        """
+        return {
+            'depth': self.depth(),
+            'sent': self.sent,
+            'retries': self.retries,
+            'waited_seconds': {PRIORITY_NAMES[key]: value for key, value in self.waited.items()},
+            'max_wait_seconds': {PRIORITY_NAMES[key]: value for key, value in self.max_wait.items()},
+        }
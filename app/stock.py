@@ -0,0 +1,254 @@
+"""
+Учёт остатков блюд с резервированием под корзины.
+
+Остатки задаются по названиям блюд (например, сколько порций Том Ям приготовила кухня);
+блюда без остатка считаются неограниченными. Комплексный обед резервирует и свою
+порцию (если у него задан остаток), и по порции каждого блюда из состава.
+
+Добавление в корзину резервирует порции, уменьшение количества возвращает их,
+оплата списывает резерв с остатка. Проверка и резервирование выполняются одной
+синхронной функцией без ``await``, поэтому в цикле событий они атомарны, и общая
+блокировка не нужна: одновременные нажатия разных пользователей не могут
+зарезервировать одну и ту же последнюю порцию.
+
+Резерв пользователя, который ничего не делает ``hold`` секунд, снимается
+(таймеры — в ``TimerWheel``), а корзина остаётся: при оплате недостающие порции
+резервируются заново, и если их уже нет, оплата не проходит.
+
+Остатки хранятся в памяти процесса, поэтому ``app.workers`` с заданными остатками
+отказывается запускать больше одного процесса.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+
+from app.timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+
+def load_levels(path: str) -> dict:
+    """
+    Читает остатки из JSON-файла вида ``{"Том Ям": 40, ...}``.
+
+    Args:
+        path (str): Путь к файлу.
+
+    Returns:
+        dict: Название блюда -> количество порций. Пустой словарь, если файла нет.
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            return {name: int(quantity) for name, quantity in json.load(file).items()}
+    except FileNotFoundError:
+        return {}
+
+
+class StockLedger:
+    """
+    Остатки блюд и резервы пользователей.
+
+    Args:
+        catalog (Catalog): Каталог; из него берётся состав комплексных обедов.
+        levels (dict): Начальные остатки: название блюда -> количество порций.
+        hold (float): Через сколько секунд бездействия пользователя снимается его резерв.
+        tick (float): Точность таймеров резерва, в секундах.
+    """
+
+    def __init__(self, catalog, levels: dict = None, hold: float = 900.0, tick: float = 1.0):
+        self.catalog = catalog
+        self.hold = hold
+        self.stock = {}
+        self.reserved = {}
+        self.rejected = 0
+        self.expired = 0
+        # Пользователь -> Counter(блюдо -> зарезервированные порции)
+        self._holds = {}
+        self._requirements = {}
+        self._requirements_version = None
+        self._wheel = TimerWheel(time.monotonic(), tick)
+        self._task = None
+        self.restock(levels or {})
+
+    def restock(self, levels: dict):
+        """
+        Задаёт остатки заново, например на начало дня. Резервы пользователей сохраняются.
+
+        Args:
+            levels (dict): Название блюда -> количество порций (без учёта резервов).
+        """
+        self.stock = dict(levels)
+        self.reserved = {name: self.reserved.get(name, 0) for name in levels}
+        # Набор блюд с остатком изменился — состав требований нужно пересчитать
+        self._requirements = {}
+
+    def requirements(self, product: str) -> tuple:
+        """
+        Возвращает, сколько порций каких блюд с остатком занимает одна единица товара.
+
+        Args:
+            product (str): Название товара.
+
+        Returns:
+            tuple: Пары (название блюда, порций); пустой кортеж для неограниченного товара.
+        """
+        snapshot = self.catalog.snapshot
+        if snapshot.version != self._requirements_version:
+            self._requirements = {}
+            self._requirements_version = snapshot.version
+        requirements = self._requirements.get(product)
+        if requirements is None:
+            units = Counter((product,))
+            record = snapshot.products_by_name.get(product)
+            if record is not None:
+                units.update(name for name, _ in record.components)
+            requirements = self._requirements[product] = tuple(
+                (name, count) for name, count in units.items() if name in self.stock
+            )
+        return requirements
+
+    def available(self, item: str):
+        """Возвращает число свободных порций блюда или None, если остаток не ограничен."""
+        if item not in self.stock:
+            return None
+        return self.stock[item] - self.reserved[item]
+
+    def reserve(self, user_id: int, product: str, quantity: int = 1) -> bool:
+        """
+        Проверяет остатки и резервирует товар, всё или ничего.
+
+        Args:
+            user_id (int): ID пользователя.
+            product (str): Название товара.
+            quantity (int): Сколько единиц зарезервировать.
+
+        Returns:
+            bool: False, если какого-то блюда (или блюда из состава) не хватает; тогда ничего не резервируется.
+        """
+        requirements = self.requirements(product)
+        stock, reserved = self.stock, self.reserved
+        for item, units in requirements:
+            if stock[item] - reserved[item] < units * quantity:
+                self.rejected += 1
+                return False
+        if requirements:
+            holds = self._holds.get(user_id)
+            if holds is None:
+                holds = self._holds[user_id] = Counter()
+            for item, units in requirements:
+                reserved[item] += units * quantity
+                holds[item] += units * quantity
+            self._wheel.schedule(user_id, time.monotonic() + self.hold)
+        return True
+
+    def release(self, user_id: int, product: str, quantity: int = 1):
+        """
+        Возвращает в остаток резерв товара, например при уменьшении количества в корзине.
+
+        Args:
+            user_id (int): ID пользователя.
+            product (str): Название товара.
+            quantity (int): Сколько единиц вернуть.
+        """
+        holds = self._holds.get(user_id)
+        if holds is None:
+            return
+        for item, units in self.requirements(product):
+            # Резерв мог быть снят по таймеру или остатки заданы заново — не возвращаем больше, чем держали
+            returned = min(units * quantity, holds[item])
+            holds[item] -= returned
+            if item in self.reserved:
+                self.reserved[item] -= returned
+        if not +holds:
+            self._drop(user_id)
+
+    def release_all(self, user_id: int):
+        """Возвращает в остаток весь резерв пользователя, например после очистки корзины."""
+        holds = self._holds.get(user_id)
+        if holds is None:
+            return
+        for item, units in holds.items():
+            if item in self.reserved:
+                self.reserved[item] -= units
+        self._drop(user_id)
+
+    def _drop(self, user_id: int):
+        del self._holds[user_id]
+        self._wheel.cancel(user_id)
+
+    def checkout(self, user_id: int, lines: dict) -> dict:
+        """
+        Списывает с остатка всё содержимое корзины при оплате.
+
+        Порции, которые уже зарезервированы пользователем, списываются из резерва;
+        недостающие (резерв снят по таймеру, корзина пережила перезапуск) берутся
+        из свободного остатка. Если хотя бы одного блюда не хватает, ничего не списывается.
+
+        Args:
+            user_id (int): ID пользователя.
+            lines (dict): Содержимое корзины: название товара -> {'quantity': ..., 'price': ...}.
+
+        Returns:
+            dict: Блюда, которых не хватает: название -> сколько порций свободно. Пустой словарь — списано.
+        """
+        need = Counter()
+        for product, info in lines.items():
+            for item, units in self.requirements(product):
+                need[item] += units * info['quantity']
+        holds = self._holds.get(user_id) or Counter()
+        shortages = {}
+        for item, units in need.items():
+            free = self.stock[item] - self.reserved[item]
+            if units - holds[item] > free:
+                shortages[item] = free
+        if shortages:
+            self.rejected += 1
+            return shortages
+        for item, units in need.items():
+            held = min(holds[item], units)
+            self.reserved[item] -= held
+            self.stock[item] -= units
+            holds[item] -= held
+        # Резерв сверх корзины (например, после снятия товара без возврата) тоже возвращается
+        self.release_all(user_id)
+        return {}
+
+    def start(self):
+        """Запускает фоновое снятие просроченных резервов."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновое снятие просроченных резервов."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._wheel.tick)
+            for user_id in self._wheel.advance(time.monotonic()):
+                holds = self._holds.pop(user_id, None)
+                if holds is None:
+                    continue
+                for item, units in holds.items():
+                    if item in self.reserved:
+                        self.reserved[item] -= units
+                self.expired += 1
+
+    def metrics(self):
+        """Показатели остатков для ``HandlerMetrics.add_collector``."""
+        for item in sorted(self.stock):
+            label = 'item="{}"'.format(item.replace('\\', '\\\\').replace('"', '\\"'))
+            yield 'stock_available', label, self.stock[item] - self.reserved[item]
+            yield 'stock_reserved', label, self.reserved[item]
+        yield 'stock_holds', len(self._holds)
+        yield 'stock_rejected_total', self.rejected
+        yield 'stock_expired_holds_total', self.expired
@@ -0,0 +1,118 @@
+"""
+Иерархическое колесо таймеров.
+
+Таймеры раскладываются по уровням колеса: нижний уровень — слоты по одному тику,
+каждый следующий — слоты размером с полный оборот предыдущего. Когда нижний уровень
+делает оборот, слот верхнего уровня разбирается и его таймеры опускаются ниже.
+
+Постановка, перестановка и отмена таймера — O(1); ``advance`` обходит только слоты
+прошедших тиков, то есть стоит O(сработавших таймеров) плюс перенос между уровнями,
+без просмотра всех таймеров.
+"""
+
+import math
+
+
+class TimerWheel:
+    """
+    Колесо таймеров с ключами: у каждого ключа не больше одного таймера.
+
+    Args:
+        now (float): Текущее время (например, ``time.monotonic()``).
+        tick (float): Длительность тика, в секундах; точность срабатывания.
+        sizes (tuple): Количество слотов на каждом уровне.
+    """
+
+    def __init__(self, now: float, tick: float = 1.0, sizes: tuple = (64, 64, 64)):
+        self.tick = tick
+        self.sizes = sizes
+        self._levels = [[{} for _ in range(size)] for size in sizes]
+        self._spans = []
+        span = 1
+        for size in sizes:
+            self._spans.append(span)
+            span *= size
+        # Максимальная задержка в тиках
+        self.horizon = span - 1
+        self._where = {}
+        self._current = int(now / tick)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def schedule(self, key, when: float):
+        """
+        Ставит (или переставляет) таймер ключа.
+
+        Args:
+            key: Ключ таймера.
+            when (float): Время срабатывания в той же шкале, что и ``now``.
+        """
+        self.cancel(key)
+        # Округление вверх: таймер не срабатывает раньше срока, позже — не больше чем на тик
+        expires = math.ceil(when / self.tick)
+        if expires <= self._current:
+            # Слот текущего тика уже обработан
+            expires = self._current + 1
+        if expires - self._current > self.horizon:
+            raise ValueError(f'Задержка больше {self.horizon * self.tick} с не поддерживается')
+        self._place(key, expires)
+
+    def _place(self, key, expires: int):
+        delta = expires - self._current
+        for level, slots in enumerate(self._levels):
+            span = self._spans[level]
+            if delta < span * len(slots):
+                index = (expires // span) % len(slots)
+                slots[index][key] = expires
+                self._where[key] = (level, index)
+                return
+
+    def cancel(self, key) -> bool:
+        """
+        Отменяет таймер ключа.
+
+        Returns:
+            bool: False, если таймера не было.
+        """
+        location = self._where.pop(key, None)
+        if location is None:
+            return False
+        del self._levels[location[0]][location[1]][key]
+        return True
+
+    def advance(self, now: float) -> list:
+        """
+        Продвигает колесо до момента ``now`` и снимает сработавшие таймеры.
+
+        Args:
+            now (float): Текущее время.
+
+        Returns:
+            list: Ключи сработавших таймеров в порядке срабатывания.
+        """
+        target = int(now / self.tick)
+        expired = []
+        levels = self._levels
+        while self._current < target:
+            self._current += 1
+            current = self._current
+            # Начало оборота уровня: таймеры его слота опускаются на уровни ниже
+            for level in range(1, len(levels)):
+                span = self._spans[level]
+                if current % span:
+                    break
+                index = (current // span) % len(levels[level])
+                slot, levels[level][index] = levels[level][index], {}
+                for key, expires in slot.items():
+                    self._place(key, expires)
+            slot = levels[0][current % len(levels[0])]
+            if slot:
+                levels[0][current % len(levels[0])] = {}
+                for key in slot:
+                    del self._where[key]
+                expired.extend(slot)
+        return expired
@@ -0,0 +1,242 @@
+"""
+Режим работы через webhook.
+
+Telegram присылает обновления POST-запросами на локальный aiohttp-сервер (перед ним
+обычно стоит HTTPS-прокси). Сервер сразу отвечает 200 и передаёт обновление в ``UpdatePool``:
+- обновления обрабатывают ``workers`` задач, больше одновременно не выполняется;
+- у каждого пользователя своя очередь, его обновления обрабатываются строго по одному
+  и в порядке поступления, обновления разных пользователей — параллельно;
+- если в пуле ожидает ``max_pending`` обновлений и больше, навигационные нажатия
+  (открыть раздел, вернуться в корзину и т.п.) не ставятся в очередь: на них отвечаем
+  прямо в ответе на webhook подсказкой повторить позже. Сообщения и нажатия, которые
+  меняют корзину или оформляют заказ, принимаются всегда;
+- при остановке сервер перестаёт принимать обновления, пул дорабатывает очередь,
+  после чего выполняются обработчики остановки роутера.
+
+Запуск из корня репозитория:
+    BOT_TOKEN=... WEBHOOK_SECRET=... python -m app.webhook --url https://example.com/webhook --port 8080
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+from collections import deque
+
+from aiogram import Dispatcher
+from aiohttp import web
+
+from app.callback_data import unpack, EDIT, SECTION
+from app.workers import DEFAULT_BOT_PATH, create_bot, load_bot_module, update_user_id
+
+logger = logging.getLogger(__name__)
+
+# Нажатия, которые только перерисовывают экран
+NAVIGATION_CALLBACKS = frozenset(('redact_quantity', 'back_to_cart', 'selected_Перейти_в_корзину'))
+
+
+def is_cosmetic(update: dict) -> bool:
+    """
+    Проверяет, что обновление — навигационное нажатие, которое можно не обрабатывать при перегрузке.
+
+    Args:
+        update (dict): Обновление в формате Bot API.
+
+    Returns:
+        bool: True для открытия раздела, экрана количества и возврата к корзине.
+    """
+    callback = update.get('callback_query')
+    if callback is None:
+        return False
+    data = callback.get('data') or ''
+    unpacked = unpack(data)
+    if unpacked is not None:
+        return unpacked[0] in (SECTION, EDIT)
+    return data in NAVIGATION_CALLBACKS
+
+
+class UpdatePool:
+    """
+    Ограниченный пул обработки обновлений с очередью на каждого пользователя.
+
+    Args:
+        process (Callable): Корутина, обрабатывающая одно обновление (dict).
+        workers (int): Сколько обновлений обрабатывать одновременно.
+        max_pending (int): Сколько обновлений может ожидать, прежде чем начнётся отбрасывание навигации.
+    """
+
+    def __init__(self, process, workers: int = 64, max_pending: int = 1000):
+        self.process = process
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.accepted = 0
+        self.shed = 0
+        self._mailboxes = {}
+        self._ready = None
+        self._tasks = []
+
+    def start(self):
+        """Запускает задачи-обработчики."""
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def submit(self, update: dict) -> bool:
+        """
+        Ставит обновление в очередь его пользователя.
+
+        Args:
+            update (dict): Обновление в формате Bot API.
+
+        Returns:
+            bool: False, если обновление отброшено из-за перегрузки.
+        """
+        if self.pending >= self.max_pending and is_cosmetic(update):
+            self.shed += 1
+            return False
+        user_id = update_user_id(update)
+        key = user_id if user_id is not None else ('update', update['update_id'])
+        self.pending += 1
+        self.accepted += 1
+        mailbox = self._mailboxes.get(key)
+        if mailbox is not None:
+            # Пользователь уже в очереди или обрабатывается — обновление подождёт своей очереди
+            mailbox.append(update)
+            return True
+        self._mailboxes[key] = deque((update,))
+        self._ready.put_nowait(key)
+        return True
+
+    async def _work(self):
+        while True:
+            key = await self._ready.get()
+            mailbox = self._mailboxes[key]
+            update = mailbox.popleft()
+            try:
+                await self.process(update)
+            except Exception:
+                logger.exception('Ошибка при обработке обновления %s', update.get('update_id'))
+            finally:
+                self.pending -= 1
+                if mailbox:
+                    # Следующее обновление пользователя — в конец общей очереди, чтобы не занимать задачу
+                    self._ready.put_nowait(key)
+                else:
+                    del self._mailboxes[key]
+                self._ready.task_done()
+
+    async def drain(self, timeout: float = 30.0):
+        """
+        Дожидается обработки принятых обновлений и останавливает задачи-обработчики.
+
+        Args:
+            timeout (float): Сколько ждать, в секундах.
+        """
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error('За %s с не обработано %s обновлений, остановка', timeout, self.pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def metrics(self):
+        """Показатели пула для ``HandlerMetrics.add_collector``."""
+        yield 'webhook_pending_updates', self.pending
+        yield 'webhook_accepted_updates_total', self.accepted
+        yield 'webhook_shed_updates_total', self.shed
+
+
+def create_app(pool: UpdatePool, path: str = '/webhook', secret: str = None) -> web.Application:
+    """
+    Создаёт aiohttp-приложение, принимающее обновления.
+
+    Args:
+        pool (UpdatePool): Пул обработки обновлений.
+        path (str): Путь webhook.
+        secret (str): Секрет, который Telegram передаёт в ``X-Telegram-Bot-Api-Secret-Token``.
+
+    Returns:
+        web.Application: Приложение.
+    """
+
+    async def receive(request):
+        if secret is not None and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret:
+            return web.Response(status=401)
+        update = await request.json()
+        if pool.submit(update):
+            return web.Response()
+        # Ответ на нажатие прямо в ответе на webhook — без отдельного запроса к Bot API
+        return web.json_response({
+            'method': 'answerCallbackQuery',
+            'callback_query_id': update['callback_query']['id'],
+            'text': 'Много заказов, попробуйте ещё раз через пару секунд.',
+        })
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    return app
+
+
+async def _run(args):
+    token = os.environ['BOT_TOKEN']
+    secret = os.environ.get('WEBHOOK_SECRET')
+    module = load_bot_module(args.bot)
+    bot = create_bot(token, args.api_url)
+    dispatcher = Dispatcher()
+    dispatcher.include_router(module.router)
+
+    async def process(update: dict):
+        await dispatcher.feed_raw_update(bot, update)
+
+    pool = UpdatePool(process, args.workers, args.max_pending)
+    if hasattr(module, 'metrics'):
+        module.metrics.add_collector(pool.metrics)
+    await dispatcher.emit_startup(bot=bot, dispatcher=dispatcher)
+    pool.start()
+
+    runner = web.AppRunner(create_app(pool, args.path, secret), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    await bot.set_webhook(
+        args.url, secret_token=secret, allowed_updates=dispatcher.resolve_used_update_types(),
+        max_connections=args.max_connections,
+    )
+    logger.info('Webhook %s, сервер %s:%s%s', args.url, args.host, args.port, args.path)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    await stop.wait()
+
+    # Webhook не удаляется: обновления, пришедшие во время перезапуска, Telegram доставит позже
+    logger.info('Остановка: приём обновлений закрыт, в очереди %s', pool.pending)
+    await runner.cleanup()
+    await pool.drain(args.drain_timeout)
+    await dispatcher.emit_shutdown(bot=bot, dispatcher=dispatcher)
+    await bot.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запуск бота в режиме webhook')
+    parser.add_argument('--url', required=True, help='публичный адрес webhook для Telegram')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--path', default='/webhook')
+    parser.add_argument('--workers', type=int, default=64, help='сколько обновлений обрабатывать одновременно')
+    parser.add_argument('--max-pending', type=int, default=1000,
+                        help='с какой длины очереди отбрасывать навигационные нажатия')
+    parser.add_argument('--max-connections', type=int, default=40, help='соединений Telegram к webhook')
+    parser.add_argument('--drain-timeout', type=float, default=30.0, help='сколько дорабатывать очередь при остановке')
+    parser.add_argument('--bot', default=str(DEFAULT_BOT_PATH), help='файл модуля с обработчиками')
+    parser.add_argument('--api-url', default=None, help='адрес сервера Bot API')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run(args))
+
+
+if __name__ == '__main__':
+    main()
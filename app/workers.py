@@ -0,0 +1,326 @@
+"""
+Многопроцессный режим работы бота.
+
+Главный процесс получает обновления от Telegram и раздаёт их N процессам-обработчикам.
+Обновление попадает в процесс ``user_id % N``, поэтому все обновления одного пользователя
+обрабатывает один и тот же процесс в порядке поступления: кэш корзин ``SQLiteCartStorage``
+и ``UserSerialMiddleware`` работают так же, как в одном процессе.
+
+Каждый процесс загружает модуль с обработчиками (по умолчанию ``cafebot 3.py``) и свой
+``Dispatcher``. Каталог процессы читают из общего ``menu.json`` и только читают: файл
+меняет администратор, каждый процесс сам замечает изменение и подменяет снимок.
+Корзины лежат в общей базе SQLite, номера заказов выдаются блоками из общей базы
+счётчиков, журнал заказов у каждого процесса свой (``orders-<номер процесса>.jsonl``),
+метрики каждый процесс отдаёт на своём порту (``METRICS_PORT`` + номер процесса).
+Остатки блюд (``app.stock``) учитываются в памяти процесса, поэтому с заданными
+остатками (``STOCK_FILE``) больше одного процесса не запускается: каждый процесс
+продал бы весь остаток.
+
+Главный процесс следит за процессами-обработчиками и перезапускает упавшие.
+Обновления, которые упавший процесс успел забрать из очереди, теряются.
+
+Запуск из корня репозитория:
+    BOT_TOKEN=... python -m app.workers --workers 4
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from pathlib import Path
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+
+from app.stock import load_levels
+
+DEFAULT_BOT_PATH = Path(__file__).resolve().parent.parent / 'cafebot 3.py'
+
+logger = logging.getLogger(__name__)
+
+
+def update_user_id(update: dict):
+    """
+    Возвращает ID пользователя, от которого пришло обновление.
+
+    Args:
+        update (dict): Обновление в формате Bot API.
+
+    Returns:
+        int | None: ID пользователя или None, если в обновлении нет пользователя.
+    """
+    for key, value in update.items():
+        if key != 'update_id' and isinstance(value, dict):
+            user = value.get('from') or value.get('user')
+            if user:
+                return user['id']
+    return None
+
+
+def load_bot_module(path, name: str = 'cafebot'):
+    """
+    Загружает модуль с обработчиками по пути к файлу.
+
+    Args:
+        path (str | Path): Путь к файлу модуля, имя может содержать пробелы.
+        name (str): Имя модуля в ``sys.modules``.
+
+    Returns:
+        module: Загруженный модуль, в нём должен быть объект ``router``.
+    """
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_bot(token: str, api_url: str = None) -> Bot:
+    """
+    Создаёт бота, при необходимости с другим адресом Bot API.
+
+    Args:
+        token (str): Токен бота.
+        api_url (str): Адрес сервера Bot API, например локального.
+
+    Returns:
+        Bot: Бот.
+    """
+    if api_url is None:
+        return Bot(token)
+    return Bot(token, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+
+
+def _worker_main(index: int, bot_path: str, token: str, api_url, log_level, updates, processed):
+    logging.basicConfig(level=log_level, format=f'%(asctime)s worker-{index} %(levelname)s %(name)s: %(message)s')
+    # У каждого процесса свой журнал заказов: дозапись одного файла из нескольких процессов может перемешать строки
+    order_log = Path(os.environ.get('ORDER_LOG', 'orders.jsonl'))
+    os.environ['ORDER_LOG'] = str(order_log.with_name(f'{order_log.stem}-{index}{order_log.suffix}'))
+    # Сервер метрик каждого процесса слушает свой порт: METRICS_PORT + номер процесса
+    metrics_port = int(os.environ.get('METRICS_PORT', '9108') or 0)
+    if metrics_port:
+        os.environ['METRICS_PORT'] = str(metrics_port + index)
+    asyncio.run(_serve(index, bot_path, token, api_url, updates, processed))
+
+
+async def _serve(index: int, bot_path: str, token: str, api_url, updates, processed):
+    module = load_bot_module(bot_path)
+    bot = create_bot(token, api_url)
+    dispatcher = Dispatcher()
+    dispatcher.include_router(module.router)
+    loop = asyncio.get_running_loop()
+    incoming = asyncio.Queue()
+
+    def read_updates():
+        # Читаем очередь процесса в отдельном потоке и передаём в цикл событий пачками
+        while True:
+            batch = [updates.get()]
+            while batch[-1] is not None and not updates.empty():
+                batch.append(updates.get())
+            loop.call_soon_threadsafe(incoming.put_nowait, batch)
+            if batch[-1] is None:
+                return
+
+    async def process(update: dict):
+        try:
+            await dispatcher.feed_raw_update(bot, update)
+        except Exception:
+            logger.exception('Ошибка при обработке обновления %s', update.get('update_id'))
+        finally:
+            processed[index] += 1
+
+    await dispatcher.emit_startup(bot=bot, dispatcher=dispatcher)
+    threading.Thread(target=read_updates, name='update-reader', daemon=True).start()
+    tasks = set()
+    try:
+        running = True
+        while running:
+            for update in await incoming.get():
+                if update is None:
+                    running = False
+                    break
+                # Задачи создаются в порядке поступления, порядок для пользователя держит UserSerialMiddleware
+                task = asyncio.create_task(process(update))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+    finally:
+        await dispatcher.emit_shutdown(bot=bot, dispatcher=dispatcher)
+        await bot.session.close()
+
+
+class WorkerPool:
+    """
+    Процессы-обработчики с распределением обновлений по ``user_id``.
+
+    Args:
+        workers (int): Количество процессов.
+        token (str): Токен бота.
+        bot_path (str | Path): Файл модуля с обработчиками.
+        api_url (str): Адрес сервера Bot API; None — официальный сервер.
+        log_level (int): Уровень логирования в процессах-обработчиках.
+
+    Raises:
+        ValueError: Если процессов больше одного, а в ``STOCK_FILE`` заданы остатки.
+    """
+
+    def __init__(self, workers: int, token: str, bot_path=DEFAULT_BOT_PATH, api_url: str = None,
+                 log_level: int = logging.INFO):
+        stock_file = os.environ.get('STOCK_FILE', 'stock.json')
+        if workers > 1 and load_levels(stock_file):
+            raise ValueError(f'Остатки из {stock_file} учитываются в памяти процесса: '
+                             f'с ними нельзя запускать больше одного процесса')
+        self.workers = workers
+        self.token = token
+        self.bot_path = str(bot_path)
+        self.api_url = api_url
+        self.log_level = log_level
+        self.restarts = 0
+        # spawn: процесс не наследует цикл событий, потоки и соединения главного процесса
+        self._context = multiprocessing.get_context('spawn')
+        self.processed = self._context.Array('Q', workers, lock=False)
+        self._queues = [None] * workers
+        self._processes = [None] * workers
+        self._stopping = False
+
+    def start(self):
+        """Запускает все процессы-обработчики."""
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def _spawn(self, index: int):
+        # Очередь создаётся заново: упавший процесс мог оставить захваченной блокировку старой очереди
+        self._queues[index] = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self.bot_path, self.token, self.api_url, self.log_level, self._queues[index], self.processed),
+            name=f'bot-worker-{index}',
+        )
+        process.start()
+        self._processes[index] = process
+
+    def shard(self, update: dict) -> int:
+        """
+        Возвращает номер процесса для обновления.
+
+        Args:
+            update (dict): Обновление в формате Bot API.
+
+        Returns:
+            int: Номер процесса.
+        """
+        user_id = update_user_id(update)
+        key = user_id if user_id is not None else update['update_id']
+        return key % self.workers
+
+    def submit(self, update: dict):
+        """
+        Передаёт обновление процессу его пользователя. Не блокирует цикл событий.
+
+        Args:
+            update (dict): Обновление в формате Bot API.
+        """
+        self._queues[self.shard(update)].put(update)
+
+    def total_processed(self) -> int:
+        """Возвращает, сколько обновлений обработали все процессы."""
+        return sum(self.processed)
+
+    async def supervise(self, interval: float = 1.0):
+        """
+        Перезапускает упавшие процессы-обработчики, пока пул не остановлен.
+
+        Args:
+            interval (float): Период проверки, в секундах.
+        """
+        while not self._stopping:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self._processes):
+                if not self._stopping and not process.is_alive():
+                    lost = self._queues[index].qsize()
+                    logger.error('Процесс %s завершился с кодом %s, перезапуск (в очереди осталось %s обновлений)',
+                                 process.name, process.exitcode, lost)
+                    self.restarts += 1
+                    self._spawn(index)
+
+    def stop(self, timeout: float = 30.0):
+        """
+        Останавливает процессы после обработки уже переданных им обновлений.
+
+        Args:
+            timeout (float): Сколько ждать каждый процесс, в секундах.
+        """
+        self._stopping = True
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.error('Процесс %s не завершился за %s с, остановка', process.name, timeout)
+                process.terminate()
+                process.join()
+
+
+async def poll_updates(pool: WorkerPool, bot: Bot, timeout: int = 30):
+    """
+    Получает обновления long polling и раздаёт их процессам пула.
+
+    Args:
+        pool (WorkerPool): Пул процессов-обработчиков.
+        bot (Bot): Бот главного процесса.
+        timeout (int): Таймаут long polling, в секундах.
+    """
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=timeout)
+        except TelegramRetryAfter as error:
+            await asyncio.sleep(error.retry_after)
+            continue
+        except TelegramNetworkError:
+            logger.exception('Не удалось получить обновления, повтор')
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            pool.submit(update.model_dump(mode='json', by_alias=True, exclude_none=True))
+            offset = update.update_id + 1
+
+
+async def _run(args):
+    token = os.environ['BOT_TOKEN']
+    pool = WorkerPool(args.workers, token, args.bot, args.api_url)
+    pool.start()
+    bot = create_bot(token, args.api_url)
+    supervisor = asyncio.create_task(pool.supervise())
+    try:
+        await poll_updates(pool, bot)
+    finally:
+        supervisor.cancel()
+        await bot.session.close()
+        await asyncio.to_thread(pool.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запуск бота в нескольких процессах')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='количество процессов-обработчиков')
+    parser.add_argument('--bot', default=str(DEFAULT_BOT_PATH), help='файл модуля с обработчиками')
+    parser.add_argument('--api-url', default=None, help='адрес сервера Bot API')
+    args = parser.parse_args()
+    if args.workers > 1 and load_levels(os.environ.get('STOCK_FILE', 'stock.json')):
+        parser.error('остатки блюд (STOCK_FILE) учитываются в памяти процесса, запустите бота с --workers 1')
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Бенчмарк памяти корзин.
+
+Заполняет 100 000 корзин (от 1 до 5 строк из ``app/menu.json``) в ``MemoryCartStorage``
+(словарь словарей по названию товара) и в ``CompactCartStorage`` (массивы ID и количеств)
+и сравнивает занятую память по ``tracemalloc``.
+
+Запуск из корня репозитория:
+    python -m bench.cart_memory_bench [--carts 100000]
+"""
+
+import argparse
+import gc
+import random
+import tracemalloc
+
+from app.cart.storage import CompactCartStorage, MemoryCartStorage
+from app.catalog import Catalog
+
+
+def fill(storage, catalog, carts: int, seed: int):
+    rng = random.Random(seed)
+    products = list(catalog.snapshot.products.values())
+    for user_id in range(carts):
+        for record in rng.sample(products, rng.randint(1, 5)):
+            storage.set_line(user_id, record.name, rng.randint(1, 4), record.price)
+
+
+def measure(factory, catalog, carts: int, seed: int):
+    gc.collect()
+    tracemalloc.start()
+    storage = factory()
+    fill(storage, catalog, carts, seed)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return storage, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--carts', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    catalog = Catalog()
+
+    plain, plain_bytes = measure(MemoryCartStorage, catalog, args.carts, args.seed)
+    compact, compact_bytes = measure(lambda: CompactCartStorage(catalog), catalog, args.carts, args.seed)
+    # Обе раскладки должны описывать одни и те же корзины
+    for user_id in range(0, args.carts, max(1, args.carts // 1000)):
+        assert dict(compact.get(user_id).items()) == plain.get(user_id), user_id
+    lines = sum(len(lines) for lines in plain.carts.values())
+
+    print(f'корзин: {args.carts}, строк: {lines}')
+    print(f'{"раскладка":<28} {"МиБ":>8} {"байт/корзина":>13} {"байт/строка":>12}')
+    for name, used in (('dict по названию (memory)', plain_bytes), ('массивы ID (compact)', compact_bytes)):
+        print(f'{name:<28} {used / 2 ** 20:>8.1f} {used / args.carts:>13.0f} {used / lines:>12.0f}')
+    print(f'экономия: {plain_bytes / compact_bytes:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Микробенчмарк показа корзины.
+
+Сравнивает прежний показ корзины (каждый раз пересчитать сумму и заново отформатировать
+все строки) с ``Cart``, который обновляет строку и сумму при изменении. Измеряется
+типичный цикл обработчика: добавить товар (или изменить количество) и показать корзину,
+плюс чтение общей стоимости перед оплатой, для корзин разного размера.
+
+Запуск из корня репозитория:
+    python -m bench.cart_render_bench
+"""
+
+import timeit
+
+from app.cart.service import Cart
+from app.cart.storage import MemoryCartStorage
+
+SIZES = [10, 100, 1000, 10000]
+USER_ID = 1
+
+
+def show_full(lines: dict) -> str:
+    """Прежний ``Cart.show``: все строки и сумма заново на каждый вызов."""
+    if not lines:
+        return 'Ваша корзина пуста.'
+    items = '\n'.join(
+        f"- {product}: {info['quantity']} шт. x {info['price']} руб = {info['quantity'] * info['price']} руб"
+        for product, info in lines.items()
+    )
+    total = sum(info['quantity'] * info['price'] for info in lines.values())
+    return f'Ваша корзина:\n{items}\nОбщая стоимость: {total} руб'
+
+
+def build(size: int) -> Cart:
+    cart = Cart(MemoryCartStorage())
+    for index in range(size):
+        cart.add(USER_ID, f'Товар {index}', 100 + index)
+    return cart
+
+
+def main():
+    print(f"{'строк':>6} {'прежний, мкс':>14} {'инкрементный, мкс':>18} {'ускорение':>10}")
+    for size in SIZES:
+        cart = build(size)
+        storage = cart.storage
+        products = [f'Товар {index}' for index in range(size)]
+        number = max(20, 200000 // size)
+        counter = iter(range(10 ** 9))
+
+        def full_cycle():
+            product = products[next(counter) % size]
+            cart.edit_quantity(USER_ID, product, 1)
+            show_full(storage.get(USER_ID))
+            sum(info['quantity'] * info['price'] for info in storage.get(USER_ID).values())
+
+        def incremental_cycle():
+            product = products[next(counter) % size]
+            cart.edit_quantity(USER_ID, product, 1)
+            cart.show(USER_ID)
+            cart.get_total_price(USER_ID)
+
+        assert cart.show(USER_ID) == show_full(storage.get(USER_ID))
+        full = min(timeit.repeat(full_cycle, number=number, repeat=3)) / number * 1e6
+        incremental = min(timeit.repeat(incremental_cycle, number=number, repeat=3)) / number * 1e6
+        assert cart.show(USER_ID) == show_full(storage.get(USER_ID))
+        print(f'{size:>6} {full:>14.1f} {incremental:>18.1f} {full / incremental:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""
+Нагрузочная проверка последовательной обработки корзин.
+
+Загружает настоящий ``router`` из ``cafebot 3.py`` и подаёт в ``Dispatcher.feed_update``
+тысячи одновременных нажатий "добавить", "+", "-" и "оплатить" от нескольких сотен
+пользователей — работают сами обработчики ``handle_product_selection``,
+``increase_quantity_handler``, ``decrease_quantity_handler`` и ``pay_cart_handler``.
+Запросы бота уходят на локальный сервер-заглушку Bot API (``bench.fake_bot_api``)
+с задержкой ``--latency``, поэтому между ``await`` обработчиков одного пользователя
+успевают прийти его следующие нажатия. Номера заказов выдаются блоками по одному:
+каждая оплата ждёт аренды номера в отдельном потоке между чтением корзины и её
+очисткой — именно такое чередование предотвращает ``UserSerialMiddleware``.
+
+Каждое хранилище корзин (по умолчанию SQLite, как в боте, и память) проверяется дважды.
+Без ``UserSerialMiddleware`` должны найтись потерянные нажатия (корзины или заказы,
+не совпавшие с последовательным порядком) — иначе проверка ничего не доказывает.
+С ``UserSerialMiddleware`` проверяется:
+- ни одно обновление не завершилось исключением;
+- итоговая корзина каждого пользователя совпадает с последовательным применением его
+  нажатий в порядке поступления; в хранилище нет строк с неположительным количеством
+  и строк пользователей, у которых корзина должна быть пуста;
+- в журнал заказов записан каждый оплаченный заказ с тем содержимым, которое было
+  в корзине к моменту нажатия "оплатить" при последовательной обработке;
+- обновления разных пользователей выполнялись параллельно;
+- после завершения не осталось блокировок.
+
+Запуск из корня репозитория (нужен полный набор модулей бота, включая ``app.keyboard``):
+    python -m bench.cart_stress [--users 300] [--taps 20000] [--storage sqlite memory]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from aiogram import Dispatcher
+from aiogram.types import Update
+
+from app.callback_data import pack, SELECT, INCREASE, DECREASE
+from app.cart.service import Cart
+from app.cart.storage import create_storage
+from app.orders import OrderNumberAllocator
+from app.workers import DEFAULT_BOT_PATH, create_bot, load_bot_module
+from bench.fake_bot_api import FakeBotAPI
+
+TOKEN = '42:STRESS'
+STORAGES = {'sqlite': 'sqlite:///carts.sqlite3', 'memory': 'memory'}
+ACTIONS = [SELECT, SELECT, INCREASE, DECREASE, DECREASE, 'pay_cart']
+
+
+def apply(lines: Counter, action: str, product: str, orders: list):
+    """Применяет нажатие к эталонной корзине — последовательная обработка."""
+    if action == 'pay_cart':
+        if lines:
+            orders.append(Counter(lines))
+        lines.clear()
+    elif action == SELECT:
+        lines[product] += 1
+    elif product in lines:
+        lines[product] += 1 if action == INCREASE else -1
+        if not lines[product]:
+            del lines[product]
+
+
+def make_update(user_id: int, update_id: int, data: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+    # Все нажатия приходят с одного сообщения бота, которое обработчики перерисовывают
+    message = {'message_id': 1, 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'}, 'text': '…',
+               'from': {'id': 42, 'is_bot': True, 'first_name': 'Stress'}}
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'from': user, 'chat_instance': str(user_id), 'message': message, 'data': data,
+    }}
+
+
+async def run(storage: str, serial: bool, args) -> bool:
+    os.environ['CART_STORAGE'] = STORAGES[storage]
+    server = FakeBotAPI(latency=args.latency)
+    await server.start()
+    module = load_bot_module(args.bot)
+    bot = create_bot(TOKEN, server.url)
+    dispatcher = Dispatcher()
+    dispatcher.include_router(module.router)
+    if not serial:
+        module.router.message.outer_middleware.unregister(module.user_serial)
+        module.router.callback_query.outer_middleware.unregister(module.user_serial)
+    # Каждая оплата арендует номер в потоке (без аренды заранее) — await между чтением корзины и её очисткой
+    await module.order_numbers.close()
+    module.order_numbers = OrderNumberAllocator('orders.sqlite3', block_size=1, low_water=-1)
+
+    active = max_active = 0
+
+    async def count_active(handler, event, data):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        try:
+            return await handler(event, data)
+        finally:
+            active -= 1
+
+    # Внутреннее middleware выполняется после UserSerialMiddleware — считаются работающие обработчики
+    module.router.callback_query.middleware(count_active)
+
+    rng = random.Random(args.seed)
+    products = [product for product in module.catalog.snapshot.products.values() if not product.components][:4]
+    taps = [
+        (rng.randrange(args.users), rng.choice(ACTIONS), rng.choice(products))
+        for _ in range(args.taps)
+    ]
+    updates = [
+        Update.model_validate(
+            make_update(10 ** 6 + user, update_id, action if action == 'pay_cart' else pack(action, product.id)),
+            context={'bot': bot}
+        )
+        for update_id, (user, action, product) in enumerate(taps, start=1)
+    ]
+
+    await dispatcher.emit_startup(bot=bot, dispatcher=dispatcher)
+    started = time.perf_counter()
+    # Задачи создаются в порядке поступления нажатий, как при обработке обновлений в aiogram
+    results = await asyncio.gather(
+        *(dispatcher.feed_update(bot, update) for update in updates), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+    errors = [result for result in results if isinstance(result, BaseException)]
+    # Журнал заказов и корзины дописываются при остановке
+    await dispatcher.emit_shutdown(bot=bot, dispatcher=dispatcher)
+    await bot.session.close()
+    await server.stop()
+
+    expected, expected_orders = {}, {}
+    for user, action, product in taps:
+        apply(expected.setdefault(10 ** 6 + user, Counter()), action, product.name,
+              expected_orders.setdefault(10 ** 6 + user, []))
+
+    # Корзины читаются заново из хранилища, в котором их оставил бот
+    carts = Cart(create_storage(STORAGES[storage], module.catalog)) if storage == 'sqlite' else module.cart
+    mismatched = invalid = 0
+    for user_id, lines in expected.items():
+        stored = carts.get(user_id)
+        if any(info['quantity'] <= 0 for info in stored.values()):
+            invalid += 1
+        if Counter({product: info['quantity'] for product, info in stored.items()}) != lines:
+            mismatched += 1
+
+    orders = {}
+    with open(os.environ['ORDER_LOG'], encoding='utf-8') as file:
+        for line in file:
+            order = json.loads(line)
+            orders.setdefault(order['user_id'], []).append(
+                Counter({item['product']: item['quantity'] for item in order['lines']})
+            )
+    wrong_orders = sum(orders.get(user_id, []) != paid for user_id, paid in expected_orders.items())
+
+    print(f'хранилище: {storage}, UserSerialMiddleware: {"да" if serial else "нет"}')
+    print(f'нажатий: {len(taps)}, пользователей: {args.users}, время: {elapsed:.2f} с')
+    print(f'исключений в обработчиках: {len(errors)}')
+    for error in errors[:3]:
+        print('  пример:', repr(error))
+    print(f'одновременно выполнялось обработчиков (максимум): {max_active}')
+    print(f'корзин, не совпавших с последовательным порядком: {mismatched}, строк с количеством <= 0: {invalid}')
+    print(f'заказов: {sum(map(len, orders.values()))}, пользователей с неверными заказами: {wrong_orders}')
+    print(f'оставшихся блокировок: {len(module.user_serial.locks)}')
+
+    if serial:
+        ok = not errors and not mismatched and not invalid and not wrong_orders and max_active > 1 \
+            and not len(module.user_serial.locks)
+    else:
+        # Без последовательной обработки нажатия должны теряться, иначе нагрузка не создаёт гонок
+        ok = bool(mismatched or wrong_orders)
+    print('OK' if ok else 'FAIL')
+    print()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--taps', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.005, help='задержка ответа Bot API, с')
+    parser.add_argument('--storage', nargs='+', choices=STORAGES, default=list(STORAGES), help='хранилища корзин')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--bot', default=str(DEFAULT_BOT_PATH), help='файл модуля с обработчиками')
+    args = parser.parse_args()
+    args.bot = str(Path(args.bot).resolve())
+    logging.basicConfig(level=logging.ERROR)
+    # Корзины, номера и журнал заказов, остальные базы бота — во временном каталоге
+    os.environ.update(METRICS_PORT='', ORDER_LOG='orders.jsonl', STOCK_FILE='stock.json')
+    ok = True
+    for storage in args.storage:
+        for serial in (False, True):
+            with tempfile.TemporaryDirectory() as workdir:
+                os.chdir(workdir)
+                ok = asyncio.run(run(storage, serial, args)) and ok
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
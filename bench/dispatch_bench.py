@@ -0,0 +1,106 @@
+"""
+Бенчмарк маршрутизации callback-запросов.
+
+Сравнивает линейную цепочку фильтров (``F.data == ...``, ``F.data.startswith(...)``, ``ProductFilter``,
+затем по фильтру на каждый раздел меню — в порядке регистрации в ``cafebot 3.py``)
+с ``CallbackDispatcher``, настроенным как в ``cafebot 3.py`` (точные значения, компактные
+коды действий и таблица псевдонимов старых значений), при росте меню. На каждые четыре
+товара приходится один раздел, измеряется среднее время поиска обработчика для нажатия
+на товар и на последний раздел — старыми значениями callback_data и компактными.
+
+Запуск из корня репозитория:
+    python -m bench.dispatch_bench
+"""
+
+import timeit
+from types import SimpleNamespace
+
+from aiogram import F
+
+from app.callback_data import pack, SELECT, EDIT, INCREASE, DECREASE, SECTION
+from app.dispatch import CallbackDispatcher
+
+STATIC = ['redact_quantity', 'pay_cart', 'clear_cart', 'confirm_clear_cart', 'back_to_cart']
+PREFIXES = ['edit_', 'increase_', 'decrease_']
+
+
+async def _noop(callback, **kwargs):
+    pass
+
+
+def build_chain(products: list, sections: list) -> list:
+    """Строит линейную цепочку фильтров в порядке регистрации обработчиков."""
+    products_set = set(products)
+
+    def product_filter(callback):
+        data = callback.data
+        if data.startswith('selected_'):
+            return data[len('selected_'):].replace('_', ' ') in products_set
+        return False
+
+    chain = [(F.data == value).resolve for value in STATIC]
+    chain += [F.data.startswith(prefix).resolve for prefix in PREFIXES]
+    chain.append(product_filter)
+    chain += [(F.data == f'selected_{section}').resolve for section in sections]
+    return chain
+
+
+def chain_resolve(chain: list, callback):
+    for flt in chain:
+        if flt(callback):
+            return flt
+    return None
+
+
+def build_dispatcher(products: list, sections: list) -> CallbackDispatcher:
+    """Строит таблицу так же, как ``cafebot 3.py``: товары и разделы по id, старые значения — псевдонимы."""
+    aliases = {}
+    for product_id, name in enumerate(products):
+        aliases[f"selected_{name.replace(' ', '_')}"] = pack(SELECT, product_id)
+        aliases[f"edit_{name.replace(' ', '_')}"] = pack(EDIT, product_id)
+        aliases[f'increase_{name}'] = pack(INCREASE, product_id)
+        aliases[f'decrease_{name}'] = pack(DECREASE, product_id)
+    for section_id, section in enumerate(sections):
+        aliases[f'selected_{section}'] = pack(SECTION, section_id)
+    dispatcher = CallbackDispatcher()
+    dispatcher.aliases(aliases.get)
+    dispatcher.exact(*STATIC)(_noop)
+    for code, table, name in ((SELECT, products, 'product'), (EDIT, products, 'product'),
+                              (INCREASE, products, 'product'), (DECREASE, products, 'product'),
+                              (SECTION, sections, 'section')):
+        dispatcher.action(code, lambda item_id, table=table: table[item_id] if item_id < len(table) else None, name)(
+            _noop
+        )
+    return dispatcher
+
+
+def main():
+    print(f"{'товаров':>8} {'цепочка, мкс':>14} {'таблица, мкс':>14} {'компактные, мкс':>16}")
+    for size in (32, 320, 3200):
+        products = [f'Блюдо {i}' for i in range(size)]
+        sections = [f'Раздел_{i}' for i in range(size // 4)]
+        taps = [
+            SimpleNamespace(data=f'selected_Блюдо_{size - 1}'),
+            SimpleNamespace(data=f'selected_{sections[-1]}'),
+        ]
+        compact = [pack(SELECT, size - 1), pack(SECTION, len(sections) - 1)]
+        # Цепочка на больших меню медленная — уменьшаем число повторов
+        number = max(100, 320000 // size)
+        chain = build_chain(products, sections)
+        dispatcher = build_dispatcher(products, sections)
+        for callback in taps:
+            assert chain_resolve(chain, callback) is not None
+            assert dispatcher.resolve(callback.data) is not None
+        for data in compact:
+            assert dispatcher.resolve(data) is not None
+
+        chain_time = timeit.timeit(lambda: [chain_resolve(chain, c) for c in taps], number=number)
+        table_time = timeit.timeit(lambda: [dispatcher.resolve(c.data) for c in taps], number=number)
+        compact_time = timeit.timeit(lambda: [dispatcher.resolve(data) for data in compact], number=number)
+        per_update = number * len(taps)
+        print(f'{size:>8} {chain_time / per_update * 1e6:>14.3f} {table_time / per_update * 1e6:>14.3f} '
+              f'{compact_time / per_update * 1e6:>16.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Локальный сервер, изображающий Bot API, для нагрузочных тестов.
+
+Принимает запросы aiogram по адресу ``/bot<token>/<method>`` и сразу отвечает успехом:
+методы ``send*`` возвращают сообщение, ``getMe`` — бота, остальные — ``true``.
+``getUpdates`` отдаёт обновления, добавленные через ``push_update``, и ждёт новых
+до таймаута long polling, как настоящий сервер. Считает вызовы по методам и может
+добавлять задержку, чтобы изображать сеть.
+
+Подключение бота:
+    Bot(token, session=AiohttpSession(api=TelegramAPIServer.from_base(server.url)))
+"""
+
+import asyncio
+import itertools
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+
+class FakeBotAPI:
+    """
+    Сервер-заглушка Bot API.
+
+    Args:
+        host (str): Адрес для прослушивания.
+        port (int): Порт; 0 — выбрать свободный.
+        latency (float): Задержка ответа, в секундах.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+        self._update_ids = itertools.count(1)
+        self._updates = deque()
+        self._arrived = asyncio.Event()
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self):
+        """Запускает сервер в текущем цикле событий."""
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Останавливает сервер."""
+        await self._runner.cleanup()
+
+    def push_update(self, update: dict) -> int:
+        """
+        Добавляет обновление для ``getUpdates``.
+
+        Args:
+            update (dict): Обновление без ``update_id``, например ``{'message': {...}}``.
+
+        Returns:
+            int: Присвоенный ``update_id``.
+        """
+        update_id = next(self._update_ids)
+        self._updates.append({'update_id': update_id, **update})
+        self._arrived.set()
+        return update_id
+
+    async def _get_updates(self, params) -> list:
+        if not self._updates:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get('limit') or 100)
+        return [self._updates.popleft() for _ in range(min(limit, len(self._updates)))]
+
+    async def _handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = await request.post()
+        if method == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self._get_updates(params)})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == 'getMe':
+            result = {'id': 42, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif method.lower().startswith('send'):
+            self._message_id += 1
+            chat_id = int(params.get('chat_id', 0))
+            result = {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
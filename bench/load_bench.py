@@ -0,0 +1,194 @@
+"""
+Сквозной нагрузочный тест бота.
+
+Поднимает локальный сервер-заглушку Bot API (``bench.fake_bot_api``), запускает настоящий
+``router`` из ``cafebot 3.py`` через ``Dispatcher.start_polling`` и подаёт в ``getUpdates``
+синтетические сессии пользователей: /start → "Меню" → раздел → добавление товаров →
+изменение количества → оплата. Пользователи начинают сессии равномерно в течение
+``--ramp`` секунд и делают паузу ``--think`` секунд между нажатиями.
+
+Выводит пропускную способность (обновлений в секунду) и задержку обработки обновления
+(p50/p95/p99, от входа в диспетчер до выхода из обработчика) и сохраняет результат в JSON
+для сравнения версий.
+
+По умолчанию лимиты Telegram в ``OutboundScheduler`` сняты, чтобы измерять сам бот;
+``--rate-limits`` оставляет их.
+
+Запуск из корня репозитория (нужен полный набор модулей бота, включая ``app.keyboard``):
+    python -m bench.load_bench [--users 500] [--output load_bench.json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from aiogram import Dispatcher
+
+from app.callback_data import pack, SELECT, EDIT, INCREASE, DECREASE, SECTION
+from app.outbound import OutboundScheduler
+from app.workers import DEFAULT_BOT_PATH, create_bot, load_bot_module
+from bench.fake_bot_api import FakeBotAPI
+
+TOKEN = '42:BENCH'
+# Основное меню → Суп / Салат, товары супов 0–3 и салатов 4–7
+SECTIONS = [(2, range(0, 4)), (3, range(4, 8))]
+
+
+def session_steps(rng: random.Random) -> list:
+    """Возвращает нажатия одной сессии: ('message', текст) или ('callback', callback_data)."""
+    section, products = rng.choice(SECTIONS)
+    chosen = rng.sample(list(products), rng.randint(1, 3))
+    steps = [('message', '/start'), ('message', 'Меню'),
+             ('callback', pack(SECTION, 1)), ('callback', pack(SECTION, section))]
+    for product in chosen:
+        steps += [('callback', pack(SELECT, product))] * rng.randint(1, 2)
+    steps += [('callback', 'redact_quantity'), ('callback', pack(EDIT, chosen[0]))]
+    steps += [('callback', pack(INCREASE, chosen[0]))] * rng.randint(1, 4)
+    steps += [('callback', pack(DECREASE, chosen[0])), ('callback', 'back_to_cart'), ('callback', 'pay_cart')]
+    return steps
+
+
+def make_update(user_id: int, kind: str, value: str, step: int) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+    chat = {'id': user_id, 'type': 'private'}
+    if kind == 'message':
+        return {'message': {'message_id': step, 'date': int(time.time()), 'chat': chat, 'from': user, 'text': value}}
+    # Все нажатия сессии приходят с одного сообщения бота, которое обработчики перерисовывают
+    message = {'message_id': 1, 'date': int(time.time()), 'chat': chat, 'text': '…',
+               'from': {'id': 42, 'is_bot': True, 'first_name': 'Bench'}}
+    return {'callback_query': {
+        'id': f'{user_id}-{step}', 'from': user, 'chat_instance': str(user_id), 'message': message, 'data': value,
+    }}
+
+
+async def user_session(server: FakeBotAPI, user_id: int, start_delay: float, think: float, rng: random.Random) -> int:
+    await asyncio.sleep(start_delay)
+    steps = session_steps(rng)
+    for step, (kind, value) in enumerate(steps, start=1):
+        server.push_update(make_update(user_id, kind, value, step))
+        await asyncio.sleep(rng.uniform(0.5, 1.5) * think)
+    return len(steps)
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+async def run(args) -> dict:
+    server = FakeBotAPI(latency=args.api_latency)
+    await server.start()
+    module = load_bot_module(args.bot)
+    if not args.rate_limits:
+        unlimited = float('inf')
+        module.outbound = OutboundScheduler(global_rate=1e9, chat_rate=1e9, chat_burst=unlimited,
+                                            group_rate=1e9, group_burst=unlimited)
+    bot = create_bot(TOKEN, server.url)
+    dispatcher = Dispatcher()
+    dispatcher.include_router(module.router)
+
+    latencies = []
+    errors = 0
+
+    async def measure(handler, event, data):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            errors += 1
+            raise
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    dispatcher.update.outer_middleware(measure)
+    polling = asyncio.create_task(dispatcher.start_polling(bot, handle_signals=False, polling_timeout=1))
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    sessions = [
+        user_session(server, 10 ** 6 + index, rng.uniform(0, args.ramp), args.think, random.Random(rng.random()))
+        for index in range(args.users)
+    ]
+    total = sum(await asyncio.gather(*sessions))
+    while len(latencies) < total:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    # Отложенные изменения клавиатур и журнал заказов дописываются при остановке
+    await dispatcher.stop_polling()
+    await polling
+    await server.stop()
+
+    milliseconds = [value * 1000 for value in latencies]
+    return {
+        'revision': git_revision(),
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'updates': total,
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 3),
+        'updates_per_second': round(total / elapsed, 1),
+        'latency_ms': {
+            'mean': round(statistics.fmean(milliseconds), 3),
+            'p50': round(percentile(milliseconds, 0.50), 3),
+            'p95': round(percentile(milliseconds, 0.95), 3),
+            'p99': round(percentile(milliseconds, 0.99), 3),
+            'max': round(max(milliseconds), 3),
+        },
+        'api_calls': dict(server.calls),
+        'suppressed_edits': module.edit_fingerprints.suppressed,
+        'coalesced_edits': module.edits.requested - module.edits.sent,
+        'outbound_max_wait_seconds': {
+            priority: round(seconds, 3) for priority, seconds in module.outbound.stats()['max_wait_seconds'].items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500, help='количество сессий пользователей')
+    parser.add_argument('--ramp', type=float, default=5.0, help='за сколько секунд стартуют все сессии')
+    parser.add_argument('--think', type=float, default=0.2, help='средняя пауза между нажатиями, с')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='задержка ответа Bot API, с')
+    parser.add_argument('--rate-limits', action='store_true', help='оставить лимиты Telegram в OutboundScheduler')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--bot', default=str(DEFAULT_BOT_PATH), help='файл модуля с обработчиками')
+    parser.add_argument('--output', default='load_bench.json', help='куда сохранить результат (JSON)')
+    args = parser.parse_args()
+    output = Path(args.output).resolve()
+    logging.basicConfig(level=logging.WARNING)
+
+    # Базы корзин, номеров заказов и журнал заказов — во временном каталоге
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        # Сервер метрик на свободном порту, чтобы не мешать запущенному боту
+        os.environ.setdefault('METRICS_PORT', '0')
+        result = asyncio.run(run(args))
+
+    latency = result['latency_ms']
+    print(f"обновлений: {result['updates']} за {result['elapsed_seconds']} с, "
+          f"{result['updates_per_second']} обн/с, ошибок: {result['errors']}")
+    print(f"задержка, мс: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"запросы к Bot API: {result['api_calls']}")
+    print(f"наибольшее ожидание в очереди сообщений, с: {result['outbound_max_wait_seconds']}")
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f'результат сохранён в {output}')
+
+
+if __name__ == '__main__':
+    main()
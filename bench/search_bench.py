@@ -0,0 +1,116 @@
+"""
+Бенчмарк нечёткого поиска по меню.
+
+Собирает синтетический каталог (по умолчанию 10 000 товаров: названия и описания
+из случайных русских "слов" и слов настоящего ``app/menu.json``), строит ``MenuSearch``
+и измеряет время запроса: точное название, название с опечаткой, начало слова
+и слово из описания. Затем меняет 1% товаров и сравнивает инкрементальное обновление
+индекса с полной пересборкой.
+
+Запуск из корня репозитория:
+    python -m bench.search_bench [--items 10000] [--queries 2000]
+"""
+
+import argparse
+import gc
+import random
+import statistics
+import time
+
+from app.catalog import Catalog, CatalogSnapshot, ProductRecord
+from app.search import MenuSearch, normalize
+
+# Слоги "согласная + гласная" и "согласная + гласная + согласная" — как в названиях блюд
+CONSONANTS = 'бвгджзклмнпрстфхцчшщ'
+VOWELS = 'аеиоуыэюя'
+SYLLABLES = [c + v for c in CONSONANTS for v in VOWELS] + [c + v + 'н' for c in CONSONANTS for v in 'аоеи']
+
+
+def make_word(rng: random.Random) -> str:
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def make_snapshot(items: int, rng: random.Random, version: int = 1) -> CatalogSnapshot:
+    menu_words = sorted({word for record in Catalog().snapshot.products.values()
+                         for word in normalize(f'{record.name} {record.description}')})
+    pool = [make_word(rng) for _ in range(items // 2)] + menu_words
+    products = {}
+    for item_id in range(items):
+        name = ' '.join(rng.choice(pool) for _ in range(rng.randint(1, 3))).capitalize()
+        description = ' '.join(rng.choice(pool) for _ in range(rng.randint(5, 15)))
+        products[item_id] = ProductRecord(item_id, f'{name} {item_id}', rng.randint(50, 500), 'Раздел', description)
+    return CatalogSnapshot(version, products, {}, {}, {}, {})
+
+
+def typo(word: str, rng: random.Random) -> str:
+    if len(word) < 4:
+        return word
+    position = rng.randrange(1, len(word) - 1)
+    return word[:position] + rng.choice('абвгдежзиклмнопрстуфхцчшщыэюя') + word[position + 1:]
+
+
+def make_queries(snapshot: CatalogSnapshot, count: int, rng: random.Random) -> list:
+    records = list(snapshot.products.values())
+    queries = []
+    for index in range(count):
+        record = rng.choice(records)
+        name = record.name.rsplit(' ', 1)[0]
+        kind = index % 4
+        if kind == 0:
+            queries.append(name)
+        elif kind == 1:
+            queries.append(' '.join(typo(word, rng) for word in name.split()))
+        elif kind == 2:
+            queries.append(name.split()[0][:4])
+        else:
+            queries.append(rng.choice(record.description.split()))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    snapshot = make_snapshot(args.items, rng)
+    started = time.perf_counter()
+    search = MenuSearch(snapshot)
+    build = time.perf_counter() - started
+    print(f'товаров: {len(search)}, слов в словаре: {len(search._words)}, сборка индекса: {build * 1000:.0f} мс')
+
+    queries = make_queries(snapshot, args.queries, rng)
+    timings = []
+    found = 0
+    for query in queries:
+        started = time.perf_counter()
+        results = search.search(query)
+        timings.append((time.perf_counter() - started) * 1000)
+        found += bool(results)
+    timings.sort()
+    print(f'запросов: {len(queries)}, с результатами: {found}')
+    print(f'время запроса, мс: среднее {statistics.fmean(timings):.3f}  '
+          f'p50 {timings[len(timings) // 2]:.3f}  p99 {timings[int(len(timings) * 0.99)]:.3f}  max {timings[-1]:.3f}')
+
+    # Меняем описание у 1% товаров — как при правке menu.json
+    products = dict(snapshot.products)
+    for item_id in rng.sample(list(products), max(1, args.items // 100)):
+        products[item_id] = products[item_id]._replace(description=f'{make_word(rng)} {make_word(rng)}')
+    changed = snapshot._replace(version=2, products=products)
+    # Полная сборка мусора не должна попасть в замер
+    gc.collect()
+    started = time.perf_counter()
+    search.update(changed)
+    incremental = time.perf_counter() - started
+    gc.collect()
+    started = time.perf_counter()
+    rebuilt = MenuSearch(changed)
+    full = time.perf_counter() - started
+    assert search._word_products == rebuilt._word_products
+    print(f'обновление 1% товаров: инкрементально {incremental * 1000:.1f} мс, пересборка {full * 1000:.0f} мс')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Нагрузочная проверка учёта остатков.
+
+Много пользователей одновременно добавляют товары и комплексные обеды, меняют количество,
+очищают корзины и оплачивают их, конкурируя за небольшие остатки. Каждое действие —
+отдельная задача asyncio с паузой перед ним, как обработчики бота. После прогона проверяется:
+- ни одно блюдо не продано сверх остатка;
+- свободные, зарезервированные и проданные порции в сумме дают начальный остаток;
+- резервы совпадают с суммой резервов пользователей.
+
+Запуск из корня репозитория:
+    python -m bench.stock_stress [--users 2000] [--actions 50000]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from app.catalog import Catalog
+from app.stock import StockLedger
+
+
+async def user_actions(ledger: StockLedger, user_id: int, actions: int, products: list, rng: random.Random,
+                       sold: Counter) -> int:
+    cart = Counter()
+    rejected = 0
+    for _ in range(actions):
+        await asyncio.sleep(0)
+        action = rng.random()
+        if action < 0.6:
+            product = rng.choice(products)
+            if ledger.reserve(user_id, product):
+                cart[product] += 1
+            else:
+                rejected += 1
+        elif action < 0.75 and cart:
+            product = rng.choice(list(cart))
+            ledger.release(user_id, product)
+            cart[product] -= 1
+            if not cart[product]:
+                del cart[product]
+        elif action < 0.8:
+            ledger.release_all(user_id)
+            cart.clear()
+        elif cart:
+            if not ledger.checkout(user_id, {product: {'quantity': quantity} for product, quantity in cart.items()}):
+                for product, quantity in cart.items():
+                    for item, units in ledger.requirements(product):
+                        sold[item] += units * quantity
+                cart.clear()
+    return rejected
+
+
+async def run(args):
+    catalog = Catalog()
+    products = list(catalog.snapshot.products_by_name)
+    rng = random.Random(args.seed)
+    levels = {name: rng.randint(20, 200) for name in products}
+    ledger = StockLedger(catalog, levels)
+    sold = Counter()
+    per_user = args.actions // args.users
+    started = time.perf_counter()
+    rejected = sum(await asyncio.gather(*(
+        user_actions(ledger, user_id, per_user, products, random.Random(rng.random()), sold)
+        for user_id in range(args.users)
+    )))
+    elapsed = time.perf_counter() - started
+
+    held = Counter()
+    for holds in ledger._holds.values():
+        held.update(holds)
+    for item, level in levels.items():
+        assert ledger.stock[item] >= 0, item
+        assert ledger.reserved[item] == held[item], item
+        assert ledger.stock[item] - ledger.reserved[item] >= 0, item
+        assert ledger.stock[item] + sold[item] == level, item
+    total = per_user * args.users
+    print(f'действий: {total} за {elapsed:.2f} с ({total / elapsed:.0f}/с), отказов из-за остатков: {rejected}')
+    print(f'продано порций: {sum(sold.values())} из {sum(levels.values())}, инварианты соблюдены')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--actions', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Нагрузочный тест многопроцессного режима (``app.workers``).
+
+Поднимает локальный сервер-заглушку Bot API, запускает ``WorkerPool`` с разным числом
+процессов и передаёт ему одинаковый поток обновлений: тысячи пользователей открывают меню,
+разделы, добавляют товары и меняют количество. Для каждого числа процессов выводит
+пропускную способность (обновлений в секунду); рост с числом процессов ограничен
+количеством ядер машины.
+
+Запуск из корня репозитория (нужен полный набор модулей бота, включая ``app.keyboard``):
+    python -m bench.worker_scaling [--workers 1 2 4] [--updates 20000]
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import tempfile
+import time
+
+from app.callback_data import pack, SELECT, INCREASE, SECTION
+from app.workers import WorkerPool
+from bench.fake_bot_api import FakeBotAPI
+
+TOKEN = '42:BENCH'
+
+
+def synthetic_updates(count: int, users: int, seed: int = 1) -> list:
+    """Строит поток обновлений: сообщение "Меню" и нажатия кнопок каталога."""
+    random.seed(seed)
+    ids = itertools.count(1)
+    callbacks = [pack(SECTION, 1), pack(SECTION, 2), pack(SECTION, 7), pack(SELECT, 0), pack(SELECT, 19),
+                 pack(INCREASE, 0), 'redact_quantity']
+    updates = []
+    for _ in range(count):
+        user_id = random.randrange(1, users + 1)
+        user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+        message = {'message_id': 1, 'date': 0, 'chat': {'id': user_id, 'type': 'private'}, 'from': user}
+        if random.random() < 0.1:
+            updates.append({'update_id': next(ids), 'message': {**message, 'text': 'Меню'}})
+        else:
+            updates.append({'update_id': next(ids), 'callback_query': {
+                'id': str(next(ids)), 'from': user, 'chat_instance': '1',
+                'message': {**message, 'text': 'Меню'}, 'data': random.choice(callbacks),
+            }})
+    return updates
+
+
+async def measure(workers: int, updates: list, api_url: str) -> float:
+    pool = WorkerPool(workers, TOKEN, api_url=api_url, log_level=logging.WARNING)
+    pool.start()
+    # Прогрев: процессы загружают обработчики и каталог
+    for update in updates[:workers * 50]:
+        pool.submit(update)
+    while pool.total_processed() < workers * 50:
+        await asyncio.sleep(0.05)
+
+    started_count = pool.total_processed()
+    started = time.perf_counter()
+    for update in updates:
+        pool.submit(update)
+    while pool.total_processed() < started_count + len(updates):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    await asyncio.to_thread(pool.stop)
+    return len(updates) / elapsed
+
+
+async def run(worker_counts: list, count: int, users: int):
+    server = FakeBotAPI()
+    await server.start()
+    print(f'ядер: {os.cpu_count()}, обновлений: {count}, пользователей: {users}')
+    baseline = None
+    try:
+        for workers in worker_counts:
+            rate = await measure(workers, synthetic_updates(count, users), server.url)
+            baseline = baseline or rate
+            print(f'процессов: {workers:>2}  {rate:>9.0f} обн/с  x{rate / baseline:.2f}')
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=5000)
+    args = parser.parse_args()
+    # Базы корзин, номеров заказов и журналы — во временном каталоге
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        # Сервер метрик на свободном порту, чтобы не мешать запущенному боту
+        os.environ.setdefault('METRICS_PORT', '0')
+        os.environ.setdefault('CART_STORAGE', 'sqlite:///carts.sqlite3')
+        asyncio.run(run(args.workers, args.updates, args.users))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,13 +9,127 @@
 - Возможность очистки корзины и оплаты заказа.
 """
 
-from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import CommandStart, BaseFilter
+import asyncio
+import math
+import os
+
+from aiogram import Bot, Router, F
+from aiogram.types import Message, CallbackQuery, InlineQuery
+from aiogram.filters import Command, CommandObject, CommandStart
 import app.keyboard as kb
-from app.cart import cart
+import app.menu_keyboard as menu_kb
+from app.broadcast import Broadcaster, SubscriberStore
+from app.callback_data import pack, SELECT, EDIT, INCREASE, DECREASE, SECTION
+from app.cart.expiry import CartExpiry
+from app.cart.service import Cart
+from app.cart.storage import create_storage
+from app.catalog import Catalog, ProductRecord, SectionRecord, ROOT_SECTION_ID
+from app.dispatch import CallbackDispatcher
+from app.edits import EditCoalescer, EditFingerprints
+from app.inline import InlineResultCache
+from app.keyboard_cache import KeyboardCache
+from app.kitchen import Kitchen
+from app.media import MediaCache, catalog_photos
+from app.metrics import HandlerMetrics
+from app.middlewares import UserSerialMiddleware
+from app.orders import OrderNumberAllocator, OrderRecord, OrderSink
+from app.outbound import OutboundScheduler
+from app.search import MenuSearch
+from app.stock import StockLedger, load_levels
 
 router = Router()
+# Обновления одного пользователя выполняются по очереди, разных пользователей — параллельно
+user_serial = UserSerialMiddleware()
+router.message.outer_middleware(user_serial)
+router.callback_query.outer_middleware(user_serial)
+# Время, ошибки и ожидание Bot API по обработчикам; отдаются на http://127.0.0.1:METRICS_PORT/metrics
+metrics = HandlerMetrics()
+router.message.middleware(metrics)
+router.callback_query.middleware(metrics)
+router.inline_query.middleware(metrics)
+# Меню загружается из app/menu.json и перечитывается при изменении файла
+catalog = Catalog()
+callbacks = CallbackDispatcher()
+callbacks.aliases(catalog.translate)
+# Готовые клавиатуры экранов, не зависящих от корзины; сбрасываются при перезагрузке каталога
+keyboards = KeyboardCache(version=lambda: catalog.snapshot.version)
+catalog.subscribe(keyboards.invalidate)
+# Индекс поиска по названиям и описаниям; при перезагрузке каталога обновляются только изменённые товары
+search = MenuSearch(catalog.snapshot)
+catalog.subscribe(search.update)
+# Ответы inline-режима по каждому набранному префиксу; сбрасываются при смене версии каталога
+inline_results = InlineResultCache(
+    lambda query: search.search(query, limit=20) if query else list(catalog.snapshot.products.values())[:20],
+    version=lambda: catalog.snapshot.version,
+)
+# Корзины хранятся в SQLite и переживают перезапуск; CART_STORAGE=memory или compact — только в памяти
+# (compact — ID товаров и количества, цены из каталога)
+cart = Cart(create_storage(os.getenv('CART_STORAGE', 'sqlite:///carts.sqlite3'), catalog))
+catalog.subscribe(cart.invalidate)
+
+
+async def send_cart_reminder(bot: Bot, user_id: int):
+    """
+    Напоминает пользователю о брошенной корзине.
+
+    Args:
+        bot (Bot): Бот, от имени которого отправляется напоминание.
+        user_id (int): ID пользователя (совпадает с ID личного чата с ботом).
+    """
+    await bot.send_message(
+        user_id,
+        f'Ваша корзина ждёт вас!\n\n{cart.show(user_id)}',
+        reply_markup=await keyboards.get(kb.cart_buttons)
+    )
+
+
+# Корзина без действий CART_TTL секунд очищается; за CART_REMINDER секунд до этого
+# пользователю напоминается о ней (0 — без напоминания)
+cart.expiry = CartExpiry(
+    cart, ttl=float(os.getenv('CART_TTL', '86400')), remind_before=float(os.getenv('CART_REMINDER', '3600')),
+    remind=send_cart_reminder, locks=user_serial.locks,
+)
+# file_id фото разделов и товаров (пути в menu.json — относительно файла меню) по хешу содержимого
+media = MediaCache(os.getenv('MEDIA_DB', 'media.sqlite3'), root=catalog.path.parent)
+# Остатки блюд из STOCK_FILE (блюда без остатка не ограничены); резерв снимается через STOCK_HOLD секунд бездействия
+stock = StockLedger(
+    catalog, load_levels(os.getenv('STOCK_FILE', 'stock.json')), hold=float(os.getenv('STOCK_HOLD', '900'))
+)
+# Быстрые нажатия "➕"/"➖" перерисовывают клавиатуру одним запросом за окно EDIT_DEBOUNCE секунд
+edits = EditCoalescer(delay=float(os.getenv('EDIT_DEBOUNCE', '0.3')))
+# Изменения, после которых сообщение осталось бы прежним, не отправляются
+edit_fingerprints = EditFingerprints()
+# Новые сообщения выпускаются по приоритету с учётом лимитов Telegram; ответы на нажатия и изменения — сразу
+outbound = OutboundScheduler()
+# Подписчики (все, кто нажал /start) и рассылки; рассылка идёт не быстрее BROADCAST_RATE сообщений в секунду
+# и замедляется при ответах 429. Отправлять рассылки могут пользователи из BROADCAST_ADMINS (ID через запятую)
+subscribers = SubscriberStore(os.getenv('SUBSCRIBERS_DB', 'subscribers.sqlite3'))
+broadcaster = Broadcaster(
+    subscribers, rate=float(os.getenv('BROADCAST_RATE', '25')), throttled=lambda: outbound.retries
+)
+broadcast_admins = {int(user_id) for user_id in os.getenv('BROADCAST_ADMINS', '').split(',') if user_id.strip()}
+
+
+def outbound_metrics():
+    """Показатели исходящих запросов для HTTP-сервера метрик."""
+    for priority, depth in outbound.depth().items():
+        yield 'outbound_queue_depth', f'priority="{priority}"', depth
+    for priority, seconds in outbound.stats()['max_wait_seconds'].items():
+        yield 'outbound_max_wait_seconds', f'priority="{priority}"', seconds
+    yield 'outbound_sent_total', outbound.sent
+    yield 'outbound_retries_total', outbound.retries
+    yield 'edits_suppressed_total', edit_fingerprints.suppressed
+    # Разница запрошенных и отправленных изменений клавиатуры — объединённые нажатия
+    yield 'edits_requested_total', edits.requested
+    yield 'edits_sent_total', edits.sent
+
+
+metrics.add_collector(outbound_metrics)
+metrics.add_collector(cart.expiry.metrics)
+metrics.add_collector(inline_results.metrics)
+metrics.add_collector(stock.metrics)
+metrics.add_collector(media.metrics)
+metrics.add_collector(broadcaster.metrics)
 
 # Старт
 @router.message(CommandStart())
@@ -28,63 +142,162 @@ async def cmd_start(message: Message):
     Args:
         message (Message): Объект сообщения от пользователя, содержащий команду /start.
     """
+    if message.chat.type == 'private':
+        subscribers.add(message.chat.id)
     await message.answer(
         text=f'Здравствуйте, {message.from_user.first_name}\nЧтобы сделать заказ, нажмите "Меню"',
-        reply_markup=await kb.main()
+        reply_markup=await keyboards.get(kb.main)
     )
 
-# Списки с полным меню
-selected_Основное_меню = ['Суп', 'Гарнир', 'Салат', 'Мясное блюдо', '🔙Выбор раздела']
-selected_Суп = ['Крем-суп из тыквы', 'Том Ям', 'Минестроне', 'Борщ', '🔙Основное меню']
-selected_Салат = ['Цезарь с курицей', 'Греческий салат', 'Оливье', 'Салат с тунцом', '🔙Основное меню']
-selected_Мясное_блюдо = ['Стейк из говядины', 'Куриное филе', 'Свинина в соусе BBQ', 'Котлеты по-домашнему', '🔙Основное меню']
-selected_Гарнир = ['Картофельное пюре', 'Рис с овощами', 'Гречневая каша', 'Овощи на гриле', '🔙Основное меню']
-selected_Комплексные_обеды = ['Традиционный уют', 'Средиземноморский вкус', 'Гурманский рай', '🔙Выбор раздела']
-selected_Напитки_и_десерты = ['Горячие напитки', 'Холодные напитки', 'Десерты', '🔙Выбор раздела']
-selected_Горячие_напитки = ['Американо', 'Капучино', 'Чай чёрный/зелёный', 'Какао с маршмеллоу', '🔙Напитки и десерты']
-selected_Холодные_напитки = ['Домашний лимонад', 'Морс клюквенный', 'Айсти с лимоном', 'Апельсиновый фреш', '🔙Напитки и десерты']
-selected_Десерт = ['Чизкейк', 'Тирамису', 'Шоколадный фондан', 'Ягодный тарт', '🔙Напитки и десерты']
-
-# Словарь с продуктами и ценами
-products = {
-    'Крем-суп из тыквы': 250,
-    'Том Ям': 250,
-    'Минестроне': 220,
-    'Борщ': 200,
-    'Цезарь с курицей': 150,
-    'Греческий салат': 120,
-    'Оливье': 180,
-    'Салат с тунцом': 120,
-    'Стейк из говядины': 350,
-    'Куриное филе': 200,
-    'Свинина в соусе BBQ': 250,
-    'Котлеты по-домашнему': 200,
-    'Картофельное пюре': 150,
-    'Рис с овощами': 140,
-    'Гречневая каша': 130,
-    'Овощи на гриле': 180,
-    'Традиционный уют': 950,
-    'Средиземноморский вкус': 1070,
-    'Гурманский рай': 1350,
-    'Американо': 100,
-    'Капучино': 150,
-    'Чай чёрный/зелёный': 80,
-    'Какао с маршмеллоу': 180,
-    'Домашний лимонад': 150,
-    'Морс клюквенный': 120,
-    'Айсти с лимоном': 130,
-    'Апельсиновый фреш': 200,
-    'Чизкейк': 300,
-    'Тирамису': 280,
-    'Шоколадный фондан': 350,
-    'Ягодный тарт': 250
-}
-
-user_cart = {}
-order_counter = 1
-
-
-@router.callback_query(F.data == 'redact_quantity')
+
+@router.message(Command('broadcast'), F.from_user.id.in_(broadcast_admins))
+async def cmd_broadcast(message: Message, command: CommandObject):
+    """
+    Обрабатывает команду /broadcast <текст> администратора: запускает рассылку всем подписчикам.
+
+    Итог рассылки отправляется в чат, из которого она запущена.
+
+    Args:
+        message (Message): Сообщение с командой.
+        command (CommandObject): Разобранная команда; текст рассылки — её аргументы.
+    """
+    if not command.args:
+        await message.reply('Укажите текст рассылки: /broadcast <текст>')
+        return
+    broadcast_id = subscribers.create(command.args)
+    broadcaster.start(message.bot, broadcast_id, command.args, notify=message.chat.id)
+    await message.reply(f'Рассылка {broadcast_id} запущена, подписчиков: {subscribers.count()}.')
+
+
+# Номера заказов арендуются блоками по 100 и не повторяются между процессами и перезапусками
+order_numbers = OrderNumberAllocator('orders.sqlite3')
+# Оплаченные заказы раскладываются на талоны станций кухни, по их очередям оценивается время готовности
+kitchen = Kitchen(catalog)
+metrics.add_collector(kitchen.metrics)
+# Оплаченные заказы дописываются в журнал в фоне
+order_sink = OrderSink(os.getenv('ORDER_LOG', 'orders.jsonl'))
+
+
+@router.startup()
+async def start_catalog_watcher():
+    """Запускает отслеживание изменений файла меню."""
+    catalog.start_watching()
+
+
+@router.startup()
+async def start_order_sink():
+    """Запускает фоновую запись журнала заказов."""
+    order_sink.start()
+
+
+@router.startup()
+async def attach_outbound_middlewares(bot: Bot):
+    """
+    Подключает к запросам бота учёт времени Bot API, экраны с фото, объединение изменений клавиатуры,
+    пропуск изменений без изменений и планировщик исходящих запросов (последним, ближе всего к сети).
+    """
+    bot.session.middleware(metrics.request_middleware)
+    bot.session.middleware(media)
+    bot.session.middleware(edits)
+    bot.session.middleware(edit_fingerprints)
+    bot.session.middleware(outbound)
+    outbound.start()
+
+
+@router.startup()
+async def start_cart_expiry(bot: Bot):
+    """Запускает очистку брошенных корзин; напоминания отправляются этим ботом."""
+    cart.expiry.start(bot)
+
+
+@router.startup()
+async def start_stock_ledger():
+    """Запускает снятие просроченных резервов остатков."""
+    stock.start()
+
+
+@router.startup()
+async def resume_broadcasts(bot: Bot):
+    """Продолжает рассылки, прерванные остановкой бота."""
+    broadcaster.resume(bot)
+
+
+media_prewarm = None
+
+
+@router.startup()
+async def prewarm_media(bot: Bot):
+    """Загружает в фоне фото каталога, которых ещё нет в кэше, если задан служебный чат MEDIA_CHAT_ID."""
+    global media_prewarm
+    chat_id = os.getenv('MEDIA_CHAT_ID')
+    if chat_id:
+        media_prewarm = asyncio.create_task(media.prewarm(bot, int(chat_id), catalog_photos(catalog.snapshot)))
+
+
+@router.startup()
+async def start_metrics_server():
+    """Запускает HTTP-сервер метрик, если задан METRICS_PORT (пустое значение отключает сервер)."""
+    port = os.getenv('METRICS_PORT', '9108')
+    if port:
+        await metrics.start_server(port=int(port))
+
+
+@router.shutdown()
+async def stop_metrics_server():
+    """Останавливает HTTP-сервер метрик."""
+    await metrics.stop_server()
+
+
+@router.shutdown()
+async def stop_cart_expiry():
+    """Останавливает очистку брошенных корзин."""
+    await cart.expiry.stop()
+
+
+@router.shutdown()
+async def stop_stock_ledger():
+    """Останавливает снятие просроченных резервов остатков."""
+    await stock.stop()
+
+
+@router.shutdown()
+async def stop_media_prewarm():
+    """Прерывает прогрев фото, если он ещё идёт."""
+    if media_prewarm is not None and not media_prewarm.done():
+        media_prewarm.cancel()
+        await asyncio.gather(media_prewarm, return_exceptions=True)
+
+
+@router.shutdown()
+async def stop_broadcasts():
+    """Прерывает рассылки; неотправленное будет отправлено после запуска."""
+    await broadcaster.stop()
+
+
+@router.shutdown()
+async def stop_catalog_watcher():
+    """Останавливает отслеживание изменений файла меню."""
+    await catalog.stop_watching()
+
+
+@router.shutdown()
+async def flush_outbound():
+    """Отправляет отложенные изменения клавиатур и очередь исходящих запросов перед остановкой."""
+    await edits.flush()
+    await outbound.close()
+
+
+@router.shutdown()
+async def close_storages():
+    """Дописывает журнал заказов, сохраняет корзины и закрывает базы номеров заказов, фото и подписчиков."""
+    await order_sink.close()
+    cart.close()
+    await order_numbers.close()
+    media.close()
+    subscribers.close()
+
+
+@callbacks.exact('redact_quantity')
 async def edit_quantity_handler(callback: CallbackQuery):
     """
     Обработчик для редактирования количества товаров в корзине.
@@ -92,7 +305,7 @@ async def edit_quantity_handler(callback: CallbackQuery):
     Если корзина пуста, отправляет уведомление пользователю.
     Если корзина не пуста, показывает список товаров для редактирования.
     """
-    user_cart = cart.user_carts.get(callback.from_user.id, {})
+    user_cart = cart.get(callback.from_user.id)
     if not user_cart:
         # Сообщение пользователю о пустой корзине
         await callback.answer('Ваша корзина пуста.')
@@ -100,56 +313,70 @@ async def edit_quantity_handler(callback: CallbackQuery):
     # Вывод сообщения с кнопками для редактирования товаров
     await callback.message.edit_text(
         text='Выберите товар для редактирования:',
-        reply_markup=await kb.create_edit_quantity_buttons(user_cart)
+        reply_markup=await menu_kb.create_edit_quantity_buttons(user_cart, catalog.snapshot.products_by_name)
     )
 
 
-@router.callback_query(F.data.startswith('edit_'))
-async def edit_product_handler(callback: CallbackQuery):
+@callbacks.action(EDIT, catalog.product, 'product')
+async def edit_product_handler(callback: CallbackQuery, product: ProductRecord):
     """
     Обработчик выбора конкретного товара для изменения его количества.
 
-    Отправляет сообщение с кнопками для изменения количества выбранного товара.
+    Отправляет сообщение (с фото товара, если оно есть) с кнопками для изменения количества выбранного товара.
+
+    Args:
+        callback (CallbackQuery): Входящий callback.
+        product (ProductRecord): Товар из каталога.
     """
-    product = callback.data[len('edit_'):].replace('_', ' ')
+    line = cart.get(callback.from_user.id).get(product.name)
     # Отправка сообщения с кнопками изменения количества для выбранного товара
-    await callback.message.edit_text(
-        text=f"Изменение количества для {product}:",
-        reply_markup=await kb.quantity_buttons(product)
+    await media.show(
+        callback.message,
+        f"Изменение количества для {product.name}:",
+        await menu_kb.quantity_buttons(product, line['quantity'] if line else 0),
+        product.photo
     )
 
 
-@router.callback_query(F.data.startswith('increase_'))
-async def increase_quantity_handler(callback: CallbackQuery):
+@callbacks.action(INCREASE, catalog.product, 'product')
+async def increase_quantity_handler(callback: CallbackQuery, product: ProductRecord):
     """
     Обработчик для увеличения количества выбранного товара.
 
-    Увеличивает количество товара на единицу и обновляет интерфейс.
+    Увеличивает количество товара на единицу, если хватает остатков, и обновляет интерфейс.
     """
-    product = callback.data[len('increase_'):]
-    cart.edit_quantity(callback.from_user.id, product, change=1)
+    user_id = callback.from_user.id
+    if product.name in cart.get(user_id) and not stock.reserve(user_id, product.name):
+        await callback.answer(f'Больше порций "{product.name}" нет в наличии.', show_alert=True)
+        return
+    cart.edit_quantity(user_id, product.name, change=1)
     # Сообщение пользователю об увеличении количества
     await callback.answer('Количество увеличено.')
-    # Обновление кнопок изменения количества
-    await callback.message.edit_reply_markup(reply_markup=await kb.quantity_buttons(product))
+    # Обновление количества на кнопках; частые нажатия объединяются в одно изменение с последним количеством
+    line = cart.get(user_id).get(product.name)
+    quantity = line['quantity'] if line else 0
+    edits.edit_reply_markup(callback.message, await menu_kb.quantity_buttons(product, quantity))
 
 
-@router.callback_query(F.data.startswith('decrease_'))
-async def decrease_quantity_handler(callback: CallbackQuery):
+@callbacks.action(DECREASE, catalog.product, 'product')
+async def decrease_quantity_handler(callback: CallbackQuery, product: ProductRecord):
     """
     Обработчик для уменьшения количества выбранного товара.
 
     Уменьшает количество товара на единицу. Если количество достигает нуля,
     удаляет товар из корзины и обновляет список товаров для редактирования.
     """
-    product = callback.data[len('decrease_'):]
-    cart.edit_quantity(callback.from_user.id, product, change=-1)
-    if product not in cart.user_carts[callback.from_user.id]:
+    if product.name in cart.get(callback.from_user.id):
+        # Порция возвращается в остаток
+        stock.release(callback.from_user.id, product.name)
+    cart.edit_quantity(callback.from_user.id, product.name, change=-1)
+    line = cart.get(callback.from_user.id).get(product.name)
+    if line is None:
         # Удаление товара из корзины
         await callback.message.edit_text(
             text='Выберите товар для редактирования:',
-            reply_markup=await kb.create_edit_quantity_buttons(
-                cart.user_carts[callback.from_user.id]
+            reply_markup=await menu_kb.create_edit_quantity_buttons(
+                cart.get(callback.from_user.id), catalog.snapshot.products_by_name
             )
         )
         # Уведомление об удалении товара
@@ -157,54 +384,55 @@ async def decrease_quantity_handler(callback: CallbackQuery):
     else:
         # Уведомление об уменьшении количества
         await callback.answer('Количество уменьшено.')
-        # Обновление кнопок изменения количества
-        await callback.message.edit_reply_markup(reply_markup=await kb.quantity_buttons(product))
+        # Обновление количества на кнопках; частые нажатия объединяются в одно изменение с последним количеством
+        edits.edit_reply_markup(callback.message, await menu_kb.quantity_buttons(product, line['quantity']))
 
 
-@router.callback_query(F.data == 'pay_cart')
+@callbacks.exact('pay_cart')
 async def pay_cart_handler(callback: CallbackQuery):
     """
     Обработчик оплаты корзины.
 
     Проверяет наличие товаров в корзине. Если корзина пуста, уведомляет пользователя.
-    Если товары есть, формирует заказ, выводит его в консоль и очищает корзину.
+    Если товары есть, списывает остатки, формирует заказ, ставит его талоны в очереди кухни,
+    передаёт заказ в журнал заказов, очищает корзину и сообщает примерное время готовности.
     """
-    global order_counter
     user_id = callback.from_user.id
-    cart_content = cart.user_carts.get(user_id)
+    cart_content = cart.get(user_id)
     if not cart_content:
         # Уведомление о пустой корзине
         await callback.answer('Корзина пуста, нечего оплачивать.')
         return
+    # Номер берётся до списания остатков: если аренда номеров не удалась, остатки не тронуты.
+    # Номер выдаётся без await после аренды блока, поэтому одновременные оплаты получают разные номера;
+    # при нехватке остатков номер пропускается
+    order_number = await order_numbers.next()
+    # Резерв списывается с остатка; недостающие порции (резерв истёк) берутся из свободных
+    shortages = stock.checkout(user_id, cart_content)
+    if shortages:
+        missing = ', '.join(f'{name} (осталось {max(free, 0)})' for name, free in shortages.items())
+        await callback.answer(f'Не хватает: {missing}. Измените корзину.'[:200], show_alert=True)
+        return
 
-    # Расчет общей стоимости и детализации заказа
-    total_price = cart.get_total_price(user_id)
-    order_details = '\n'.join(
-        f"- {product}: {info['quantity']} шт. x {info['price']} руб = {info['quantity'] * info['price']} руб"
-        for product, info in cart_content.items()
+    # Формирование заказа, талоны станций кухни и постановка в очередь на запись в журнал
+    order = OrderRecord.from_cart(
+        order_number, user_id, callback.from_user.first_name or 'Неизвестно', cart.order_lines(user_id),
+        cart.get_total_price(user_id)
     )
-
-    # Формирование информации о заказе
-    order_info = (f"У вас новый заказ:\n"
-                  f"Номер заказа: {order_counter}\n"
-                  f"Имя покупателя: {callback.from_user.first_name or 'Неизвестно'}\n"
-                  f"ID покупателя: {user_id}\n"
-                  f"Состав заказа:\n{order_details}\n"
-                  f"Общая стоимость: {total_price} руб\n")
-
-    # Вывод информации о заказе в консоль
-    print(order_info)
-    # Очистка корзины пользователя
+    ready_in, tickets = kitchen.submit(order)
+    order = order._replace(ready_in=ready_in, tickets=tickets)
+    # Очистка корзины пользователя до ожидания очереди, чтобы не потерять новые добавления
     cart.clear(user_id)
+    await order_sink.submit(order)
     # Уведомление об успешной оплате
     await callback.message.edit_text(
-        text=f'Спасибо за оплату! Ваш номер заказа: {order_counter}',
-        reply_markup=await kb.to_new_order()
+        text=f'Спасибо за оплату! Ваш номер заказа: {order_number}\n'
+             f'Заказ будет готов примерно через {max(1, math.ceil(ready_in / 60))} мин.',
+        reply_markup=await keyboards.get(kb.to_new_order)
     )
-    order_counter += 1
 
 
-@router.callback_query(F.data == 'clear_cart')
+@callbacks.exact('clear_cart')
 async def clear_cart_handler(callback: CallbackQuery):
     """
     Обработчик запроса на очистку корзины.
@@ -213,11 +441,11 @@ async def clear_cart_handler(callback: CallbackQuery):
     """
     await callback.message.edit_text(
         text='Вы уверены, что хотите очистить корзину?',
-        reply_markup=await kb.create_clear_cart_buttons()
+        reply_markup=await keyboards.get(kb.create_clear_cart_buttons)
     )
 
 
-@router.callback_query(F.data == 'confirm_clear_cart')
+@callbacks.exact('confirm_clear_cart')
 async def confirm_clear_cart(callback: CallbackQuery):
     """
     Обработчик подтверждения очистки корзины.
@@ -225,6 +453,7 @@ async def confirm_clear_cart(callback: CallbackQuery):
     Очищает корзину пользователя и уведомляет его об успешной операции.
     """
     cart.clear(callback.from_user.id)
+    stock.release_all(callback.from_user.id)
     await callback.message.edit_text(text='Корзина успешно очищена.')
 
 
@@ -236,10 +465,10 @@ async def cart_handler(message: Message):
     Показывает содержимое корзины пользователя с соответствующими кнопками.
     """
     cart_info = cart.show(message.from_user.id)
-    await message.reply(cart_info, reply_markup=await kb.cart_buttons())
+    await message.reply(cart_info, reply_markup=await keyboards.get(kb.cart_buttons))
 
 
-@router.callback_query(F.data.in_({'selected_Перейти_в_корзину', 'back_to_cart'}))
+@callbacks.exact('selected_Перейти_в_корзину', 'back_to_cart')
 async def back_to_cart_handler(callback: CallbackQuery):
     """
     Обработчик для возврата в корзину.
@@ -247,53 +476,35 @@ async def back_to_cart_handler(callback: CallbackQuery):
     Отображает текущее содержимое корзины пользователя с кнопками управления.
     """
     cart_info = cart.show(callback.from_user.id)
-    await callback.message.edit_text(cart_info, reply_markup=await kb.cart_buttons())
-
-
-class ProductFilter(BaseFilter):
-    """
-    Фильтр для обработки выбора товаров.
-
-    Проверяет, содержится ли выбранный товар в списке доступных товаров.
-    """
-
-    def __init__(self, products: dict):
-        self.products = products
-
-    async def __call__(self, callback: CallbackQuery) -> bool:
-        """
-        Проверяет, относится ли входящий callback к доступным товарам.
+    await callback.message.edit_text(cart_info, reply_markup=await keyboards.get(kb.cart_buttons))
 
-        Args:
-            callback (CallbackQuery): Входящий callback
 
-        Returns:
-            bool: True, если товар найден в списке, иначе False.
-        """
-        data = callback.data
-        if data.startswith("selected_"):
-            product_name = data[len("selected_"):]  # Убираем префикс "selected_"
-            product_name = product_name.replace('_', ' ')
-            return product_name in self.products  # Проверяем, есть ли ключ в словаре
-        return False
-
-
-@router.callback_query(ProductFilter(products))
-async def handle_product_selection(callback: CallbackQuery):
+@callbacks.action(SELECT, catalog.product, 'product')
+async def handle_product_selection(callback: CallbackQuery, product: ProductRecord):
     """
     Обработчик выбора товара.
 
-    Добавляет выбранный товар в корзину, уведомляет пользователя и обновляет информацию о корзине.
+    Резервирует товар (и блюда из состава комплексного обеда), добавляет его в корзину,
+    уведомляет пользователя и обновляет информацию о корзине.
+
+    Args:
+        callback (CallbackQuery): Входящий callback.
+        product (ProductRecord): Товар из каталога.
     """
-    product_name = callback.data[len("selected_"):]
-    product_name = product_name.replace('_', ' ')
-    product_price = products[product_name]
-    cart.add(callback.from_user.id, product_name, product_price)
+    if not stock.reserve(callback.from_user.id, product.name):
+        await callback.answer(f'Извините, "{product.name}" сейчас нет в наличии.', show_alert=True)
+        return
+    cart.add(callback.from_user.id, product.name, product.price)
+    if callback.message is None:
+        # Кнопка под карточкой товара, отправленной через inline-режим в другой чат:
+        # это сообщение не принадлежит боту, корзину показываем только уведомлением
+        await callback.answer(f'{product.name} добавлен в корзину. Оформить заказ можно в чате с ботом.')
+        return
     # Уведомление пользователя о добавлении товара
-    await callback.answer(f"{product_name} добавлен в корзину")
+    await callback.answer(f"{product.name} добавлен в корзину")
     # Обновление информации о корзине
     cart_info = cart.show(callback.from_user.id)
-    await callback.message.edit_text(cart_info, reply_markup=await kb.added())
+    await callback.message.edit_text(cart_info, reply_markup=await keyboards.get(kb.added))
 
 
 @router.message(F.text == 'Меню')
@@ -303,297 +514,76 @@ async def menu(message: Message):
 
     Отображает разделы меню с кнопками для выбора.
     """
-    await message.reply(text='Выберите раздел меню', reply_markup=await kb.options())
+    await message.reply(text='Выберите раздел меню', reply_markup=await keyboards.get(kb.options))
 
 
-@router.callback_query(F.data.in_({'selected_🔙Выбор_раздела', 'selected_Сделать_еще_заказ'}))
-async def menu(callback: CallbackQuery):
+@callbacks.exact('selected_Сделать_еще_заказ', pack(SECTION, ROOT_SECTION_ID))
+async def back_to_menu(callback: CallbackQuery):
     """
     Обработчик для возврата к разделам меню.
 
     Показывает сообщение с кнопками выбора разделов.
     """
-    await callback.message.edit_text(text='Выберите раздел меню', reply_markup=await kb.options())
-
-
-@router.callback_query(F.data.in_({'selected_Основное_меню', 'selected_🔙Основное_меню'}))
-async def main_menu(callback: CallbackQuery):
-    """
-    Обработчик выбора основного меню.
-
-    Уведомляет пользователя о выборе и отображает категории основного меню с кнопками.
-    """
-    await callback.answer(text='Вы выбрали основное меню')
-    await callback.message.edit_text(
-        text='Выберите категорию:',
-        reply_markup=await kb.create_buttons(selected_Основное_меню))
-
-
-@router.callback_query(F.data.in_({'selected_Напитки_и_десерты', 'selected_🔙Напитки_и_десерты'}))
-async def handle_drinks_desserts(callback: CallbackQuery):
-    """
-    Обработчик выбора раздела 'Напитки и десерты'.
-
-    Уведомляет пользователя и отображает список доступных напитков и десертов.
-    """
-    await callback.answer(text='Вы выбрали напитки и десерты')
-    await callback.message.edit_text(
-        text='Выберите напиток или десерт:',
-        reply_markup=await kb.create_buttons(selected_Напитки_и_десерты))
-
-
-@router.callback_query(F.data == 'selected_Комплексные_обеды')
-async def set_meals(callback: CallbackQuery):
-    """
-    Обработчик выбора раздела 'Комплексные обеды'.
-
-    Уведомляет пользователя и отображает меню с описанием и ценами комплексных обедов.
-    """
-    await callback.answer(text='Вы выбрали комплексные обеды')
-    await callback.message.edit_text(
-        text='''Комплексный обед №1 - 
-Традиционный уют
-Состав:
-1. Борщ (400 мл)
-2. Цезарь с курицей (200 г)
-3. Куриное филе (200 г)
-4. Картофельное пюре (200 г)
-
-Цена: 950 руб.
-
-Комплексный обед №2 - 
-Средиземноморский вкус
-Состав:
-1. Крем-суп из тыквы (300 мл)
-2. Греческий салат (250 г)
-3. Свинина в соусе BBQ (250 г)
-4. Рис с овощами (180 г)
-
-Цена: 1070 руб.
+    await callback.message.edit_text(text='Выберите раздел меню', reply_markup=await keyboards.get(kb.options))
 
-Комплексный обед №3 - 
-Гурманский рай
-Состав:
-1. Том Ям (350 мл)
-2. Салат Оливье (220 г)
-3. Стейк из говядины (250 г)
-4. Овощи на гриле (220 г)
-
-Цена: 1350 руб.''',
-        reply_markup=await kb.create_buttons(selected_Комплексные_обеды))
-
-
-@router.callback_query(F.data == 'selected_Суп')
-async def soup(callback: CallbackQuery):
-    """
-    Обработчик выбора раздела 'Супы'.
 
-    Уведомляет пользователя и отображает меню супов с описанием и ценами.
+@callbacks.action(SECTION, catalog.section, 'section')
+async def show_section(callback: CallbackQuery, section: SectionRecord):
     """
-    await callback.answer(text='Вы выбрали супы')
-    await callback.message.edit_text(
-        text='''Крем-суп из тыквы
-Нежный крем-суп из запечённой тыквы, с добавлением сливок и лёгкими нотками мускатного ореха.
-Объем порции: 300 мл
-Цена: 250 руб. 
-
-Том Ям
-Тайский острый суп с креветками и грибами в кокосовом молоке, с ароматом лайма и лемонграсса
-Объем порции: 350 мл
-Цена: 250 руб. 
-
-Минестроне
-Итальянский овощной суп с пастой или рисом, приготовленный на основе сезонных овощей
-Объем порции: 400 мл
-Цена: 220 руб. 
+    Обработчик выбора раздела меню.
 
-Борщ
-Классический свекольный суп на мясном бульоне с капустой и картофелем, подаётся со сметаной
-Объем порции: 400 мл
-Цена: 200 руб. ''',
-        reply_markup=await kb.create_buttons(selected_Суп))
+    Уведомляет пользователя о выборе и отображает текст и кнопки раздела,
+    заранее подготовленные в снимке каталога, и фото раздела, если оно задано.
 
-
-@router.callback_query(F.data == 'selected_Салат')
-async def salad(callback: CallbackQuery):
-    """
-    Обработчик выбора раздела 'Салаты'.
-
-    Уведомляет пользователя и отображает меню салатов с описанием и ценами.
+    Args:
+        callback (CallbackQuery): Входящий callback.
+        section (SectionRecord): Раздел из каталога.
     """
-    await callback.answer(text='Вы выбрали салаты')
-    await callback.message.edit_text(
-        text='''Цезарь с курицей
-Классический салат с куриной грудкой, листьями салата ромэн, пармезаном, сухариками и соусом цезарь.
-Объем порции: 200 г
-Цена: 150 руб. 
-
-Греческий салат
-Свежие овощи (помидоры, огурцы, болгарский перец) с оливками, фетой и орегано, заправленный оливковым маслом.
-Объем порции: 250 г
-Цена: 120 руб. 
+    await callback.answer(text=section.notice)
+    await media.show(callback.message, section.text, section.keyboard, section.photo)
 
-Оливье
-Традиционный салат с отварным картофелем, морковью, солёными огурцами, яйцом, горошком и майонезом.
-Объем порции: 220 г
-Цена: 100 руб. 
 
-Салат с тунцом
-Лёгкий салат из микса зелёных листьев, тунца, отварных яиц, черри и оливок с оливковым маслом.
-Объем порции: 180 г
-Цена: 120 руб. ''',
-        reply_markup=await kb.create_buttons(selected_Салат))
-
-
-@router.callback_query(F.data == 'selected_Мясное_блюдо')
-async def meat(callback: CallbackQuery):
+@router.message(F.text, ~F.text.startswith('/'))
+async def search_menu(message: Message):
     """
-    Обработчик выбора раздела 'Мясные блюда'.
-
-    Уведомляет пользователя и отображает меню мясных блюд с описанием и ценами.
-    """
-    await callback.answer(text='Вы выбрали мясные блюда')
-    await callback.message.edit_text(
-        text='''Стейк из говядины
-Сочный стейк средней прожарки, подается с ароматным травяным маслом или соусом.
-Объем порции: 250 г
-Цена: 350 руб. 
-
-Куриное филе
-Запечённое куриное филе с травами и специями, подаётся с лёгким соусом.
-Объем порции: 200 г
-Цена: 200 руб. 
-
-Свинина в соусе BBQ
-Обжаренные кусочки свинины, тушенные в пряном соусе BBQ до мягкости и сочности.
-Объем порции: 250 г
-Цена: 250 руб. 
-
-Котлеты по-домашнему
-Домашние мясные котлеты из говядины и свинины, обжаренные до золотистой корочки.
-Объем порции: 180 г
-Цена: 200 руб. ''', reply_markup=await kb.create_buttons(selected_Мясное_блюдо))
-
+    Поиск по меню по свободному тексту.
 
-@router.callback_query(F.data == 'selected_Гарнир')
-async def side_dishes(callback: CallbackQuery):
-    """
-    Обработчик выбора раздела 'Гарниры'.
+    Регистрируется последним из обработчиков сообщений, поэтому получает только текст,
+    который не является командой или кнопкой. Найденные товары показываются кнопками,
+    нажатие на кнопку добавляет товар в корзину.
 
-    Уведомляет пользователя и отображает меню гарниров с описанием и ценами.
+    Args:
+        message (Message): Сообщение с запросом.
     """
-    await callback.answer(text='Вы выбрали гарниры')
-    await callback.message.edit_text(
-        text='''Картофельное пюре
-Нежное картофельное пюре с добавлением сливок и масла.
-Объем порции: 200 г
-Цена: 150 руб. 
-
-Рис с овощами
-Белый рис, обжаренный с морковью, горошком и кукурузой, с лёгкими специями.
-Объем порции: 180 г
-Цена: 140 руб. 
-
-Гречневая каша
-Классическая гречневая каша, приготовленная на воде или бульоне, слегка посоленная.
-Объем порции: 200 г
-Цена: 130 руб. 
-
-Овощи на гриле
-Ассорти из обжаренных на гриле овощей: кабачки, баклажаны, перец и грибы, с добавлением специй.
-Объем порции: 220 г
-Цена: 180 руб.''',
-        reply_markup=await kb.create_buttons(selected_Гарнир))
-
+    products = search.search(message.text)
+    if not products:
+        await message.reply('Ничего не нашлось. Попробуйте написать иначе или откройте "Меню".')
+        return
+    await message.reply(
+        'Нажмите на блюдо, чтобы добавить его в корзину:',
+        reply_markup=menu_kb.section_keyboard(
+            [(f'{product.name} — {product.price} руб', pack(SELECT, product.id)) for product in products]
+        )
+    )
 
-@router.callback_query(F.data == 'selected_Десерты')
-async def desserts(callback: CallbackQuery):
-    """
-    Обработчик выбора раздела 'Десерты'.
 
-    Уведомляет пользователя и отображает меню десертов с описанием и ценами.
+@router.inline_query()
+async def inline_lookup(inline_query: InlineQuery):
     """
-    await callback.answer(text='Вы выбрали десерты')
-    await callback.message.edit_text(
-        text='''Чизкейк Нью-Йорк
-Классический чизкейк на основе сливочного сыра, с мягкой текстурой и печёной корочкой.
-Объем порции: 150 г 
-Цена: 300 руб. 
-
-Тирамису
-Итальянский десерт с кремом маскарпоне, пропитанный кофе и украшенный какао.
-Объем порции: 120 г
-Цена: 280 руб. 
-
-Шоколадный фондан
-Тёплый шоколадный пирог с жидким центром, подаётся с шариком ванильного мороженого.
-Объем порции: 120 г 
-Цена: 350 руб. 
+    Поиск товаров в inline-режиме.
 
-Ягодный тарт
-Лёгкий пирог с основой из песочного теста и начинкой из свежих ягод и крема.
-Объем порции: 130 г 
-Цена: 250 руб. ''',
-        reply_markup=await kb.create_buttons(selected_Десерт))
+    Ответ не зависит от пользователя, поэтому Telegram может отдавать его из своего кэша
+    всем пользователям (``is_personal=False``) в течение ``INLINE_CACHE_TIME`` секунд.
 
-
-@router.callback_query(F.data == 'selected_Холодные_напитки')
-async def cold_drinks(callback: CallbackQuery):
-    """
-    Обработчик выбора раздела 'Холодные напитки'.
-
-    Уведомляет пользователя и отображает меню холодных напитков с описанием и ценами.
+    Args:
+        inline_query (InlineQuery): Входящий inline-запрос.
     """
-    await callback.answer(text='Вы выбрали холодные напитки')
-    await callback.message.edit_text(
-        text='''Домашний лимонад
-Освежающий лимонад с мятой, лимоном и натуральными фруктовыми добавками.
-Объем: 300 мл
-Цена: 150 руб. 
-
-Морс клюквенный
-Классический клюквенный морс, приготовленный из свежих ягод и слегка подслащенный.
-Объем: 250 мл
-Цена: 120 руб. 
-
-Айсти с лимоном
-Холодный черный чай с добавлением свежего лимона и мяты для бодрости.
-Объем: 300 мл
-Цена: 130 руб. 
-
-Апельсиновый фреш
-Свежевыжатый сок из апельсинов для быстрого заряда витаминами и энергией.
-Объем: 200 мл
-Цена: 200 руб. ''',
-        reply_markup=await kb.create_buttons(selected_Холодные_напитки))
-
+    await inline_query.answer(
+        inline_results.get(inline_query.query),
+        cache_time=int(os.getenv('INLINE_CACHE_TIME', '300')),
+        is_personal=False
+    )
 
-@router.callback_query(F.data == 'selected_Горячие_напитки')
-async def hot_drinks(callback: CallbackQuery):
-    """
-    Обработчик выбора раздела 'Горячие напитки'.
 
-    Уведомляет пользователя и отображает меню горячих напитков с описанием и ценами.
-    """
-    await callback.answer(text='Вы выбрали горячие напитки')
-    await callback.message.edit_text(
-        text='''Американо
-Классический черный кофе средней крепости, приготовленный на основе эспрессо.
-Объем: 200 мл
-Цена: 100 руб. 
-
-Капучино
-Кофе с мягким вкусом, покрытый нежной пенкой из взбитого молока.
-Объем: 250 мл
-Цена: 150 руб. 
-
-Чай чёрный/зелёный
-Классический чёрный или зелёный чай, заваренный из натуральных чайных листьев.
-Объем: 300 мл
-Цена: 80 руб. 
-
-Какао с маршмеллоу
-Горячий шоколадный напиток, украшенный мягкими маршмеллоу, для сладкого уюта.
-Объем: 250 мл
-Цена: 180 руб. ''',
-        reply_markup=await kb.create_buttons(selected_Горячие_напитки))
+# Таблица callback-обработчиков подключается к router одним фильтром
+callbacks.attach(router)